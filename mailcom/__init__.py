@@ -3,6 +3,8 @@ from mailcom.main import (
     get_input_handler,
     get_workflow_settings,
     process_data,
+    process_data_pipelined,
+    start_metrics_exporter,
     write_output_data,
 )
 from mailcom.utils import highlight_ne_sent
@@ -16,6 +18,8 @@ __all__ = [
     "get_input_handler",
     "get_workflow_settings",
     "process_data",
+    "process_data_pipelined",
+    "start_metrics_exporter",
     "write_output_data",
     "highlight_ne_sent",
 ]
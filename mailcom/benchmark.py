@@ -0,0 +1,391 @@
+"""End-to-end throughput and scaling benchmarks of the mailcom workflow.
+
+The workflow get_input_handler -> process_data -> write_output_data is run
+on synthetic corpora of increasing size (see corpus_generator), split over
+an increasing number of worker processes. For offline runs, point spacy_model
+and ner_pipeline in the settings file to small local models and use --offline.
+
+With --intra-email-chars, a single giant email is processed instead, with
+an increasing number of intra-email workers (see EmailProcessor), to measure
+the gain of running NER for the sentences of a field in parallel.
+
+Example:
+    python -m mailcom.benchmark --sizes 10 100 --workers 1 2 \\
+        --settings my_settings.json --out results.json \\
+        --baseline previous_results.json --threshold 0.1
+    python -m mailcom.benchmark --intra-email-chars 200000 --workers 1 2 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from mailcom.corpus_generator import CSV_COL_NAMES, CorpusGenerator
+from mailcom.timing import percentile
+from mailcom.trace import read_trace
+
+
+def get_peak_rss_mb() -> float:
+    """Get the peak resident set size of the current process in MB.
+
+    Returns:
+        float: The peak RSS in MB, None if not available on the platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _run_shard(
+    in_path: str, out_path: str, trace_path: str, workflow_settings: dict[str, Any]
+) -> dict[str, Any]:
+    """Run the workflow on one shard of the corpus in a worker process."""
+    from mailcom import main
+
+    start = time.perf_counter()
+    settings = dict(workflow_settings, trace_path=trace_path)
+    inout_hl = main.get_input_handler(in_path, in_type="csv", col_names=CSV_COL_NAMES)
+    main.process_data(inout_hl.get_email_list(), settings)
+    main.write_output_data(inout_hl, out_path, overwrite=True)
+    return {
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def _split_csv(in_path: Path, n_shards: int, out_dir: Path) -> list[Path]:
+    """Split a csv corpus into n_shards csv files of similar size."""
+    with open(in_path, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    header, rows = rows[0], rows[1:]
+    shard_paths = []
+    for shard in range(n_shards):
+        shard_path = out_dir / "shard_{}.csv".format(shard)
+        with open(shard_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows[shard::n_shards])
+        shard_paths.append(shard_path)
+    return shard_paths
+
+
+def run_case(
+    n_emails: int,
+    n_workers: int,
+    workflow_settings: dict[str, Any],
+    work_dir: str,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Run the workflow on a synthetic corpus with a number of worker processes.
+    Each worker processes a shard of the corpus in a fresh process,
+    including the loading of the models.
+
+    Args:
+        n_emails (int): The number of emails in the corpus.
+        n_workers (int): The number of worker processes.
+        workflow_settings (dict[str, Any]): The workflow settings.
+        work_dir (str): Directory for the corpus, outputs and traces.
+        seed (int, optional): The seed of the corpus. Defaults to 0.
+
+    Returns:
+        dict[str, Any]: The throughput in emails per second, the wall time,
+            the per-email latency percentiles and the peak RSS per worker.
+    """
+    case_dir = Path(work_dir) / "n{}_w{}".format(n_emails, n_workers)
+    case_dir.mkdir(parents=True, exist_ok=True)
+    corpus = CorpusGenerator(seed).write_csv(case_dir / "corpus.csv", n_emails)
+    shards = _split_csv(corpus, n_workers, case_dir)
+    traces = [case_dir / "trace_{}.jsonl".format(i) for i in range(n_workers)]
+    outputs = [case_dir / "out_{}.csv".format(i) for i in range(n_workers)]
+
+    start = time.perf_counter()
+    # spawn fresh processes, so that the peak RSS is measured per case
+    with ProcessPoolExecutor(
+        max_workers=n_workers, mp_context=get_context("spawn")
+    ) as pool:
+        futures = [
+            pool.submit(_run_shard, str(s), str(o), str(t), workflow_settings)
+            for s, o, t in zip(shards, outputs, traces)
+        ]
+        shard_results = [future.result() for future in futures]
+    wall = time.perf_counter() - start
+
+    latencies = [
+        record["total_seconds"] for trace in traces for record in read_trace(trace)
+    ]
+    peak_rss = [r["peak_rss_mb"] for r in shard_results if r["peak_rss_mb"]]
+    return {
+        "n_emails": n_emails,
+        "n_workers": n_workers,
+        "wall_seconds": wall,
+        "emails_per_second": n_emails / wall if wall else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "peak_rss_mb": max(peak_rss) if peak_rss else None,
+        "total_peak_rss_mb": sum(peak_rss) if peak_rss else None,
+    }
+
+
+def run_benchmark(
+    sizes: list[int],
+    workers: list[int],
+    workflow_settings: dict[str, Any],
+    work_dir: str = None,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Run all combinations of corpus sizes and worker counts.
+
+    Args:
+        sizes (list[int]): The numbers of emails.
+        workers (list[int]): The numbers of worker processes.
+        workflow_settings (dict[str, Any]): The workflow settings.
+        work_dir (str, optional): Directory for the corpora and outputs.
+            Defaults to None, in which case a temporary directory is used.
+        seed (int, optional): The seed of the corpora. Defaults to 0.
+
+    Returns:
+        dict[str, Any]: The metadata of the run and the results of each case.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_emails in sizes:
+            for n_workers in workers:
+                result = run_case(
+                    n_emails, n_workers, workflow_settings, work_dir or tmp_dir, seed
+                )
+                print(
+                    "{} emails, {} workers: {:.2f} emails/s".format(
+                        n_emails, n_workers, result["emails_per_second"]
+                    )
+                )
+                results.append(result)
+    return {"meta": _get_meta(workflow_settings, seed), "results": results}
+
+
+def _get_meta(workflow_settings: dict[str, Any], seed: int) -> dict[str, Any]:
+    """The metadata of a benchmark run."""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "settings": workflow_settings,
+    }
+
+
+def make_giant_email(n_chars: int, seed: int = 0, language: str = "fr") -> str:
+    """Make the content of a giant email from the bodies of synthetic emails.
+
+    Args:
+        n_chars (int): The minimal length of the content.
+        seed (int, optional): The seed of the emails. Defaults to 0.
+        language (str, optional): The language of the emails. Defaults to "fr".
+
+    Returns:
+        str: The content, of at least n_chars characters.
+    """
+    generator = CorpusGenerator(seed, languages=[language])
+    bodies = []
+    length = 0
+    while length < n_chars:
+        body = generator.generate_email(len(bodies))["content"]
+        bodies.append(body)
+        length += len(body) + 2
+    return "\n\n".join(bodies)
+
+
+def run_intra_email_benchmark(
+    n_chars: int,
+    workers: list[int],
+    workflow_settings: dict[str, Any],
+    seed: int = 0,
+    language: str = "fr",
+) -> dict[str, Any]:
+    """Process the content of a giant email with each number of intra-email
+    workers. The models are loaded and warmed up on a short email first,
+    so that only the processing of the giant email is timed.
+
+    Args:
+        n_chars (int): The minimal length of the content, see make_giant_email.
+        workers (list[int]): The numbers of intra-email workers.
+        workflow_settings (dict[str, Any]): The workflow settings.
+        seed (int, optional): The seed of the email. Defaults to 0.
+        language (str, optional): The language of the email. Defaults to "fr".
+
+    Returns:
+        dict[str, Any]: The metadata of the run and, for each number of
+            workers, the time, the speedup relative to the first number of
+            workers, and whether the output is identical to its output.
+    """
+    from mailcom.main import EmailProcessor
+
+    content = make_giant_email(n_chars, seed, language)
+    results = []
+    reference = None
+    for n_workers in workers:
+        settings = dict(
+            workflow_settings,
+            default_lang=language,
+            pseudo_fields=["content"],
+            intra_email_workers=n_workers,
+            intra_email_min_chars=0,
+        )
+        processor = EmailProcessor(settings)
+        try:
+            processor.process_email({"content": content[:1000]})
+            start = time.perf_counter()
+            email = processor.process_email({"content": content})
+            seconds = time.perf_counter() - start
+        finally:
+            processor.close()
+        output = (email["pseudo_content"], email["ne_list"], email["detected_datetime"])
+        if reference is None:
+            reference = (seconds, output)
+        result = {
+            "n_chars": len(content),
+            "n_workers": n_workers,
+            "seconds": seconds,
+            "speedup": reference[0] / seconds if seconds else 0.0,
+            "identical": output == reference[1],
+        }
+        print(
+            "{} characters, {} intra-email workers: {:.2f} s, {:.2f}x".format(
+                result["n_chars"], n_workers, seconds, result["speedup"]
+            )
+        )
+        results.append(result)
+    return {"meta": _get_meta(workflow_settings, seed), "results": results}
+
+
+def compare_results(
+    current: dict[str, Any], baseline: dict[str, Any], threshold: float = 0.1
+) -> list[str]:
+    """Compare benchmark results against a baseline.
+    A case regresses if its throughput dropped or its latency or peak RSS
+    increased by more than the threshold relative to the baseline.
+
+    Args:
+        current (dict[str, Any]): The current benchmark results.
+        baseline (dict[str, Any]): The baseline benchmark results.
+        threshold (float, optional): The tolerated relative change.
+            Defaults to 0.1.
+
+    Returns:
+        list[str]: Descriptions of the regressions, empty if there are none.
+    """
+    # metric name -> True if higher is better
+    compared = {
+        "emails_per_second": True,
+        "latency_p50": False,
+        "latency_p95": False,
+        "peak_rss_mb": False,
+    }
+    baseline_cases = {
+        (r["n_emails"], r["n_workers"]): r for r in baseline.get("results", [])
+    }
+    regressions = []
+    for result in current.get("results", []):
+        case = (result["n_emails"], result["n_workers"])
+        base = baseline_cases.get(case)
+        if base is None:
+            continue
+        for metric, higher_is_better in compared.items():
+            new, old = result.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or (
+                not higher_is_better and change > threshold
+            ):
+                regressions.append(
+                    "{} emails, {} workers: {} changed by {:+.1%} "
+                    "({:.4g} -> {:.4g})".format(
+                        case[0], case[1], metric, change, old, new
+                    )
+                )
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="End-to-end throughput benchmark of the mailcom workflow."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--settings", default="default", help="Settings file.")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="Results to compare to.")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument(
+        "--intra-email-chars",
+        type=int,
+        default=None,
+        help="Process one email of this length with each number of "
+        "intra-email workers instead.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Do not download models from the Hugging Face hub.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    from mailcom.main import get_workflow_settings
+
+    workflow_settings = get_workflow_settings(
+        args.settings, save_updated_settings=False
+    )
+    if args.intra_email_chars:
+        results = run_intra_email_benchmark(
+            args.intra_email_chars, args.workers, workflow_settings, args.seed
+        )
+    else:
+        results = run_benchmark(
+            args.sizes, args.workers, workflow_settings, args.work_dir, args.seed
+        )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print("The benchmark results have been saved to {}".format(args.out))
+
+    if args.intra_email_chars:
+        # the output must not depend on the number of workers
+        return 0 if all(r["identical"] for r in results["results"]) else 1
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression: {}".format(regression))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
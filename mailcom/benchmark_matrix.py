@@ -0,0 +1,365 @@
+"""Speed-versus-accuracy benchmark matrix of the detection backends.
+
+A labelled corpus is run through every combination of the configured
+settings, e.g. the language detection library, the time parsing mode and
+the NER pipeline. For each combination the throughput, the latency and the
+accuracy (language accuracy, date F1, entity F1) are reported in one table,
+so that the cheapest configuration meeting a quality bar can be chosen.
+
+Example:
+    python -m mailcom.benchmark_matrix --n-emails 200 --matrix matrix.json \\
+        --min-lang-accuracy 0.95 --min-entity-f1 0.8 --out matrix_results.json
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from mailcom.corpus_generator import CorpusGenerator
+from mailcom.main import get_workflow_settings, process_data
+from mailcom.timing import percentile
+from mailcom.trace import read_trace
+
+# settings key -> values to combine
+DEFAULT_MATRIX = {
+    "lang_detection_lib": ["langid", "langdetect", "trans"],
+    "time_parsing": ["strict", "non-strict"],
+    "ner_pipeline": [None],
+}
+
+# fields of the emails passed to the workflow, the other keys are labels
+_EMAIL_FIELDS = ["file_name", "content", "date", "attachment", "attachment type"]
+
+COLUMNS = [
+    "configuration",
+    "emails_per_second",
+    "latency_p50",
+    "latency_p95",
+    "lang_accuracy",
+    "date_f1",
+    "entity_f1",
+]
+
+
+def get_configurations(matrix: dict[str, list]) -> list[dict[str, Any]]:
+    """Get all combinations of the settings values of the matrix.
+
+    Args:
+        matrix (dict[str, list]): The values of each settings key.
+
+    Returns:
+        list[dict[str, Any]]: The settings of each combination.
+    """
+    keys = list(matrix)
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*(matrix[key] for key in keys))
+    ]
+
+
+def describe(config: dict[str, Any]) -> str:
+    """Get a short description of a configuration for the table.
+
+    Args:
+        config (dict[str, Any]): The settings of the configuration.
+
+    Returns:
+        str: The values of the settings separated by "/", the model name
+            for pipelines.
+    """
+    parts = []
+    for value in config.values():
+        if isinstance(value, dict):
+            value = value.get("model", "custom")
+        parts.append("default" if value is None else str(value))
+    return "/".join(parts)
+
+
+def f1_score(predicted: list, expected: list) -> dict[str, float]:
+    """Get precision, recall and F1 of predicted against expected items,
+    counting repeated items as often as they occur.
+
+    Args:
+        predicted (list): The predicted items.
+        expected (list): The expected items.
+
+    Returns:
+        dict[str, float]: The number of true positives ("tp"), predicted
+            and expected items, and the precision, recall and F1.
+    """
+    tp = sum((Counter(predicted) & Counter(expected)).values())
+    precision = tp / len(predicted) if predicted else float(not expected)
+    recall = tp / len(expected) if expected else float(not predicted)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "tp": tp,
+        "predicted": len(predicted),
+        "expected": len(expected),
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+    }
+
+
+def evaluate(
+    processed: list[dict[str, Any]],
+    labelled: list[dict[str, Any]],
+    field: str = "content",
+) -> dict[str, float]:
+    """Evaluate the processed emails against the labels of the corpus.
+    Dates and entities are micro-averaged over all emails.
+
+    Args:
+        processed (list[dict[str, Any]]): The emails after process_data.
+        labelled (list[dict[str, Any]]): The labelled emails in the same order,
+            with "language" and "labels", see CorpusGenerator.generate_email.
+        field (str, optional): The evaluated field. Defaults to "content".
+
+    Returns:
+        dict[str, float]: The language accuracy, and precision, recall
+            and F1 of the dates and entities.
+    """
+    correct_lang = 0
+    dates = ([], [])
+    entities = ([], [])
+    for idx, (email, labels) in enumerate(zip(processed, labelled)):
+        correct_lang += email.get("lang", {}).get(field) == labels["language"]
+        # tag the items with the email index, so that only matches
+        # within the same email are counted
+        dates[0].extend(
+            (idx, d) for d in (email.get("detected_datetime", {}).get(field) or [])
+        )
+        dates[1].extend((idx, d) for d in labels["labels"]["dates"])
+        entities[0].extend(
+            (idx, ne["entity_group"], ne["word"])
+            for ne in email.get("ne_list", {}).get(field, [])
+        )
+        entities[1].extend((idx, *ne) for ne in labels["labels"]["entities"])
+
+    date_scores = f1_score(*dates)
+    entity_scores = f1_score(*entities)
+    return {
+        "lang_accuracy": correct_lang / len(labelled) if labelled else 0.0,
+        "date_precision": date_scores["precision"],
+        "date_recall": date_scores["recall"],
+        "date_f1": date_scores["f1"],
+        "entity_precision": entity_scores["precision"],
+        "entity_recall": entity_scores["recall"],
+        "entity_f1": entity_scores["f1"],
+    }
+
+
+def run_configuration(
+    labelled: list[dict[str, Any]],
+    config: dict[str, Any],
+    base_settings: dict[str, Any],
+    trace_path: str,
+) -> dict[str, Any]:
+    """Run the labelled corpus through the workflow with one configuration.
+
+    The first email is a warm-up, as the models are loaded lazily while
+    processing it. Its latency is reported as "warmup_seconds" and
+    excluded from the throughput and the latency percentiles.
+
+    Args:
+        labelled (list[dict[str, Any]]): The labelled emails.
+        config (dict[str, Any]): The settings of the configuration.
+        base_settings (dict[str, Any]): The settings shared by all
+            configurations.
+        trace_path (str): The path of the trace of the run.
+
+    Returns:
+        dict[str, Any]: The configuration, its throughput, latency and accuracy.
+    """
+    settings = {
+        **base_settings,
+        **config,
+        # the language is always detected to measure its accuracy
+        "default_lang": "",
+        "pseudo_fields": ["content"],
+        "trace_path": str(trace_path),
+    }
+    emails = [
+        {key: copy.deepcopy(email[key]) for key in _EMAIL_FIELDS if key in email}
+        for email in labelled
+    ]
+    start = time.perf_counter()
+    process_data(iter(emails), settings)
+    wall = time.perf_counter() - start
+
+    latencies = [record["total_seconds"] for record in read_trace(trace_path)]
+    warm = latencies[1:]
+    return {
+        "configuration": describe(config),
+        "settings": config,
+        "n_emails": len(emails),
+        "wall_seconds": wall,
+        "warmup_seconds": latencies[0] if latencies else 0.0,
+        "emails_per_second": len(warm) / sum(warm) if sum(warm) else 0.0,
+        "latency_p50": percentile(warm, 50),
+        "latency_p95": percentile(warm, 95),
+        **evaluate(emails, labelled),
+    }
+
+
+def run_matrix(
+    labelled: list[dict[str, Any]],
+    matrix: dict[str, list] = None,
+    base_settings: dict[str, Any] = None,
+) -> list[dict[str, Any]]:
+    """Run the labelled corpus through every configuration of the matrix.
+    Configurations that fail, e.g. because a model is not available,
+    are reported with their error instead of stopping the benchmark.
+
+    Args:
+        labelled (list[dict[str, Any]]): The labelled emails,
+            see CorpusGenerator.generate_email.
+        matrix (dict[str, list], optional): The values of each settings key.
+            Defaults to DEFAULT_MATRIX.
+        base_settings (dict[str, Any], optional): The settings shared by all
+            configurations. Defaults to None.
+
+    Returns:
+        list[dict[str, Any]]: The results of each configuration.
+    """
+    matrix = matrix if matrix else DEFAULT_MATRIX
+    base_settings = base_settings if base_settings else {}
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, config in enumerate(get_configurations(matrix)):
+            print("Running configuration {}".format(describe(config)))
+            trace_path = Path(tmp_dir) / "trace_{}.jsonl".format(i)
+            try:
+                row = run_configuration(labelled, config, base_settings, trace_path)
+            except Exception as e:
+                print("Configuration {} failed: {}".format(describe(config), e))
+                row = {"configuration": describe(config), "settings": config}
+                row["error"] = str(e)
+            rows.append(row)
+    return rows
+
+
+def select_cheapest(
+    rows: list[dict[str, Any]],
+    min_lang_accuracy: float = 0.0,
+    min_date_f1: float = 0.0,
+    min_entity_f1: float = 0.0,
+) -> dict[str, Any]:
+    """Select the fastest configuration meeting the quality bar.
+
+    Args:
+        rows (list[dict[str, Any]]): The results of run_matrix.
+        min_lang_accuracy (float, optional): The minimal language accuracy.
+            Defaults to 0.0.
+        min_date_f1 (float, optional): The minimal date F1. Defaults to 0.0.
+        min_entity_f1 (float, optional): The minimal entity F1. Defaults to 0.0.
+
+    Returns:
+        dict[str, Any]: The result of the selected configuration,
+            None if no configuration meets the quality bar.
+    """
+    candidates = [
+        row
+        for row in rows
+        if "error" not in row
+        and row["lang_accuracy"] >= min_lang_accuracy
+        and row["date_f1"] >= min_date_f1
+        and row["entity_f1"] >= min_entity_f1
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda row: row["emails_per_second"])
+
+
+def format_table(rows: list[dict[str, Any]], columns: list[str] = None) -> str:
+    """Format the results as a text table.
+
+    Args:
+        rows (list[dict[str, Any]]): The results of run_matrix.
+        columns (list[str], optional): The columns of the table.
+            Defaults to COLUMNS.
+
+    Returns:
+        str: The table, one configuration per line.
+    """
+    columns = columns if columns else COLUMNS
+
+    def cell(row, column):
+        value = row.get(column, "")
+        return "{:.4g}".format(value) if isinstance(value, float) else str(value)
+
+    cells = []
+    for row in rows:
+        if "error" in row:
+            # failed configurations only show their error
+            cells.append([row["configuration"], "error: " + row["error"]])
+            cells[-1] += [""] * (len(columns) - 2)
+        else:
+            cells.append([cell(row, column) for column in columns])
+    widths = [
+        max([len(column)] + [len(line[i]) for line in cells])
+        for i, column in enumerate(columns)
+    ]
+    lines = [
+        "  ".join(text.ljust(width) for text, width in zip(line, widths)).rstrip()
+        for line in [columns] + cells
+    ]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Speed-versus-accuracy matrix of the mailcom detection backends."
+    )
+    parser.add_argument("--n-emails", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--languages", nargs="+", default=None)
+    parser.add_argument(
+        "--matrix", default=None, help="JSON file with the values of each setting."
+    )
+    parser.add_argument("--settings", default="default", help="Settings file.")
+    parser.add_argument("--out", default=None, help="JSON file for the results.")
+    parser.add_argument("--min-lang-accuracy", type=float, default=0.0)
+    parser.add_argument("--min-date-f1", type=float, default=0.0)
+    parser.add_argument("--min-entity-f1", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    matrix = None
+    if args.matrix:
+        with open(args.matrix, "r", encoding="utf-8") as f:
+            matrix = json.load(f)
+    base_settings = get_workflow_settings(args.settings, save_updated_settings=False)
+    generator = CorpusGenerator(args.seed, args.languages)
+    labelled = [generator.generate_email(i) for i in range(args.n_emails)]
+
+    rows = run_matrix(labelled, matrix, base_settings)
+    print(format_table(rows))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=4, ensure_ascii=False)
+        print("The benchmark results have been saved to {}".format(args.out))
+
+    best = select_cheapest(
+        rows, args.min_lang_accuracy, args.min_date_f1, args.min_entity_f1
+    )
+    if best is None:
+        print("No configuration meets the quality bar.")
+        return 1
+    print(
+        "Cheapest configuration meeting the quality bar: {}".format(
+            best["configuration"]
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
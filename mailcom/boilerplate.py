@@ -0,0 +1,125 @@
+import threading
+from collections import Counter
+from typing import Any
+
+from mailcom import metrics
+from mailcom.cache import text_key
+
+
+def _get_lines(content: str) -> list[str]:
+    # quote markers are removed, see utils.split_quoted
+    lines = [line.lstrip("> ") for line in content.split("\n")]
+    return [line for line in lines if line]
+
+
+class BoilerplateIndex:
+    """Index of the line n-grams of a corpus, to recognise boilerplate like
+    signatures and confidentiality notices. A sequence of n_lines lines is
+    boilerplate once it occurs in at least min_count texts. The lines are
+    compared with normalised whitespace and without quote markers.
+
+    The texts are indexed with add, either in a first pass over the corpus
+    or incrementally while processing, in which case the boilerplate is
+    only recognised after min_count occurrences.
+
+    Args:
+        n_lines (int, optional): The number of lines of the n-grams.
+            Defaults to 2.
+        min_count (int, optional): The minimal number of texts containing
+            an n-gram for it to be boilerplate. Defaults to 5.
+        max_size (int, optional): The maximal number of counted n-grams.
+            When it is exceeded, the n-grams with the lowest counts are
+            dropped, down to half of max_size. Defaults to 100000.
+    """
+
+    def __init__(self, n_lines: int = 2, min_count: int = 5, max_size: int = 100000):
+        if n_lines < 1 or min_count < 1:
+            raise ValueError(
+                "The n-gram length and the minimal count must be positive."
+            )
+        self.n_lines = n_lines
+        self.min_count = min_count
+        self.max_size = max_size
+        self.n_texts = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _get_ngrams(self, lines: list[str]) -> list[str]:
+        return [
+            text_key("\n".join(lines[i : i + self.n_lines]))  # noqa
+            for i in range(len(lines) - self.n_lines + 1)
+        ]
+
+    def add(self, content: str):
+        """Count the n-grams of a text, once per text.
+
+        Args:
+            content (str): The cleaned up text, see utils.clean_up_content.
+        """
+        ngrams = set(self._get_ngrams(_get_lines(content)))
+        with self._lock:
+            self._counts.update(ngrams)
+            self.n_texts += 1
+            if len(self._counts) > self.max_size:
+                # keep half of the budget, so that the index is rebuilt
+                # at most once every max_size // 2 new n-grams
+                self._counts = Counter(
+                    dict(self._counts.most_common(self.max_size // 2))
+                )
+
+    def is_boilerplate(self, lines: list[str]) -> list[bool]:
+        """Check which lines are part of a frequent n-gram.
+
+        Args:
+            lines (list[str]): The lines of a text.
+
+        Returns:
+            list[bool]: For each line, whether it is boilerplate.
+        """
+        flags = [False] * len(lines)
+        with self._lock:
+            frequent = [
+                self._counts[key] >= self.min_count for key in self._get_ngrams(lines)
+            ]
+        for i, is_frequent in enumerate(frequent):
+            if is_frequent:
+                flags[i : i + self.n_lines] = [True] * self.n_lines  # noqa
+        return flags
+
+    def split(self, content: str) -> list[tuple[str, bool]]:
+        """Split a text into boilerplate blocks and the text between them.
+
+        Args:
+            content (str): The text, e.g. a segment of utils.split_quoted.
+
+        Returns:
+            list[tuple[str, bool]]: The segments, with their lines separated
+                by newlines, and whether they are boilerplate.
+        """
+        lines = _get_lines(content)
+        segments = []
+        for line, flag in zip(lines, self.is_boilerplate(lines)):
+            if segments and segments[-1][1] == flag:
+                segments[-1][0].append(line)
+            else:
+                segments.append(([line], flag))
+        n_boilerplate = sum(flag for _, flag in segments)
+        if n_boilerplate:
+            metrics.inc("boilerplate_segments", n_boilerplate)
+        return [("\n".join(block), flag) for block, flag in segments]
+
+    def stats(self) -> dict[str, Any]:
+        """Get the statistics of the index.
+
+        Returns:
+            dict[str, Any]: The number of indexed texts, of counted n-grams
+                and of boilerplate n-grams.
+        """
+        with self._lock:
+            return {
+                "texts": self.n_texts,
+                "ngrams": len(self._counts),
+                "boilerplate_ngrams": sum(
+                    count >= self.min_count for count in self._counts.values()
+                ),
+            }
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from mailcom import metrics
+
+
+def text_key(text: str, *parts: str, normalise: bool = True) -> str:
+    """Get the cache key of a text. The text is normalised by collapsing
+    whitespace, so that e.g. signatures with different line breaks or
+    indentation share a key, and hashed to keep the keys short.
+
+    Args:
+        text (str): The text.
+        *parts (str): Further parts of the key, e.g. the backend
+            that produced the cached result.
+        normalise (bool, optional): Whether to normalise the whitespace.
+            Disable it for results with character offsets into the text.
+            Defaults to True.
+
+    Returns:
+        str: The key, the parts and the hash of the text separated by "|".
+    """
+    normalised = " ".join(text.split()) if normalise else text
+    digest = hashlib.blake2b(normalised.encode("utf-8"), digest_size=16).hexdigest()
+    return "|".join([*parts, digest])
+
+
+class LRUCache:
+    """Thread-safe cache with a bounded number of entries. When the cache
+    is full, the least recently used entry is dropped.
+
+    The hits and misses are counted in the metrics registry as "cache_hits"
+    and "cache_misses" with the name of the cache as label, so that the
+    hit rate is part of the exported metrics.
+
+    With a spill file, the entries dropped from memory are moved to an
+    SQLite database, from which they are loaded back on a miss in memory.
+    The values are stored as JSON, so numpy numbers become Python numbers.
+
+    Args:
+        max_size (int, optional): The maximal number of entries.
+            Defaults to 10000.
+        path (str, optional): JSON file to persist the entries in. The entries
+            are loaded from it if it exists and written to it by save.
+            Defaults to None, in which case the cache is only kept in memory.
+        name (str, optional): The name of the cache in the metrics.
+            Defaults to "cache".
+        spill_path (str, optional): SQLite file for the entries dropped
+            from memory. It is kept between runs, see close.
+            Defaults to None, in which case the dropped entries are lost.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        path: str = None,
+        name: str = "cache",
+        spill_path: str = None,
+    ):
+        if max_size < 1:
+            raise ValueError("The size of the cache must be at least 1.")
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill = None
+        if spill_path:
+            Path(spill_path).parent.mkdir(parents=True, exist_ok=True)
+            # the lock serializes the access from several threads
+            self._spill = sqlite3.connect(str(spill_path), check_same_thread=False)
+            self._spill.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT)"
+            )
+        if self.path is not None and self.path.is_file():
+            self.load(self.path)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get the cached value of a key and mark it as recently used.
+
+        Args:
+            key (str): The key.
+            default (Any, optional): The value returned for a missing key.
+                Defaults to None.
+
+        Returns:
+            Any: The cached value, default if the key is not cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+                hit = True
+            else:
+                value = self._get_spilled(key)
+                hit = value is not None
+                if hit:
+                    self._put(key, value)
+                else:
+                    value = default
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.inc(
+            "cache_hits" if hit else "cache_misses", labels={"cache": self.name}
+        )
+        return value
+
+    def put(self, key: str, value: Any):
+        """Cache a value, dropping the least recently used entry if needed.
+
+        Args:
+            key (str): The key.
+            value (Any): The value, which must be serializable to JSON
+                if the cache is persisted.
+        """
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            dropped = self._entries.popitem(last=False)
+            if self._spill is not None:
+                self._spill_entries([dropped])
+
+    def _spill_entries(self, entries: list[tuple[str, Any]]):
+        self._spill.executemany(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?)",
+            [(key, json.dumps(value, default=float)) for key, value in entries],
+        )
+        self._spill.commit()
+
+    def _get_spilled(self, key: str) -> Any:
+        if self._spill is None:
+            return None
+        row = self._spill.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries or self._get_spilled(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Drop all entries, also the spilled ones, and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            if self._spill is not None:
+                self._spill.execute("DELETE FROM entries")
+                self._spill.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """Move the entries in memory to the spill file and close it,
+        so that they are available in the next run. Without spill file,
+        nothing is done."""
+        with self._lock:
+            if self._spill is None:
+                return
+            self._spill_entries(list(self._entries.items()))
+            self._spill.close()
+            self._spill = None
+
+    def stats(self) -> dict[str, Any]:
+        """Get the statistics of the cache.
+
+        Returns:
+            dict[str, Any]: The number of entries, hits and misses
+                and the hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def save(self, path: str = None):
+        """Write the entries to a JSON file, from least to most recently used.
+
+        Args:
+            path (str, optional): The file. Defaults to the path of the cache.
+        """
+        path = Path(path) if path else self.path
+        if path is None:
+            raise ValueError("No path is given to save the cache to.")
+        with self._lock:
+            entries = [[key, value] for key, value in self._entries.items()]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+
+    def load(self, path: str):
+        """Add the entries of a JSON file written by save.
+
+        Args:
+            path (str): The file.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)["entries"]
+        for key, value in entries:
+            self.put(key, value)
@@ -0,0 +1,613 @@
+"""Generate synthetic multilingual email corpora for load testing.
+
+The emails contain names, email addresses, numbers and dates in the formats
+targeted by TimeDetector.patterns, and optionally quoted reply chains,
+HTML bodies and attachments. The corpus is deterministic for a given seed,
+and each email only depends on the seed and its index, so that large
+corpora can be generated in shards.
+
+Example:
+    python -m mailcom.corpus_generator out_dir --n-emails 10000 --format eml
+"""
+
+import argparse
+import csv
+import html
+import math
+import random
+import sys
+import unicodedata
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Any
+
+LANGUAGES = ["fr", "es", "de", "pt", "en"]
+
+# columns of the csv files, as in data/in/sample_data.csv
+CSV_COLUMNS = [
+    "file_name",
+    "message",
+    "date",
+    "attachment",
+    "attachement_type",
+    "subject",
+    "language",
+]
+# col_names of get_input_handler mapping the csv columns to the email fields
+CSV_COL_NAMES = ["message", "date", "attachment", "attachement_type", "subject"]
+
+DEFAULT_OPTIONS = {
+    # mean number of sentences of the body, lognormally distributed
+    "mean_sentences": 6,
+    "sigma_sentences": 0.6,
+    # share of the emails with an HTML body
+    "html_share": 0.2,
+    # share of the emails with attachments, and their maximal number
+    "attachment_share": 0.3,
+    "max_attachments": 3,
+    # probability of a sentence to contain each kind of entity
+    "name_density": 0.4,
+    "email_density": 0.1,
+    "number_density": 0.15,
+    "date_density": 0.25,
+    # share of the emails with a quoted reply chain, and its maximal depth
+    "reply_share": 0.3,
+    "max_reply_depth": 3,
+}
+
+_ATTACHMENT_TYPES = {
+    "pdf": ("application", "pdf"),
+    "jpg": ("image", "jpeg"),
+    "png": ("image", "png"),
+    "docx": (
+        "application",
+        "vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ),
+    "txt": ("text", "plain"),
+}
+
+_VOCAB = {
+    "fr": {
+        "names": ["Marie", "Thomas", "Sophie", "Luc", "Julie", "Camille", "Pierre"],
+        "cities": ["Paris", "Lyon", "Marseille", "Nice", "Bordeaux"],
+        "months": [
+            "janvier", "février", "mars", "avril", "mai", "juin", "juillet",
+            "août", "septembre", "octobre", "novembre", "décembre",
+        ],  # fmt: skip
+        "greeting": "Bonjour {name},",
+        "closing": "Cordialement,\n{name}",
+        "reply_header": "Le {date}, {name} <{email}> a écrit :",
+        "subjects": ["Réunion", "Nouvelles de moi", "Facture", "Question rapide"],
+        "plain": [
+            "J'espère que vous allez bien.",
+            "Merci pour votre retour rapide.",
+            "Je reste à votre disposition pour toute question.",
+            "Pouvez-vous confirmer la réception de ce message ?",
+        ],
+        "name": [
+            "{name} est partie à {city} pour commencer son nouveau travail.",
+            "J'ai parlé avec {name} hier soir.",
+            "{name} et {name2} ont visité le musée à {city}.",
+        ],
+        "email": [
+            "Ma nouvelle adresse e-mail est {email}.",
+            "Vous pouvez écrire à {email} pour plus d'informations.",
+        ],
+        "number": [
+            "Mon numéro est le {phone}.",
+            "La facture numéro {number} est en pièce jointe.",
+        ],
+        "date": [
+            "La réunion aura lieu le {date}.",
+            "{name} est né à {city} le {date}.",
+            "Le colis est arrivé le {date}.",
+        ],
+    },
+    "es": {
+        "names": ["Carlos", "Lucía", "Pedro", "Ana", "Diego", "María", "Sergio"],
+        "cities": ["Madrid", "Barcelona", "Sevilla", "Valencia", "Bilbao"],
+        "months": [
+            "enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+            "agosto", "septiembre", "octubre", "noviembre", "diciembre",
+        ],  # fmt: skip
+        "weekdays": ["lun.", "mar.", "mié.", "jue.", "vie.", "sáb.", "dom."],
+        "greeting": "Hola {name},",
+        "closing": "Saludos,\n{name}",
+        "reply_header": "El {date}, {name} <{email}> escribió:",
+        "subjects": ["Reunión", "Noticias de mí", "Factura", "Pregunta"],
+        "plain": [
+            "Espero que estés bien.",
+            "Gracias por tu respuesta.",
+            "Compruébelo en el archivo adjunto.",
+            "Quedo a tu disposición para cualquier duda.",
+        ],
+        "name": [
+            "{name} viajó a {city} para asistir a una conferencia.",
+            "{name} y {name2} fueron a {city} para celebrar su aniversario.",
+            "Hablé con {name} esta mañana.",
+        ],
+        "email": [
+            "Mi nueva dirección de correo electrónico es {email}.",
+            "Escribe a {email} si tienes preguntas.",
+        ],
+        "number": [
+            "Mi número de teléfono es {phone}.",
+            "La factura número {number} está pendiente.",
+        ],
+        "date": [
+            "La foto fue tomada el {date}.",
+            "La reunión es el {date}.",
+            "{name} empezó a trabajar en {city} el {date}.",
+        ],
+    },
+    "de": {
+        "names": ["Jürgen", "Anna", "Lukas", "Sabine", "Felix", "Mika", "Lena"],
+        "cities": ["Berlin", "Hamburg", "München", "Köln", "Heidelberg"],
+        "months": [
+            "Januar", "Februar", "März", "April", "Mai", "Juni", "Juli",
+            "August", "September", "Oktober", "November", "Dezember",
+        ],  # fmt: skip
+        "greeting": "Liebe {name},",
+        "closing": "Viele Grüße,\n{name}",
+        "reply_header": "Am {date} schrieb {name} <{email}>:",
+        "subjects": ["Treffen", "Neuigkeiten", "Rechnung", "Kurze Frage"],
+        "plain": [
+            "Ich hoffe, es geht dir gut.",
+            "Vielen Dank für deine schnelle Antwort.",
+            "Bei Fragen melde dich gerne.",
+            "Bitte bestätige den Empfang dieser Nachricht.",
+        ],
+        "name": [
+            "{name} ist nach {city} gezogen.",
+            "{name} und {name2} haben das Museum in {city} besucht.",
+            "Ich habe gestern mit {name} gesprochen.",
+        ],
+        "email": [
+            "Meine neue E-Mail-Adresse ist {email}.",
+            "Schreib bitte an {email}.",
+        ],
+        "number": [
+            "Meine Telefonnummer ist {phone}.",
+            "Die Rechnung Nummer {number} ist im Anhang.",
+        ],
+        "date": [
+            "Das Treffen findet am {date} statt.",
+            "{name} wurde am {date} in {city} geboren.",
+            "Das Paket kam am {date} an.",
+        ],
+    },
+    "pt": {
+        "names": ["João", "Camila", "Rafael", "Beatriz", "Lucas", "Fernanda"],
+        "cities": ["Lisboa", "Porto", "São Paulo", "Recife", "Brasília"],
+        "months": [
+            "janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+            "agosto", "setembro", "outubro", "novembro", "dezembro",
+        ],  # fmt: skip
+        "greeting": "Olá {name},",
+        "closing": "Atenciosamente,\n{name}",
+        "reply_header": "Em {date}, {name} <{email}> escreveu:",
+        "subjects": ["Reunião", "Notícias de mim", "Fatura", "Pergunta rápida"],
+        "plain": [
+            "Espero que esteja tudo bem.",
+            "Obrigado pela resposta rápida.",
+            "Fico à disposição para qualquer dúvida.",
+            "Pode confirmar o recebimento desta mensagem?",
+        ],
+        "name": [
+            "{name} viajou para {city} ontem.",
+            "{name} e {name2} se conheceram em {city}.",
+            "Falei com {name} hoje de manhã.",
+        ],
+        "email": [
+            "Meu novo endereço de e-mail é {email}.",
+            "Escreva para {email} se tiver dúvidas.",
+        ],
+        "number": [
+            "Meu telefone é {phone}.",
+            "A fatura número {number} foi enviada.",
+        ],
+        "date": [
+            "A reunião será no dia {date}.",
+            "{name} nasceu em {city} no dia {date}.",
+            "O pacote chegou em {date}.",
+        ],
+    },
+    "en": {
+        "names": ["Emily", "James", "Olivia", "Henry", "Grace", "Jack", "Alice"],
+        "cities": ["London", "New York", "Dublin", "Boston", "Sydney"],
+        "months": [
+            "January", "February", "March", "April", "May", "June", "July",
+            "August", "September", "October", "November", "December",
+        ],  # fmt: skip
+        "greeting": "Dear {name},",
+        "closing": "Best regards,\n{name}",
+        "reply_header": "On {date}, {name} <{email}> wrote:",
+        "subjects": ["Meeting", "News from me", "Invoice", "Quick question"],
+        "plain": [
+            "I hope you are doing well.",
+            "Thank you for your quick reply.",
+            "Let me know if you have any questions.",
+            "Could you confirm that you received this message?",
+        ],
+        "name": [
+            "{name} moved to {city} last year.",
+            "{name} and {name2} visited the museum in {city}.",
+            "I talked to {name} yesterday.",
+        ],
+        "email": [
+            "My new email address is {email}.",
+            "Please write to {email} for more information.",
+        ],
+        "number": [
+            "My phone number is {phone}.",
+            "The invoice number {number} is attached.",
+        ],
+        "date": [
+            "The meeting takes place on {date}.",
+            "{name} was born in {city} on {date}.",
+            "The parcel arrived on {date}.",
+        ],
+    },
+}
+
+
+def _ordinal(day: int) -> str:
+    if 11 <= day % 100 <= 13:
+        return "{}th".format(day)
+    return "{}{}".format(day, {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th"))
+
+
+def format_date(dt: datetime, lang: str, style: int) -> str:
+    """Format a date in one of the formats of a language that are
+    targeted by the patterns of TimeDetector.
+
+    Args:
+        dt (datetime): The date.
+        lang (str): The language, one of LANGUAGES.
+        style (int): The index of the format, taken modulo the number
+            of formats of the language.
+
+    Returns:
+        str: The formatted date.
+    """
+    month = _VOCAB[lang]["months"][dt.month - 1]
+    numeric = [
+        dt.strftime("%d.%m.%Y"),  # 17.04.2024
+        dt.strftime("%d/%m/%Y"),  # 17/04/2024
+        dt.strftime("%Y-%m-%d"),  # 2024-04-17
+    ]
+    styles = {
+        "fr": [
+            "{} {} {}".format(dt.day, month, dt.year),  # 14 mars 2025
+            "{} {} {} à {}".format(dt.day, month, dt.year, dt.strftime("%H:%M")),
+        ],
+        "es": [
+            "{} {}. {}".format(dt.day, month[:3], dt.year),  # 17 abr. 2024
+            "{}, {} {}. {}".format(  # mié., 17 abr. 2024
+                _VOCAB["es"]["weekdays"][dt.weekday()], dt.day, month[:3], dt.year
+            ),
+            "{} a las {}".format(dt.strftime("%d.%m.%Y"), dt.strftime("%H:%M")),
+        ],
+        "de": [
+            "{}. {} {}".format(dt.day, month, dt.year),  # 17. April 2024
+            "{}. {} {} um {}".format(dt.day, month, dt.year, dt.strftime("%H:%M")),
+        ],
+        "pt": [
+            "{} {} {}".format(dt.day, month, dt.year),
+        ],
+        "en": [
+            "{} {} {}".format(month, _ordinal(dt.day), dt.year),  # April 17th 2024
+            "{} {} {}".format(dt.day, month, dt.year),
+            "{} at {}".format(dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M")),
+        ],
+    }
+    formats = styles[lang] + numeric
+    return formats[style % len(formats)]
+
+
+def _ascii(text: str) -> str:
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in normalized if c.isascii() and c.isalnum())
+
+
+class CorpusGenerator:
+    """Generate synthetic emails in several languages.
+
+    Args:
+        seed (int, optional): The seed of the corpus. Defaults to 0.
+        languages (list[str], optional): The languages of the emails,
+            chosen uniformly. Defaults to all of LANGUAGES.
+        **options: Options overriding DEFAULT_OPTIONS, e.g. html_share=0.5.
+    """
+
+    def __init__(self, seed: int = 0, languages: list[str] = None, **options):
+        self.seed = seed
+        self.languages = languages if languages else LANGUAGES
+        unknown = [lang for lang in self.languages if lang not in _VOCAB]
+        if unknown:
+            raise ValueError("Unsupported languages: {}".format(", ".join(unknown)))
+        unknown = [key for key in options if key not in DEFAULT_OPTIONS]
+        if unknown:
+            raise ValueError("Unknown options: {}".format(", ".join(unknown)))
+        self.options = {**DEFAULT_OPTIONS, **options}
+
+    def _rng(self, idx: int) -> random.Random:
+        # each email only depends on the seed and its index
+        return random.Random("{}-{}".format(self.seed, idx))
+
+    def _person(self, rng: random.Random, vocab: dict) -> tuple[str, str]:
+        name = rng.choice(vocab["names"])
+        domain = rng.choice(["example.org", "example.com", "mail.example.net"])
+        return name, "{}.{}@{}".format(_ascii(name).lower(), rng.randint(1, 99), domain)
+
+    def _date(self, rng: random.Random) -> datetime:
+        start = datetime(2015, 1, 1)
+        return start + timedelta(minutes=rng.randint(0, 10 * 365 * 24 * 60))
+
+    def _sentence(self, rng: random.Random, lang: str, labels: dict) -> str:
+        vocab = _VOCAB[lang]
+        kinds = ["name", "email", "number", "date"]
+        weights = [self.options["{}_density".format(kind)] for kind in kinds]
+        weights.append(max(0.0, 1 - sum(weights)))
+        kind = rng.choices(kinds + ["plain"], weights=weights)[0]
+        name, email = self._person(rng, vocab)
+        template = rng.choice(vocab[kind])
+        values = {
+            "name": name,
+            "name2": rng.choice(vocab["names"]),
+            "city": rng.choice(vocab["cities"]),
+            "email": email,
+            "phone": "0{} {:02d} {:02d} {:02d} {:02d}".format(
+                rng.randint(1, 9), *(rng.randint(0, 99) for _ in range(4))
+            ),
+            "number": rng.randint(100, 99999),
+            "date": format_date(self._date(rng), lang, rng.randint(0, 10)),
+        }
+        # record the labels in the order of the placeholders in the template
+        for placeholder in sorted(
+            ("name", "name2", "city", "date"),
+            key=lambda key: template.find("{" + key + "}"),
+        ):
+            if "{" + placeholder + "}" not in template:
+                continue
+            if placeholder == "date":
+                labels["dates"].append(values["date"])
+            else:
+                group = "LOC" if placeholder == "city" else "PER"
+                labels["entities"].append((group, values[placeholder]))
+        return template.format(**values)
+
+    def _body(self, rng: random.Random, lang: str, labels: dict) -> str:
+        vocab = _VOCAB[lang]
+        sigma = self.options["sigma_sentences"]
+        mu = math.log(self.options["mean_sentences"]) - sigma**2 / 2
+        n_sentences = max(1, round(rng.lognormvariate(mu, sigma)))
+        sender, _ = self._person(rng, vocab)
+        recipient = rng.choice(vocab["names"])
+        labels["entities"].append(("PER", recipient))
+        lines = [vocab["greeting"].format(name=recipient)]
+        lines += [self._sentence(rng, lang, labels) for _ in range(n_sentences)]
+        lines.append(vocab["closing"].format(name=sender))
+        labels["entities"].append(("PER", sender))
+        return "\n".join(lines)
+
+    def _quoted_replies(self, rng: random.Random, lang: str, labels: dict) -> list[str]:
+        """Get the lines of a chain of quoted previous messages."""
+        vocab = _VOCAB[lang]
+        lines = []
+        depth = rng.randint(1, self.options["max_reply_depth"])
+        for level in range(1, depth + 1):
+            name, email = self._person(rng, vocab)
+            prefix = ">" * (level - 1) + (" " if level > 1 else "")
+            date = format_date(self._date(rng), lang, rng.randint(0, 10))
+            header = vocab["reply_header"].format(date=date, name=name, email=email)
+            labels["dates"].append(date)
+            labels["entities"].append(("PER", name))
+            lines.append("")
+            lines.append(prefix + header)
+            quote = ">" * level + " "
+            body = self._body(rng, lang, labels)
+            lines += [quote + line for line in body.split("\n")]
+        return lines
+
+    def generate_email(self, idx: int) -> dict[str, Any]:
+        """Generate a single email.
+
+        Args:
+            idx (int): The index of the email in the corpus.
+
+        Returns:
+            dict[str, Any]: The email with the fields of InoutHandler, i.e.
+                "file_name", "content", "date", "attachment", "attachment type"
+                and "subject", together with "language", "html" and the "labels"
+                of the content: the "dates" as written and the "entities"
+                as (entity group, word), in order of appearance.
+        """
+        rng = self._rng(idx)
+        lang = rng.choice(self.languages)
+        vocab = _VOCAB[lang]
+        labels = {"dates": [], "entities": []}
+        content = self._body(rng, lang, labels)
+        if rng.random() < self.options["reply_share"]:
+            content = "\n".join([content] + self._quoted_replies(rng, lang, labels))
+        subject = rng.choice(vocab["subjects"])
+        if "\n>" in content:
+            subject = {"de": "AW: ", "pt": "RES: "}.get(lang, "RE: ") + subject
+        n_attachments = 0
+        if rng.random() < self.options["attachment_share"]:
+            n_attachments = rng.randint(1, self.options["max_attachments"])
+        return {
+            "file_name": "email_{:06d}.eml".format(idx),
+            "content": content,
+            "date": self._date(rng),
+            "attachment": n_attachments,
+            "attachment type": [
+                rng.choice(list(_ATTACHMENT_TYPES)) for _ in range(n_attachments)
+            ],
+            "subject": subject,
+            "language": lang,
+            "html": rng.random() < self.options["html_share"],
+            "labels": labels,
+        }
+
+    def to_eml(self, email: dict[str, Any]) -> bytes:
+        """Get the MIME message of an email, as read by InoutHandler.
+
+        Args:
+            email (dict[str, Any]): The email, see generate_email.
+
+        Returns:
+            bytes: The MIME message.
+        """
+        message = EmailMessage()
+        rng = random.Random(email["file_name"])
+        _, sender = self._person(rng, _VOCAB[email["language"]])
+        _, recipient = self._person(rng, _VOCAB[email["language"]])
+        message["From"] = sender
+        message["To"] = recipient
+        message["Subject"] = email["subject"]
+        message["Date"] = format_datetime(email["date"])
+        if email["html"]:
+            paragraphs = "".join(
+                "<p>{}</p>".format(html.escape(line))
+                for line in email["content"].split("\n")
+            )
+            message.set_content(
+                "<html><body>{}</body></html>".format(paragraphs), subtype="html"
+            )
+        else:
+            message.set_content(email["content"])
+        for i, extension in enumerate(email["attachment type"]):
+            maintype, subtype = _ATTACHMENT_TYPES[extension]
+            message.add_attachment(
+                bytes(rng.getrandbits(8) for _ in range(64)),
+                maintype=maintype,
+                subtype=subtype,
+                filename="attachment_{}.{}".format(i, extension),
+            )
+        if message.is_multipart():
+            # the default boundary is random
+            message.set_boundary("=====mailcom-{}=====".format(email["file_name"]))
+        return message.as_bytes()
+
+    def write_files(self, out_dir: str, n_emails: int, start: int = 0) -> list[Path]:
+        """Write emails as files to a directory, as read by get_input_handler.
+        Emails with an HTML body get the suffix .html, the others .eml.
+
+        Args:
+            out_dir (str): The output directory.
+            n_emails (int): The number of emails.
+            start (int, optional): The index of the first email. Defaults to 0.
+
+        Returns:
+            list[Path]: The paths of the written files.
+        """
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for idx in range(start, start + n_emails):
+            email = self.generate_email(idx)
+            path = out_dir / email["file_name"]
+            if email["html"]:
+                path = path.with_suffix(".html")
+            path.write_bytes(self.to_eml(email))
+            paths.append(path)
+        return paths
+
+    def write_csv(self, path: str, n_emails: int, start: int = 0) -> Path:
+        """Write emails to a csv file with the columns CSV_COLUMNS, to be read
+        by get_input_handler with in_type="csv" and col_names=CSV_COL_NAMES.
+
+        Args:
+            path (str): The path of the csv file.
+            n_emails (int): The number of emails.
+            start (int, optional): The index of the first email. Defaults to 0.
+
+        Returns:
+            Path: The path of the csv file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            for idx in range(start, start + n_emails):
+                email = self.generate_email(idx)
+                writer.writerow(
+                    [
+                        email["file_name"],
+                        email["content"],
+                        email["date"].strftime("%Y-%m-%d"),
+                        email["attachment"],
+                        "[{}]".format(", ".join(email["attachment type"])),
+                        email["subject"],
+                        email["language"],
+                    ]
+                )
+        return path
+
+
+def generate_corpus(
+    out_path: str,
+    n_emails: int,
+    fmt: str = "eml",
+    seed: int = 0,
+    languages: list[str] = None,
+    **options,
+):
+    """Generate a synthetic corpus of emails.
+
+    Args:
+        out_path (str): The output directory for fmt "eml",
+            the csv file for fmt "csv".
+        n_emails (int): The number of emails.
+        fmt (str, optional): The format, "eml" or "csv". Defaults to "eml".
+        seed (int, optional): The seed of the corpus. Defaults to 0.
+        languages (list[str], optional): The languages of the emails.
+            Defaults to all of LANGUAGES.
+        **options: Options overriding DEFAULT_OPTIONS.
+
+    Returns:
+        list[Path] | Path: The written files for fmt "eml",
+            the csv file for fmt "csv".
+    """
+    generator = CorpusGenerator(seed, languages, **options)
+    if fmt == "eml":
+        return generator.write_files(out_path, n_emails)
+    if fmt == "csv":
+        return generator.write_csv(out_path, n_emails)
+    raise ValueError("Invalid corpus format: {}".format(fmt))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic multilingual email corpus."
+    )
+    parser.add_argument("out_path", help="Output directory or csv file.")
+    parser.add_argument("--n-emails", type=int, default=100)
+    parser.add_argument("--format", choices=["eml", "csv"], default="eml")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--languages", nargs="+", default=None, choices=LANGUAGES)
+    for key, value in DEFAULT_OPTIONS.items():
+        parser.add_argument(
+            "--" + key.replace("_", "-"), type=type(value), default=value
+        )
+    args = vars(parser.parse_args(argv))
+
+    options = {key: args[key] for key in DEFAULT_OPTIONS}
+    generate_corpus(
+        args["out_path"],
+        args["n_emails"],
+        args["format"],
+        args["seed"],
+        args["languages"],
+        **options,
+    )
+    print("The corpus has been saved to {}".format(args["out_path"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
 from pathlib import Path
+import csv
+import math
 import os
+import warnings
 import eml_parser
 from bs4 import BeautifulSoup
 from dicttoxml import dicttoxml
 import pandas as pd
 from typing import Any
+from collections.abc import Iterator
+from mailcom import metrics
+
+
+def _xml_item_name(parent: str) -> str:
+    return "email" if parent == "email_list" else "item"
 
 
 class InoutHandler:
@@ -69,6 +78,7 @@ class InoutHandler:
             raise OSError("File {} does not exist".format(file))
         with open(file, "rb") as fhdl:
             raw_email = fhdl.read()
+        metrics.inc("bytes_read", len(raw_email))
         ep = eml_parser.EmlParser(include_raw_body=True)
         parsed_eml = ep.decode_email_bytes(raw_email)
         attachmenttypes = []
@@ -101,14 +111,20 @@ class InoutHandler:
 
         return email_content
 
-    def process_emails(self):
-        """Function that processes all emails in the directory
-        and saves their contents in email_list"""
+    def iter_emails(self) -> Iterator[dict]:
+        """Function that extracts the emails in the directory one by one
+        without saving them in email_list.
 
+        Returns:
+            Iterator[dict]: Iterator of the extracted email dictionaries."""
         for email_path in self.email_path_list:
             print("Processing input file {}".format(email_path))
-            email_dict = self.extract_email_info(email_path)
-            self.email_list.append(email_dict)
+            yield self.extract_email_info(email_path)
+
+    def process_emails(self):
+        """Function that processes all emails in the directory
+        and saves their contents in email_list"""
+        self.email_list.extend(self.iter_emails())
 
     def get_email_list(self):
         """Function that returns an iterator of email_list
@@ -125,11 +141,8 @@ class InoutHandler:
                 email_dict[field] = None
 
     def data_to_xml(self):
-        def my_item_func(x):
-            return "email" if x == "email_list" else "item"
-
         xml = dicttoxml(
-            self.email_list, custom_root="email_list", item_func=my_item_func
+            self.email_list, custom_root="email_list", item_func=_xml_item_name
         )
         return xml.decode()
 
@@ -144,6 +157,7 @@ class InoutHandler:
 
         with open(outfile, "w", encoding="utf-8") as file:
             file.write(text)
+        metrics.inc("bytes_written", os.path.getsize(outfile))
 
     def write_csv(self, outfile: str):
         """Write the email list containing all dictionaries to csv.
@@ -156,6 +170,7 @@ class InoutHandler:
         # use pandas to handle missing keys automatically
         df = pd.DataFrame(self.email_list)
         df.to_csv(outfile, index=False)
+        metrics.inc("bytes_written", os.path.getsize(outfile))
 
     def load_csv(
         self,
@@ -187,6 +202,7 @@ class InoutHandler:
         except pd.errors.EmptyDataError:
             self.email_list = []
             return
+        metrics.inc("bytes_read", os.path.getsize(infile))
 
         common_num = min(len(col_names), len(self.init_data_fields))
         common_cols = col_names[:common_num]
@@ -205,3 +221,91 @@ class InoutHandler:
             }
             for _, row in df.iterrows()
         ]
+
+
+class EmailStreamWriter:
+    """Write emails to a csv or xml file one at a time, so that they do not
+    have to be kept in memory until the end of the run.
+
+    The xml file is the same as written by InoutHandler.data_to_xml. The
+    columns of the csv file are the keys of the first email followed by
+    extra_columns, as they must be known before the first row. Keys of
+    later emails which are not among them are dropped with a warning.
+    Unlike pandas in InoutHandler.write_csv, the values are written as
+    they are, e.g. integer columns with missing values are not written
+    as floats.
+
+    Args:
+        outfile (str): The path of the file to be written, ending in
+            .csv or .xml.
+        extra_columns (list[str], optional): Columns of the csv file
+            which may be missing in the first email. Defaults to None.
+    """
+
+    def __init__(self, outfile: str, extra_columns: list[str] = None):
+        self.outfile = outfile
+        self.file_type = Path(outfile).suffix[1:]
+        if self.file_type not in ["csv", "xml"]:
+            raise ValueError("Invalid file type: {}".format(self.file_type))
+        self.extra_columns = extra_columns or []
+        self.n_emails = 0
+        self._csv_writer = None
+        self._dropped = set()
+        self._file = open(outfile, "w", encoding="utf-8", newline="")
+        if self.file_type == "xml":
+            self._file.write('<?xml version="1.0" encoding="UTF-8" ?><email_list>')
+
+    def _write_csv_row(self, email: dict[str, Any]):
+        if self._csv_writer is None:
+            columns = list(email)
+            columns.extend(col for col in self.extra_columns if col not in email)
+            # the line endings of pandas
+            self._csv_writer = csv.DictWriter(
+                self._file,
+                columns,
+                restval="",
+                extrasaction="ignore",
+                lineterminator=os.linesep,
+            )
+            self._csv_writer.writeheader()
+        dropped = set(email) - set(self._csv_writer.fieldnames) - self._dropped
+        if dropped:
+            warnings.warn(
+                "The columns {} are not in the csv header and are dropped.".format(
+                    sorted(dropped)
+                )
+            )
+            self._dropped.update(dropped)
+        # missing values are written as empty strings, as by pandas
+        self._csv_writer.writerow(
+            {
+                key: (
+                    ""
+                    if value is None or (isinstance(value, float) and math.isnan(value))
+                    else value
+                )
+                for key, value in email.items()
+            }
+        )
+
+    def write(self, email: dict[str, Any]):
+        """Append an email to the file.
+
+        Args:
+            email (dict[str, Any]): The email dictionary.
+        """
+        if self.file_type == "csv":
+            self._write_csv_row(email)
+        else:
+            content = dicttoxml(email, root=False, item_func=_xml_item_name)
+            self._file.write('<email type="dict">{}</email>'.format(content.decode()))
+        self.n_emails += 1
+
+    def close(self):
+        """Finish and close the file. Closing it again has no effect."""
+        if self._file.closed:
+            return
+        if self.file_type == "xml":
+            self._file.write("</email_list>")
+        self._file.close()
+        metrics.inc("bytes_written", os.path.getsize(self.outfile))
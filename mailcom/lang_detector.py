@@ -1,16 +1,174 @@
 from langid.langid import LanguageIdentifier, model
 from langdetect import detect_langs, DetectorFactory
 from intervaltree import IntervalTree
-from mailcom.utils import TransformerLoader, get_trans_instance
-import re
+import numpy as np
+from mailcom.utils import TextClassifier, TransformerLoader, get_trans_instance
+from mailcom.cache import LRUCache, text_key
+from array import array
+from functools import lru_cache
+from pathlib import Path
+import base64
+import bz2
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+# files of the langid model cache, see load_langid_model
+_LANGID_ARRAYS = ["nb_ptc", "nb_pc", "tk_nextmove"]
+_LANGID_META = "meta.json"
+
+
+def _decode_langid_model() -> tuple:
+    """Decode the model string shipped with langid,
+    as LanguageIdentifier.from_modelstring does."""
+    nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output = pickle.loads(
+        bz2.decompress(base64.b64decode(model))
+    )
+    nb_numfeats = len(nb_ptc) // len(nb_pc)
+    nb_pc = np.array(nb_pc)
+    nb_ptc = np.array(nb_ptc).reshape(nb_numfeats, len(nb_pc))
+    return nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output
+
+
+def _write_langid_cache(cache_dir: Path, langid_model: tuple):
+    """Write the decoded model into a temporary sibling directory, which is
+    then renamed to cache_dir, so that the files of a complete cache are
+    never rewritten while other processes have them memory-mapped.
+    If another process wrote the cache first, its files are kept."""
+    nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output = langid_model
+    cache_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=cache_dir.name + ".", dir=cache_dir.parent))
+    try:
+        _write_langid_files(tmp_dir, nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output)
+        # an empty cache_dir is replaced, a complete one is kept
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        if not (cache_dir / _LANGID_META).is_file():
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _write_langid_files(
+    out_dir: Path,
+    nb_ptc: np.ndarray,
+    nb_pc: np.ndarray,
+    nb_classes: list[str],
+    tk_nextmove: array,
+    tk_output: dict,
+):
+    np.save(out_dir / "nb_ptc.npy", nb_ptc)
+    np.save(out_dir / "nb_pc.npy", nb_pc)
+    np.save(
+        out_dir / "tk_nextmove.npy", np.frombuffer(tk_nextmove, tk_nextmove.typecode)
+    )
+    meta = {
+        "nb_classes": nb_classes,
+        "typecode": tk_nextmove.typecode,
+        # json only supports string keys
+        "tk_output": [[key, list(value)] for key, value in tk_output.items()],
+    }
+    # write the metadata last, it marks the cache as complete
+    with open(out_dir / _LANGID_META, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _read_langid_cache(cache_dir: Path) -> tuple:
+    with open(cache_dir / _LANGID_META, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    # the large arrays are memory-mapped and shared between processes
+    nb_ptc = np.load(cache_dir / "nb_ptc.npy", mmap_mode="r")
+    nb_pc = np.load(cache_dir / "nb_pc.npy", mmap_mode="r")
+    # langid indexes the state machine per byte, which is faster on an array
+    tk_nextmove = array(meta["typecode"])
+    tk_nextmove.frombytes(np.load(cache_dir / "tk_nextmove.npy").tobytes())
+    tk_output = {key: tuple(value) for key, value in meta["tk_output"]}
+    return nb_ptc, nb_pc, meta["nb_classes"], tk_nextmove, tk_output
+
+
+@lru_cache(maxsize=None)
+def load_langid_model(cache_dir: str = None) -> tuple:
+    """Load the langid model once per process.
+
+    Decoding the model string shipped with langid takes several seconds.
+    The decoded model is kept for the lifetime of the process and shared
+    by all LangDetector objects. With a cache directory, the decoded model
+    is also stored on disk as numpy arrays, which are memory-mapped when
+    the model is loaded again, e.g. in other worker processes.
+
+    Args:
+        cache_dir (str, optional): Directory of the decoded model on disk.
+            It is created if it does not exist, atomically, so that worker
+            processes starting at the same time can share it. Defaults to
+            None, in which case the model is only kept in memory.
+
+    Returns:
+        tuple: The arrays of the model nb_ptc, nb_pc, nb_classes,
+            tk_nextmove and tk_output, as expected by LanguageIdentifier.
+            They must not be modified.
+    """
+    if cache_dir is None:
+        return _decode_langid_model()
+    cache_dir = Path(cache_dir)
+    if (cache_dir / _LANGID_META).is_file():
+        return _read_langid_cache(cache_dir)
+    langid_model = _decode_langid_model()
+    _write_langid_cache(cache_dir, langid_model)
+    return _read_langid_cache(cache_dir)
+
+
+@lru_cache(maxsize=None)
+def _restrict_langid_model(langs: frozenset, cache_dir: str = None) -> tuple:
+    """Get the langid model restricted to a set of languages,
+    as LanguageIdentifier.set_languages does. The restricted arrays
+    are created once per process and language set."""
+    nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output = load_langid_model(cache_dir)
+    subset_mask = np.array([lang in langs for lang in nb_classes], dtype=bool)
+    return (
+        np.ascontiguousarray(nb_ptc[:, subset_mask]),
+        np.ascontiguousarray(nb_pc[subset_mask]),
+        [lang for lang in nb_classes if lang in langs],
+        tk_nextmove,
+        tk_output,
+    )
+
+
+def _make_langid(langid_model: tuple) -> LanguageIdentifier:
+    """Create a lightweight LanguageIdentifier on an already loaded model."""
+    nb_ptc, nb_pc, nb_classes, tk_nextmove, tk_output = langid_model
+    return LanguageIdentifier(
+        nb_ptc,
+        nb_pc,
+        nb_ptc.shape[0],
+        nb_classes,
+        tk_nextmove,
+        tk_output,
+        norm_probs=True,
+    )
 
 
 class LangDetector:
-    def __init__(self, trans_loader: TransformerLoader = None):
-        self.lang_id = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+    def __init__(
+        self, trans_loader: TransformerLoader = None, langid_cache_dir: str = None
+    ):
+        self.langid_cache_dir = (
+            str(langid_cache_dir) if langid_cache_dir is not None else None
+        )
+        self.lang_id = _make_langid(load_langid_model(self.langid_cache_dir))
         self.detect_langs = detect_langs
         self.trans_loader = trans_loader
         self.feature = "lang_detector"
+        # sampling of long texts, disabled by default, see set_sampling
+        self.sample_chars = 0
+        self.sample_windows = 0
+        self.sample_confidence = 1.0
+        # languages the detections are restricted to, see set_languages
+        self.languages = None
+        # cache of the detections, see set_cache
+        self.cache = None
+        self.text_classifier = TextClassifier()
 
     def init_transformers(self, pipeline_info: dict[str, str] = None):
         """Initialize transformers for language detection."""
@@ -27,7 +185,7 @@ class LangDetector:
         Returns:
             bool: True if the text is only punctuations, False otherwise.
         """
-        return not any(char.isalnum() for char in text)
+        return self.text_classifier.classify(text)["punctuations"]
 
     def strip_punctuations(self, text: str) -> str:
         """Strip punctuations from a given text.
@@ -49,11 +207,7 @@ class LangDetector:
         Returns:
             bool: True if the text is only numbers, False otherwise.
         """
-        processed_text = self.strip_punctuations(text)
-        processed_text = "".join(
-            [char for char in processed_text if not char.isspace()]
-        )
-        return processed_text.isdigit()
+        return self.text_classifier.classify(text)["numbers"]
 
     def contains_only_emails(self, text: str) -> bool:
         """Check if a given text contains only email(s).
@@ -64,9 +218,7 @@ class LangDetector:
         Returns:
             bool: True if the text contains only email(s), False otherwise.
         """
-        processed_text = text.strip().strip("\n")
-        text_as_list = [word for word in processed_text.split(" ") if word.strip()]
-        return all("@" in word for word in text_as_list)
+        return self.text_classifier.classify(text)["emails"]
 
     def contains_only_links(self, text: str) -> bool:
         """Check if a given text contains only links.
@@ -77,31 +229,214 @@ class LangDetector:
         Returns:
             bool: True if the text contains only links, False otherwise.
         """
-        processed_text = text.strip().strip("\n")
-        text_as_list = [word for word in processed_text.split(" ") if word.strip()]
-
-        url_regex = re.compile(
-            r"^(https?|s?ftps?|scp)://"  # Match http, https, sftp, ftps, ftp, or scp
-            r"(([A-Za-z0-9-]+\.)+[A-Za-z]{2,})"  # Match domain name
-            r"(:\d+)?"  # Optional port number
-            r"(/.*)?$"  # Optional path
-        )
-
-        return all(url_regex.match(word) for word in text_as_list)
+        return self.text_classifier.classify(text)["links"]
 
     def constrain_langid(self, lang_set: list[str] = []):
         """Set constraint for language set of langid.
         Default is no constrained languages."""
         if lang_set:
-            lang_intersec = list(set(lang_set) & set(self.lang_id.nb_classes))
+            lang_intersec = frozenset(lang_set) & frozenset(self.lang_id.nb_classes)
             if lang_intersec:
-                self.lang_id.set_languages(lang_intersec)
+                # the model arrays are shared by all detectors, so a new
+                # identifier is created on the restricted arrays
+                self.lang_id = _make_langid(
+                    _restrict_langid_model(lang_intersec, self.langid_cache_dir)
+                )
             else:
                 raise ValueError(
                     "No languages in the set are supported by langid. "
                     "Please check the language set."
                 )
 
+    def set_cache(self, cache: LRUCache = None):
+        """Cache the detections of texts, e.g. of recurring greetings
+        and signatures. The cache is used by get_detections and
+        get_detections_batch, and thereby by detect_lang_sentences.
+
+        Args:
+            cache (LRUCache, optional): The cache. Defaults to None,
+                in which case the detections are not cached.
+        """
+        self.cache = cache
+
+    def _get_cache_key(
+        self, text: str, lang_lib: str, pipeline_info: dict[str, str] = None
+    ) -> str:
+        # the key contains all settings that change the detections
+        parts = [lang_lib]
+        if lang_lib == "langid":
+            parts.append(",".join(self.lang_id.nb_classes))
+        elif lang_lib == "trans":
+            parts.append(json.dumps(pipeline_info, sort_keys=True))
+        parts.append(",".join(sorted(self.languages or [])))
+        if self.sample_chars:
+            parts.append(
+                "{}/{}/{}".format(
+                    self.sample_chars, self.sample_windows, self.sample_confidence
+                )
+            )
+        # the detections can depend on the layout, e.g. of sampled texts
+        return text_key(text, *parts, normalise=False)
+
+    def set_languages(self, languages: list[str] = None):
+        """Restrict the detected languages to a set of languages.
+        langid only scores these languages, see constrain_langid, while the
+        detections of langdetect and transformers are filtered.
+
+        Args:
+            languages (list[str], optional): The language codes.
+                Defaults to None, in which case all languages are detected.
+        """
+        self.languages = frozenset(languages) if languages else None
+        # start from the full model, which is shared and already loaded
+        self.lang_id = _make_langid(load_langid_model(self.langid_cache_dir))
+        if self.languages:
+            self.constrain_langid(sorted(self.languages))
+
+    def filter_languages(
+        self, detections: list[tuple[str, float]]
+    ) -> list[tuple[str, float]]:
+        """Keep the detections of the languages set with set_languages.
+
+        Args:
+            detections (list[tuple[str, float]]): The detected languages
+                and their probabilities.
+
+        Returns:
+            list[tuple[str, float]]: The detections of the set languages,
+                [(None, 0.0)] if there are none.
+        """
+        if self.languages is None:
+            return detections
+        filtered = [det for det in detections if det[0] in self.languages]
+        return filtered if filtered else [(None, 0.0)]
+
+    def set_sampling(
+        self, sample_chars: int = 1000, n_windows: int = 2, min_confidence: float = 0.9
+    ):
+        """Detect the language of long texts from samples of the text.
+
+        For texts longer than sample_chars, only a leading sample is classified
+        first. If the language is not detected with at least min_confidence,
+        n_windows samples spread over the rest of the text are classified,
+        until one of them is confident. If the samples disagree on the
+        language, or none of them is confident, the full text is classified.
+
+        Args:
+            sample_chars (int, optional): The length of a sample in characters,
+                0 to disable sampling. Defaults to 1000.
+            n_windows (int, optional): The number of additional samples.
+                Defaults to 2.
+            min_confidence (float, optional): The probability of a detection
+                to stop early. Defaults to 0.9.
+        """
+        if sample_chars < 0 or n_windows < 0:
+            raise ValueError("The sample size and number of windows must be >= 0.")
+        self.sample_chars = sample_chars
+        self.sample_windows = n_windows
+        self.sample_confidence = min_confidence
+
+    def get_samples(self, text: str) -> list[str]:
+        """Get the samples of a text for the language detection,
+        see set_sampling. Samples end at whitespace, so that words are not cut.
+
+        Args:
+            text (str): The text to sample.
+
+        Returns:
+            list[str]: The leading sample followed by the spread-out samples,
+                only the text itself if it is not longer than a sample.
+        """
+        size = self.sample_chars
+        if not size or len(text) <= size:
+            return [text]
+        samples = []
+        starts = [0] + [
+            (len(text) - size) * i // self.sample_windows
+            for i in range(1, self.sample_windows + 1)
+        ]
+        for start in starts:
+            if start:
+                # start after the word cut by the window
+                space = text.find(" ", start, start + size)
+                start = space + 1 if space != -1 else start
+            end = min(start + size, len(text))
+            if end < len(text):
+                space = text.rfind(" ", start, end)
+                end = space if space > start else end
+            samples.append(text[start:end])
+        return samples
+
+    def _detect(
+        self, text: str, lang_lib: str, pipeline_info: dict[str, str] = None
+    ) -> list[tuple[str, float]]:
+        # detect the language of a detectable text with the given lang_lib
+        if lang_lib == "langid":
+            return self.detect_with_langid(text)
+        elif lang_lib == "langdetect":
+            self.determine_langdetect()
+            return self.detect_with_langdetect(text)
+        elif lang_lib == "trans":
+            return self.detect_with_transformers(text, pipeline_info)
+        else:
+            raise ValueError(
+                "Language library must be either 'langid', 'langdetect' or 'trans'."
+            )
+
+    def _detect_sampled(
+        self,
+        text: str,
+        lang_lib: str,
+        pipeline_info: dict[str, str] = None,
+        first: list[tuple[str, float]] = None,
+    ) -> list[tuple[str, float]]:
+        """Detect the language of a detectable text from its samples,
+        see set_sampling.
+
+        Args:
+            text (str): The text to detect the language of.
+            lang_lib (str): The lang_lib to use for detection.
+            pipeline_info (dict[str, str], optional): The pipeline information.
+            first (list[tuple[str, float]], optional): The detection of the
+                leading sample, if already known. Defaults to None.
+
+        Returns:
+            list[tuple[str, float]]: The detected languages and probabilities.
+        """
+        samples = self.get_samples(text)
+        if len(samples) == 1:
+            return self._detect(text, lang_lib, pipeline_info)
+        langs = set()
+        for i, sample in enumerate(samples):
+            if i == 0 and first is not None:
+                detection = first
+            elif self.is_detectable(sample):
+                detection = self._detect(sample, lang_lib, pipeline_info)
+            else:
+                continue
+            lang, prob = detection[0]
+            langs.add(lang)
+            if len(langs) > 1:
+                # the samples disagree
+                break
+            if prob >= self.sample_confidence:
+                return detection
+        return self._detect(text, lang_lib, pipeline_info)
+
+    def is_detectable(self, text: str) -> bool:
+        """Check if the language of a given text can be detected, i.e. the text
+        is not empty, not just whitespace or newline, and does not only contain
+        punctuations, numbers, emails or links.
+
+        Args:
+            text (str): The text to check.
+
+        Returns:
+            bool: True if the language of the text can be detected, False otherwise.
+        """
+        # all checks in one pass over the text
+        return self.text_classifier.has_content(text)
+
     def determine_langdetect(self):
         """Enforce consistent results for langdetect."""
         DetectorFactory.seed = 0
@@ -122,13 +457,47 @@ class LangDetector:
         # to avoid repetition of code
         if not hasattr(self, "lang_detector_trans"):
             self.init_transformers(pipeline_info)
-        detections = self.lang_detector_trans(sentence, top_k=2, truncation=True)
+        # score all languages, if only some of them are kept
+        top_k = 2 if self.languages is None else None
+        detections = self.lang_detector_trans(sentence, top_k=top_k, truncation=True)
         results = []
         for detection in detections:
             lang = detection["label"]
             prob = detection["score"]
             results.append((lang, prob))
-        return results
+        return self.filter_languages(results)[:2]
+
+    def detect_with_transformers_batch(
+        self,
+        texts: list[str],
+        pipeline_info: dict[str, str] = None,
+        batch_size: int = 32,
+    ) -> list[list[tuple[str, float]]]:
+        """Detect the languages of several texts using transformers library,
+        with batched inference.
+
+        Args:
+            texts (list[str]): The texts to detect the languages of.
+            pipeline_info (dict[str, str], optional): The pipeline information
+            batch_size (int, optional): The number of texts per forward pass.
+                Defaults to 32.
+
+        Returns:
+            list[list[tuple[str, float]]]: The possible languages and their
+                probabilities for each text.
+        """
+        if not hasattr(self, "lang_detector_trans"):
+            self.init_transformers(pipeline_info)
+        top_k = 2 if self.languages is None else None
+        detections = self.lang_detector_trans(
+            texts, top_k=top_k, truncation=True, batch_size=batch_size
+        )
+        return [
+            self.filter_languages(
+                [(det["label"], det["score"]) for det in text_detections]
+            )[:2]
+            for text_detections in detections
+        ]
 
     def detect_with_langid(self, sentence: str) -> list[tuple[str, float]]:
         """Dectect language of a given text using langid library.
@@ -150,6 +519,34 @@ class LangDetector:
             )
         return [(lang, prob)]
 
+    def detect_with_langid_batch(
+        self, texts: list[str]
+    ) -> list[list[tuple[str, float]]]:
+        """Detect the languages of several texts using langid library.
+        The feature vectors of all texts are stacked into one matrix,
+        so that the class probabilities are computed in one matrix product.
+
+        Args:
+            texts (list[str]): The texts to detect the languages of.
+
+        Returns:
+            list[list[tuple[str, float]]]: The detected language and its
+                probability for each text.
+        """
+        if not texts:
+            return []
+        lang_id = self.lang_id
+        features = np.stack([lang_id.instance2fv(text) for text in texts])
+        log_probs = features @ lang_id.nb_ptc + lang_id.nb_pc
+        # normalize to probabilities, as langid with norm_probs=True
+        probs = np.exp(log_probs - log_probs.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [
+            [(str(lang_id.nb_classes[cl]), float(probs[row, cl]))]
+            for row, cl in enumerate(best)
+        ]
+
     def detect_with_langdetect(self, sentence: str) -> list[tuple[str, float]]:
         """Dectect language of a given text using langdetect library.
         Recommended for a single language detection.
@@ -162,7 +559,9 @@ class LangDetector:
         """
         try:
             detections = self.detect_langs(sentence)
-            results = [(det.lang, det.prob) for det in detections]
+            results = self.filter_languages(
+                [(det.lang, det.prob) for det in detections]
+            )
         except Exception as e:
             results = [(None, 0.0)]
             raise ValueError(
@@ -185,31 +584,132 @@ class LangDetector:
 
         Returns:
             list[tuple[str, float]]: A list of detected languages and their probabilities.
+                With sampling, see set_sampling, the language of long texts
+                is detected from samples of the text.
         """
         # make sure that the text is not empty,
         # not just whitespace or newline,
         # not only contains punctuations
-        if (
-            text.strip().strip("\n")
-            and not self.contains_only_punctuations(text)
-            and not self.contains_only_numbers(text)
-            and not self.contains_only_emails(text)
-            and not self.contains_only_links(text)
-        ):
-            if lang_lib == "langid":
-                return self.detect_with_langid(text)
-            elif lang_lib == "langdetect":
-                self.determine_langdetect()
-                return self.detect_with_langdetect(text)
-            elif lang_lib == "trans":
-                return self.detect_with_transformers(text, pipeline_info)
+        if self.is_detectable(text):
+            if self.cache is not None:
+                key = self._get_cache_key(text, lang_lib, pipeline_info)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return [tuple(detection) for detection in cached]
+            if self.sample_chars:
+                detections = self._detect_sampled(text, lang_lib, pipeline_info)
             else:
-                raise ValueError(
-                    "Language library must be either 'langid', 'langdetect' or 'trans'."
-                )
+                detections = self._detect(text, lang_lib, pipeline_info)
+            if self.cache is not None:
+                self.cache.put(key, list(detections))
+            return detections
         else:
             return [(None, 0.0)]
 
+    def get_detections_batch(
+        self,
+        texts: list[str],
+        lang_lib: str = "langid",
+        pipeline_info: dict[str, str] = None,
+        batch_size: int = 32,
+    ) -> list[list[tuple[str, float]]]:
+        """Get detections for several texts using a specified lang_lib or model.
+        The texts that pass the checks of get_detections are classified in
+        batches: langid computes the probabilities of a batch in one matrix
+        product, transformers runs batched inference. Cached detections,
+        see set_cache, are not detected again. With sampling, see
+        set_sampling, the leading samples of long texts are classified in the
+        batch, and only the texts without confident detection are sampled further.
+
+        Args:
+            texts (list[str]): The texts to detect the languages of.
+            lang_lib (str): The lang_lib to use for detection.
+                Options are "langid", "langdetect" and "trans".
+                The default is "langid".
+            pipeline_info (dict[str, str], optional): The pipeline information,
+                used for detecting with "trans" option.
+            batch_size (int, optional): The number of texts per batch.
+                Defaults to 32.
+
+        Returns:
+            list[list[tuple[str, float]]]: The detected languages and their
+                probabilities for each text, in the order of the texts.
+                [(None, 0.0)] for texts without detectable language.
+        """
+        if lang_lib not in ["langid", "langdetect", "trans"]:
+            raise ValueError(
+                "Language library must be either 'langid', 'langdetect' or 'trans'."
+            )
+        results = [[(None, 0.0)] for _ in texts]
+        indices = [i for i, text in enumerate(texts) if self.is_detectable(text)]
+        keys = {}
+        if self.cache is not None:
+            # only detect the texts that are not cached
+            missing = []
+            for i in indices:
+                keys[i] = self._get_cache_key(texts[i], lang_lib, pipeline_info)
+                cached = self.cache.get(keys[i])
+                if cached is not None:
+                    results[i] = [tuple(detection) for detection in cached]
+                else:
+                    missing.append(i)
+            indices = missing
+        if not indices:
+            return results
+
+        detectable = [texts[i] for i in indices]
+        full_texts = detectable
+        sampled = [False] * len(detectable)
+        # long texts whose leading sample is not detectable, which are
+        # detected from their other samples as in get_detections
+        deferred = [False] * len(detectable)
+        if self.sample_chars:
+            # classify the leading samples, if their language can be detected
+            detectable = []
+            for k, text in enumerate(full_texts):
+                sample = self.get_samples(text)[0]
+                if len(sample) == len(text):
+                    detectable.append(text)
+                elif self.is_detectable(sample):
+                    sampled[k] = True
+                    detectable.append(sample)
+                else:
+                    deferred[k] = True
+        if not detectable:
+            detections = []
+        elif lang_lib == "langid":
+            detections = []
+            for start in range(0, len(detectable), batch_size):
+                detections.extend(
+                    self.detect_with_langid_batch(
+                        detectable[start : start + batch_size]  # noqa
+                    )
+                )
+        elif lang_lib == "langdetect":
+            self.determine_langdetect()
+            detections = [self.detect_with_langdetect(text) for text in detectable]
+        else:
+            detections = self.detect_with_transformers_batch(
+                detectable, pipeline_info, batch_size
+            )
+
+        detections = iter(detections)
+        for i, text, is_sample, is_deferred in zip(
+            indices, full_texts, sampled, deferred
+        ):
+            if is_deferred:
+                detection = self._detect_sampled(text, lang_lib, pipeline_info)
+            else:
+                detection = next(detections)
+                if is_sample and detection[0][1] < self.sample_confidence:
+                    detection = self._detect_sampled(
+                        text, lang_lib, pipeline_info, detection
+                    )
+            results[i] = detection
+            if self.cache is not None:
+                self.cache.put(keys[i], list(detection))
+        return results
+
     def detect_lang_sentences(
         self,
         sentences: list[str],
@@ -232,11 +732,16 @@ class LangDetector:
         marked_idx = 0
         current_idx = 0
         current_lang = ""
+        # detect the languages of all non-empty sentences at once
+        detections = iter(
+            self.get_detections_batch(
+                [sent for sent in sentences if sent], lang_lib, pipeline_info
+            )
+        )
         for sent in sentences:
             if sent:
-                detections = self.get_detections(sent, lang_lib, pipeline_info)
                 # only take the first detection
-                lang, _ = detections[0]
+                lang, _ = next(detections)[0]
                 if lang != current_lang:
                     if current_lang:
                         result_tree.addi(marked_idx, current_idx, current_lang)
@@ -1,18 +1,29 @@
 from pathlib import Path
 from importlib import resources
-from mailcom.inout import InoutHandler
+from mailcom.inout import EmailStreamWriter, InoutHandler
 from mailcom import utils
 from mailcom.lang_detector import LangDetector
+from mailcom.boilerplate import BoilerplateIndex
+from mailcom.cache import LRUCache
 from mailcom.time_detector import TimeDetector
 from mailcom.parse import Pseudonymize
+from mailcom.pipeline import PipelinedExecutor
+from mailcom.timing import StageTimer, timed
+from mailcom import metrics
+from mailcom.profiling import RunProfiler
+from mailcom.trace import TraceWriter
 import json
 from collections.abc import Iterator
 import jsonschema
 import warnings
 from datetime import datetime
 import socket
+import time
 import copy
-from typing import Any
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Optional
 
 
 def get_input_handler(
@@ -28,6 +39,7 @@ def get_input_handler(
     ],
     unmatched_keyword: str = "unmatched",
     file_types: list[str] = [".eml", ".html"],
+    lazy: bool = False,
 ) -> InoutHandler:
     """Get input handler for a file or directory.
 
@@ -44,6 +56,9 @@ def get_input_handler(
             Defaults to "unmatched".
         file_types (list[str], optional): The list of file types
             to be processed in the directory.
+        lazy (bool, optional): Only list the files in the directory
+            without extracting them, so that they can be extracted while
+            processing, see process_data_pipelined. Defaults to False.
     Returns:
         InoutHandler: The input handler object.
     """
@@ -52,7 +67,8 @@ def get_input_handler(
         inout_handler.load_csv(in_path, col_names, unmatched_keyword)
     else:
         inout_handler.list_of_files(in_path, file_types)
-        inout_handler.process_emails()
+        if not lazy:
+            inout_handler.process_emails()
     return inout_handler
 
 
@@ -214,48 +230,251 @@ def get_workflow_settings(
     return workflow_settings
 
 
-def process_data(
-    email_list: Iterator[list[dict[str, Any]]], workflow_settings: dict[str, Any]
-):
-    """Process the input data in this order:
-    + detect language (optional)
-    + detect date time (optional)
-    + pseudonymize email addresses (optional)
-    + pseudoymize name entities
-    + pseudonymize numbers (optional)
+class EmailProcessor:
+    """Process single emails according to the workflow settings.
+
+    The language detector, time detector and pseudonymizer are initialized
+    once and shared between all emails processed by this object.
 
     Args:
-        email_list (Iterator[list[dict[str, Any]]]): The list of dictionaries
-            of input data. "content" field in each dictionary contains
-            the main content.
         workflow_settings (dict[str, Any]): The workflow settings.
     """
-    # get workflow settings
-    unmatched_keyword = workflow_settings.get("unmatched_keyword", "unmatched")
-    lang = workflow_settings.get("default_lang", "")
-    detect_lang = False if lang else True
-    detect_datetime = workflow_settings.get("datetime_detection", True)
-    pseudo_emailaddresses = workflow_settings.get("pseudo_emailaddresses", True)
-    pseudo_ne = workflow_settings.get("pseudo_ne", True)
-    pseudo_numbers = workflow_settings.get("pseudo_numbers", True)
-    pseudo_first_names = workflow_settings.get("pseudo_first_names", {})
-    lang_lib = workflow_settings.get("lang_detection_lib", "langid")
-    lang_pipeline = workflow_settings.get("lang_pipeline", None)
-    spacy_model = workflow_settings.get("spacy_model", "default")
-    ner_pipeline = workflow_settings.get("ner_pipeline", None)
-    pseudo_fields = workflow_settings.get("pseudo_fields", [])
-
-    # init necessary objects
-    spacy_loader = utils.SpacyLoader()
-    trans_loader = utils.TransformerLoader()
-    pseudonymizer = Pseudonymize(pseudo_first_names, trans_loader, spacy_loader)
-    if detect_lang:
-        lang_detector = LangDetector(trans_loader)
-    if detect_datetime:
-        parsing_type = workflow_settings.get("time_parsing", "strict")
-        time_detector = TimeDetector(parsing_type, spacy_loader)
-
-    for email in email_list:
+
+    def __init__(self, workflow_settings: dict[str, Any]):
+        # get workflow settings
+        self.unmatched_keyword = workflow_settings.get("unmatched_keyword", "unmatched")
+        self.lang = workflow_settings.get("default_lang", "")
+        self.detect_lang = False if self.lang else True
+        self.detect_datetime = workflow_settings.get("datetime_detection", True)
+        self.pseudo_emailaddresses = workflow_settings.get(
+            "pseudo_emailaddresses", True
+        )
+        self.pseudo_ne = workflow_settings.get("pseudo_ne", True)
+        self.pseudo_numbers = workflow_settings.get("pseudo_numbers", True)
+        pseudo_first_names = workflow_settings.get("pseudo_first_names", {})
+        self.lang_lib = workflow_settings.get("lang_detection_lib", "langid")
+        self.lang_pipeline = workflow_settings.get("lang_pipeline", None)
+        self.spacy_model = workflow_settings.get("spacy_model", "default")
+        self.ner_pipeline = workflow_settings.get("ner_pipeline", None)
+        self.pseudo_fields = workflow_settings.get("pseudo_fields", [])
+        # the languages of the emails, all languages if None
+        self.languages = workflow_settings.get("languages", None)
+        # number of texts per language detection batch
+        self.lang_batch_size = workflow_settings.get("lang_batch_size", 32)
+        self.langid_cache_dir = workflow_settings.get("langid_cache_dir", None)
+        # maximal length of the texts parsed by spaCy at once
+        self.spacy_chunk_chars = workflow_settings.get("spacy_chunk_chars", 100000)
+        # run NER for the sentences of long fields in parallel threads
+        self.intra_email_workers = workflow_settings.get("intra_email_workers", 1)
+        self.intra_email_min_chars = workflow_settings.get(
+            "intra_email_min_chars", 50000
+        )
+        self.executor = (
+            ThreadPoolExecutor(self.intra_email_workers)
+            if self.intra_email_workers > 1
+            else None
+        )
+        # time of the batched clean up and language detection per email index
+        self.batch_lang_seconds = {}
+        # fields cleaned up for the batched language detection per email index,
+        # with their content before the clean up
+        self.batch_cleaned = {}
+        # record the time spent in each stage per email and field
+        self.store_timings = workflow_settings.get("stage_timing", False)
+        trace_path = workflow_settings.get("trace_path", None)
+        self.timer = StageTimer() if self.store_timings or trace_path else None
+        # write a record per email for the analysis of slow emails
+        self.trace_writer = TraceWriter(trace_path) if trace_path else None
+        # index of the next email to process
+        self.email_idx = 0
+
+        # init necessary objects
+        self.spacy_loader = utils.SpacyLoader()
+        self.trans_loader = utils.TransformerLoader()
+        self.pseudonymizer = Pseudonymize(
+            pseudo_first_names,
+            self.trans_loader,
+            self.spacy_loader,
+            self.timer,
+            workflow_settings.get("ner_gating", "off"),
+        )
+        ner_cache_size = workflow_settings.get("ner_cache_size", 0)
+        if ner_cache_size:
+            self.pseudonymizer.set_ner_cache(
+                LRUCache(
+                    ner_cache_size,
+                    name="ner",
+                    spill_path=workflow_settings.get("ner_cache_spill_path", None),
+                )
+            )
+        quote_cache_size = workflow_settings.get("quote_cache_size", 0)
+        if quote_cache_size:
+            self.pseudonymizer.set_quote_cache(
+                LRUCache(quote_cache_size, name="quotes")
+            )
+        self.pseudonymizer.set_ner_packing(workflow_settings.get("ner_pack_tokens", 0))
+        self.pseudonymizer.set_spacy_chunking(self.spacy_chunk_chars)
+        if self.executor is not None:
+            self.pseudonymizer.set_parallelism(
+                self.executor, self.intra_email_min_chars, self.intra_email_workers
+            )
+        self.pseudonymizer.set_ner_chunking(
+            workflow_settings.get("ner_max_tokens", 0),
+            workflow_settings.get("ner_stride_tokens", 50),
+        )
+        # recognise boilerplate, indexing the emails while processing them
+        # unless index_boilerplate is called first
+        self.boilerplate_index = None
+        self.index_incrementally = True
+        boilerplate_lines = workflow_settings.get("boilerplate_ngram_lines", 0)
+        if boilerplate_lines:
+            self.boilerplate_index = BoilerplateIndex(
+                boilerplate_lines, workflow_settings.get("boilerplate_min_count", 5)
+            )
+            self.pseudonymizer.set_boilerplate_index(self.boilerplate_index)
+            # the blocks are cached in the quote cache, which is created
+            # with boilerplate_cache_size entries if it is not enabled
+            if self.pseudonymizer.quote_cache is None:
+                self.pseudonymizer.set_quote_cache(
+                    LRUCache(
+                        workflow_settings.get("boilerplate_cache_size", 10000),
+                        name="quotes",
+                    )
+                )
+        if self.detect_lang:
+            self.lang_detector = LangDetector(self.trans_loader, self.langid_cache_dir)
+            if self.languages:
+                self.lang_detector.set_languages(self.languages)
+            cache_size = workflow_settings.get("lang_cache_size", 0)
+            if cache_size:
+                self.lang_detector.set_cache(
+                    LRUCache(
+                        cache_size,
+                        workflow_settings.get("lang_cache_path", None),
+                        name="lang_detection",
+                    )
+                )
+            sample_chars = workflow_settings.get("lang_sample_chars", 0)
+            if sample_chars:
+                self.lang_detector.set_sampling(
+                    sample_chars,
+                    workflow_settings.get("lang_sample_windows", 2),
+                    workflow_settings.get("lang_sample_confidence", 0.9),
+                )
+        if self.detect_datetime:
+            parsing_type = workflow_settings.get("time_parsing", "strict")
+            self.time_detector = TimeDetector(
+                parsing_type,
+                self.spacy_loader,
+                self.timer,
+                self.languages,
+                self.spacy_chunk_chars,
+            )
+        if self.languages:
+            self.spacy_loader.preload(self.languages, self.spacy_model)
+
+    def index_boilerplate(self, emails: list[dict[str, Any]]):
+        """Index the boilerplate of the fields to pseudonymize of all emails,
+        before processing them, see BoilerplateIndex.
+
+        Args:
+            emails (list[dict[str, Any]]): The email dictionaries.
+        """
+        for email in emails:
+            for field in self.pseudo_fields:
+                if not email.get(field) or email.get(field) == self.unmatched_keyword:
+                    continue
+                self.boilerplate_index.add(utils.clean_up_content(email[field])[0])
+        self.index_incrementally = False
+
+    def detect_languages(self, emails: list[dict[str, Any]]) -> list[dict[str, str]]:
+        """Detect the languages of the fields of several emails at once,
+        see LangDetector.get_detections_batch. The emails are expected to be
+        processed next with process_email, in the same order, which reuses
+        the cleaned up fields.
+
+        Args:
+            emails (list[dict[str, Any]]): The email dictionaries.
+
+        Returns:
+            list[dict[str, str]]: The detected language of each field
+                to pseudonymize, for each email.
+        """
+        keys = []
+        texts = []
+        for k, email in enumerate(emails):
+            for field in self.pseudo_fields:
+                if not email.get(field) or email.get(field) == self.unmatched_keyword:
+                    continue
+                email_idx = self.email_idx + k
+                clean_start = time.perf_counter()
+                cleaned_content, _ = utils.clean_up_content(email[field])
+                clean_seconds = time.perf_counter() - clean_start
+                self.batch_lang_seconds[email_idx] = (
+                    self.batch_lang_seconds.get(email_idx, 0.0) + clean_seconds
+                )
+                if self.timer is not None:
+                    self.timer.set_context(email_idx, field)
+                    self.timer.add("clean_up", clean_seconds)
+                self.batch_cleaned.setdefault(email_idx, {})[field] = (
+                    email[field],
+                    cleaned_content,
+                )
+                keys.append((k, field))
+                texts.append(cleaned_content)
+
+        start_time = time.perf_counter()
+        detections = self.lang_detector.get_detections_batch(
+            texts,
+            lang_lib=self.lang_lib,
+            pipeline_info=self.lang_pipeline,
+            batch_size=max(self.lang_batch_size, 1),
+        )
+        # share the time of the batch evenly between the fields
+        field_seconds = (time.perf_counter() - start_time) / max(len(texts), 1)
+
+        langs = [{} for _ in emails]
+        for (k, field), det_langs in zip(keys, detections):
+            langs[k][field] = det_langs[0][0]  # first detected lang, no prob.
+            email_idx = self.email_idx + k
+            self.batch_lang_seconds[email_idx] = (
+                self.batch_lang_seconds.get(email_idx, 0.0) + field_seconds
+            )
+            if self.timer is not None:
+                self.timer.set_context(email_idx, field)
+                self.timer.add("lang_detection", field_seconds)
+        return langs
+
+    def use_language(self, lang: str):
+        """Use the spacy instance of a language for sentence splitting and
+        date detection from now on, e.g. when switching to a group of emails
+        in this language.
+
+        Args:
+            lang (str): The language, the spacy instance is kept if None.
+        """
+        if not lang:
+            return
+        self.pseudonymizer.init_spacy(lang, self.spacy_model)
+        if self.detect_datetime:
+            self.time_detector.nlp_spacy = utils.get_spacy_instance(
+                self.spacy_loader, lang, self.spacy_model
+            )
+
+    def process_email(
+        self, email: dict[str, Any], langs: dict[str, str] = None
+    ) -> dict[str, Any]:
+        """Pseudonymize the specified fields of a single email in place.
+
+        Args:
+            email (dict[str, Any]): The email dictionary.
+            langs (dict[str, str], optional): The languages of the fields,
+                as detected by detect_languages. The language of the other
+                fields is detected here. Defaults to None.
+
+        Returns:
+            dict[str, Any]: The updated email dictionary.
+        """
         # prepare additional keys for each email dict
         email["ne_list"] = {}
         email["ne_sent"] = {}
@@ -263,94 +482,477 @@ def process_data(
         email["sentences_after_email"] = {}
         email["lang"] = {}
         email["detected_datetime"] = {}
+        if self.store_timings:
+            email["stage_timings"] = {}
+        email_idx = self.email_idx
+        self.email_idx += 1
+        metrics.inc("emails")
+        # include the share of the email in the batched language detection
+        start_time = time.perf_counter() - self.batch_lang_seconds.pop(email_idx, 0.0)
+        batch_cleaned = self.batch_cleaned.pop(email_idx, {})
+        trace_fields = {}
 
         # record ne_list between fields
         # to make sure that used pseudonyms are consistent across fields
         prev_ne_list = []
         # pseudonymize each specified field in an email
-        for field in pseudo_fields:
+        for field in self.pseudo_fields:
             # skip if field is empty or not present
-            if not email.get(field) or email.get(field) == unmatched_keyword:
+            if not email.get(field) or email.get(field) == self.unmatched_keyword:
                 continue
-
-            cleaned_content, _ = utils.clean_up_content(email[field])
+            if self.timer is not None:
+                self.timer.set_context(email_idx, field)
+
+            content, cleaned_content = batch_cleaned.get(field, (None, None))
+            # cleaned up by detect_languages unless the field was changed since
+            if content != email[field]:
+                with timed(self.timer, "clean_up"):
+                    cleaned_content, _ = utils.clean_up_content(email[field])
             cleaned_content_name = f"cleaned_{field}"
             email[cleaned_content_name] = cleaned_content
-
-            if detect_lang:
-                det_langs = lang_detector.get_detections(
-                    cleaned_content, lang_lib=lang_lib, pipeline_info=lang_pipeline
-                )
+            if self.boilerplate_index is not None and self.index_incrementally:
+                self.boilerplate_index.add(cleaned_content)
+
+            lang = self.lang
+            if self.detect_lang and langs and field in langs:
+                lang = langs[field]
+            elif self.detect_lang:
+                with timed(self.timer, "lang_detection"):
+                    det_langs = self.lang_detector.get_detections(
+                        cleaned_content,
+                        lang_lib=self.lang_lib,
+                        pipeline_info=self.lang_pipeline,
+                    )
                 lang = det_langs[0][0]  # first detected lang, no prob.
             email["lang"][field] = lang
 
-            if detect_datetime:
-                detected_time = time_detector.get_date_time(
-                    cleaned_content, lang, model=spacy_model
-                )
-                email["detected_datetime"][field] = [
-                    item[0] for item in detected_time
-                ]  # only keep the strings
-            exclude_pseudonym = False
-            pseudo_content, exclude_pseudonym = pseudonymizer.pseudonymize(
-                cleaned_content,
-                lang,
-                model=spacy_model,
-                pipeline_info=ner_pipeline,
+            self._pseudonymize_field(email, field, lang, prev_ne_list)
+            if self.timer is not None:
+                # only the aggregates are kept in the timer from now on
+                durations = self.timer.pop_timings(email_idx, field)
+            if self.store_timings:
+                email["stage_timings"][field] = durations
+            if self.trace_writer is not None:
+                trace_fields[field] = self._get_field_trace(email, field, durations)
+
+        if self.trace_writer is not None:
+            self.trace_writer.write(
+                {
+                    "email_idx": email_idx,
+                    "file_name": email.get("file_name"),
+                    "total_seconds": time.perf_counter() - start_time,
+                    "fields": trace_fields,
+                }
+            )
+        return email
+
+    def _get_field_trace(
+        self, email: dict[str, Any], field: str, durations: dict[str, float]
+    ) -> dict[str, Any]:
+        """Get the trace record of a processed field of an email.
+
+        Args:
+            email (dict[str, Any]): The processed email dictionary.
+            field (str): The processed field.
+            durations (dict[str, float]): The duration of each stage
+                for the field, see StageTimer.pop_timings.
+
+        Returns:
+            dict[str, Any]: The size of the field, the numbers of sentences,
+                tokens, named entities and dates, the detected language
+                and the duration of each stage.
+        """
+        cleaned_content = email[f"cleaned_{field}"]
+        return {
+            "chars": len(str(email[field])),
+            "cleaned_chars": len(cleaned_content),
+            "lines": cleaned_content.count("\n") + 1,
+            "sentences": len(email["sentences"].get(field, [])),
+            "tokens": self.pseudonymizer.n_tokens,
+            "lang": email["lang"].get(field),
+            "entities": len(email["ne_list"].get(field, [])),
+            "dates": len(email["detected_datetime"].get(field) or []),
+            "durations": durations,
+        }
+
+    def close(self):
+        """Close the trace file, save the language detection cache,
+        close the NER cache and stop the worker threads, if any."""
+        if self.trace_writer is not None:
+            self.trace_writer.close()
+        cache = self.lang_detector.cache if self.detect_lang else None
+        if cache is not None and cache.path is not None:
+            cache.save()
+        if self.pseudonymizer.ner_cache is not None:
+            self.pseudonymizer.ner_cache.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _pseudonymize_field(
+        self,
+        email: dict[str, Any],
+        field: str,
+        lang: str,
+        prev_ne_list: list[dict[str, Any]],
+    ):
+        """Detect dates and pseudonymize a cleaned field of an email.
+
+        Args:
+            email (dict[str, Any]): The email dictionary.
+            field (str): The field to pseudonymize.
+            lang (str): The language of the field.
+            prev_ne_list (list[dict[str, Any]]): Named entities found in
+                the previous fields of the email, extended in place.
+        """
+        cleaned_content = email[f"cleaned_{field}"]
+        pseudonymizer = self.pseudonymizer
+        if self.detect_datetime:
+            detected_time = self.time_detector.get_date_time(
+                cleaned_content, lang, model=self.spacy_model
+            )
+            email["detected_datetime"][field] = [
+                item[0] for item in detected_time
+            ]  # only keep the strings
+        exclude_pseudonym = False
+        pseudo_content, exclude_pseudonym = pseudonymizer.pseudonymize(
+            cleaned_content,
+            lang,
+            model=self.spacy_model,
+            pipeline_info=self.ner_pipeline,
+            detected_dates=email.get("detected_datetime", {}).get(field, None),
+            pseudo_emailaddresses=self.pseudo_emailaddresses,
+            pseudo_ne=self.pseudo_ne,
+            pseudo_numbers=self.pseudo_numbers,
+            prev_ne_list=prev_ne_list,
+        )
+        if exclude_pseudonym:
+            metrics.inc("pseudonym_reruns")
+            # make sure ne pseudonymization is restarted in case of
+            # matching pseudonym
+            # note that the matching pseudonym is subsequently excluded
+            # from all further processing but will be present in the initial
+            # data entries
+            pseudo_content, _ = pseudonymizer.pseudonymize_with_updated_ne(
+                copy.deepcopy(pseudonymizer.sentences),
+                None,
+                language=lang,
                 detected_dates=email.get("detected_datetime", {}).get(field, None),
-                pseudo_emailaddresses=pseudo_emailaddresses,
-                pseudo_ne=pseudo_ne,
-                pseudo_numbers=pseudo_numbers,
+                pseudo_emailaddresses=self.pseudo_emailaddresses,
+                pseudo_ne=self.pseudo_ne,
+                pseudo_numbers=self.pseudo_numbers,
                 prev_ne_list=prev_ne_list,
             )
-            if exclude_pseudonym:
-                # make sure ne pseudonymization is restarted in case of
-                # matching pseudonym
-                # note that the matching pseudonym is subsequently excluded
-                # from all further processing but will be present in the initial
-                # data entries
-                pseudo_content, _ = pseudonymizer.pseudonymize_with_updated_ne(
-                    copy.deepcopy(pseudonymizer.sentences),
-                    None,
-                    language=lang,
-                    detected_dates=email.get("detected_datetime", {}).get(field, None),
-                    pseudo_emailaddresses=pseudo_emailaddresses,
-                    pseudo_ne=pseudo_ne,
-                    pseudo_numbers=pseudo_numbers,
-                    prev_ne_list=prev_ne_list,
-                )
 
-            # record ne_list between fields
-            prev_ne_list.extend(pseudonymizer.ne_list)
+        # record ne_list between fields
+        prev_ne_list.extend(pseudonymizer.ne_list)
+
+        # use deepcopy to avoid issue with mutable objects
+        pseudo_content_name = f"pseudo_{field}"
+        email[pseudo_content_name] = pseudo_content
+
+        email["ne_list"][field] = copy.deepcopy(pseudonymizer.ne_list)
+        # remove score from the list
+        for ne in email["ne_list"][field]:
+            ne.pop("score")
+        email["ne_sent"][field] = copy.deepcopy(pseudonymizer.ne_sent)
+        email["sentences"][field] = copy.deepcopy(pseudonymizer.sentences)
+
+        # record sentences after email pseudonymization
+        if self.pseudo_emailaddresses:
+            email["sentences_after_email"][field] = [
+                pseudonymizer.pseudonymize_email_addresses(sent)
+                for sent in email["sentences"][field]
+            ]
+
+
+def start_metrics_exporter(
+    workflow_settings: dict[str, Any],
+) -> Optional[metrics.MetricsExporter]:
+    """Start exporting the metrics of a run if "metrics_path" is set
+    in the workflow settings. The metrics registry is reset, so that
+    the exported counters and rates refer to the current run only.
+
+    To export the metrics of the whole run, including the bytes read and
+    written, start the exporter before get_input_handler, pass it to
+    process_data and stop it after write_output_data.
 
-            # use deepcopy to avoid issue with mutable objects
-            pseudo_content_name = f"pseudo_{field}"
-            email[pseudo_content_name] = pseudo_content
+    Args:
+        workflow_settings (dict[str, Any]): The workflow settings.
 
-            email["ne_list"][field] = copy.deepcopy(pseudonymizer.ne_list)
-            # remove score from the list
-            for ne in email["ne_list"][field]:
-                ne.pop("score")
-            email["ne_sent"][field] = copy.deepcopy(pseudonymizer.ne_sent)
-            email["sentences"][field] = copy.deepcopy(pseudonymizer.sentences)
+    Returns:
+        MetricsExporter|None: The started exporter, to be stopped at the end
+            of the run. None if no metrics are exported.
+    """
+    metrics_path = workflow_settings.get("metrics_path", None)
+    if not metrics_path:
+        return None
+    exporter = metrics.MetricsExporter(
+        metrics_path,
+        fmt=workflow_settings.get("metrics_format", "json"),
+        interval=workflow_settings.get("metrics_interval", 0),
+    )
+    metrics.REGISTRY.reset()
+    exporter.start()
+    return exporter
+
+
+def _get_profiler(workflow_settings: dict[str, Any]) -> Optional[RunProfiler]:
+    """Get the profiler of a run if "profiling_dir" is set in the workflow settings.
 
-            # record sentences after email pseudonymization
-            if pseudo_emailaddresses:
-                email["sentences_after_email"][field] = [
-                    pseudonymizer.pseudonymize_email_addresses(sent)
-                    for sent in email["sentences"][field]
-                ]
+    Args:
+        workflow_settings (dict[str, Any]): The workflow settings.
 
+    Returns:
+        RunProfiler|None: The profiler, None if the run is not profiled.
+    """
+    profiling_dir = workflow_settings.get("profiling_dir", None)
+    if not profiling_dir:
+        return None
+    return RunProfiler(
+        profiling_dir, every_n=workflow_settings.get("profiling_every_n", 0)
+    )
+
+
+def _batched(items: Iterator[Any], batch_size: int) -> Iterator[list[Any]]:
+    """Split an iterator into lists of at most batch_size items."""
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, max(batch_size, 1))):
+        yield batch
+
+
+def _schedule_in_order(
+    processor: EmailProcessor, email_list: Iterator[dict[str, Any]]
+) -> Iterator[tuple[dict[str, Any], dict[str, str], str]]:
+    """Get the emails in input order, with the languages of their fields
+    detected in batches of "lang_batch_size" emails.
+
+    Yields:
+        tuple[dict[str, Any], dict[str, str], str]: The email, the languages
+            of its fields (None without language detection) and its group
+            language, which is always None here.
+    """
+    for batch in _batched(email_list, processor.lang_batch_size):
+        # detect the languages of the whole batch at once
+        if processor.detect_lang:
+            batch_langs = processor.detect_languages(batch)
+        else:
+            batch_langs = [None] * len(batch)
+        for email, langs in zip(batch, batch_langs):
+            yield email, langs, None
+
+
+def _get_group_language(langs: dict[str, str], pseudo_fields: list[str]) -> str:
+    """Get the language an email is grouped by, i.e. the language of
+    its first field with a detected language."""
+    for field in pseudo_fields:
+        if langs.get(field):
+            return langs[field]
+    return None
+
+
+def _schedule_by_language(
+    processor: EmailProcessor, email_list: Iterator[dict[str, Any]]
+) -> Iterator[tuple[dict[str, Any], dict[str, str], str]]:
+    """Get the emails grouped by language. The languages of all emails
+    are detected first, then the emails are yielded language by language,
+    in order of the first occurrence of each language and in input order
+    within a language. The email index of the processor is set to the
+    input index of each email, so that timings and trace records refer
+    to the input order.
+
+    Yields:
+        tuple[dict[str, Any], dict[str, str], str]: The email, the languages
+            of its fields and its group language.
+    """
+    emails = list(email_list)
+    first_idx = processor.email_idx
+    all_langs = []
+    batch_size = max(processor.lang_batch_size, 1)
+    for start in range(0, len(emails), batch_size):
+        processor.email_idx = first_idx + start
+        all_langs.extend(
+            processor.detect_languages(emails[start : start + batch_size])  # noqa
+        )
+    groups = {}
+    for idx, langs in enumerate(all_langs):
+        group_lang = _get_group_language(langs, processor.pseudo_fields)
+        groups.setdefault(group_lang, []).append(idx)
+    for group_lang, indices in groups.items():
+        for idx in indices:
+            processor.email_idx = first_idx + idx
+            yield emails[idx], all_langs[idx], group_lang
+    processor.email_idx = first_idx + len(emails)
 
-def write_output_data(inout_hl: InoutHandler, out_path: str, overwrite: bool = False):
-    """Write the output data to a file.
+
+def process_data(
+    email_list: Iterator[list[dict[str, Any]]],
+    workflow_settings: dict[str, Any],
+    exporter: Optional[metrics.MetricsExporter] = None,
+) -> Optional[StageTimer]:
+    """Process the input data in this order:
+    + detect language (optional)
+    + detect date time (optional)
+    + pseudonymize email addresses (optional)
+    + pseudoymize name entities
+    + pseudonymize numbers (optional)
+
+    If "stage_timing" is enabled in the workflow settings, the time spent
+    in each stage is stored per field in the "stage_timings" key of each email.
+    If "metrics_path" is set, the metrics of the run are written to this file,
+    see start_metrics_exporter.
+    If "profiling_dir" is set, the run or every "profiling_every_n"th email
+    is profiled and the profiles are written to this directory,
+    see profiling.RunProfiler.
+    If "trace_path" is set, a JSON Lines record with the sizes, counts and
+    stage durations of each email is written to this file.
+    The languages are detected for "lang_batch_size" emails at once,
+    see EmailProcessor.detect_languages.
+    If "group_by_language" is enabled and the language is detected, the
+    languages of all emails are detected first, and the emails are then
+    processed grouped by language, with the spacy instance of the language
+    of each group. The emails are updated in place, so that their order
+    is kept in the output. Trace records are written in processing order.
+    If "boilerplate_ngram_lines" is set and "boilerplate_first_pass" is
+    enabled, the boilerplate of all emails is indexed before processing them,
+    see EmailProcessor.index_boilerplate.
 
     Args:
-        inout_hl (InoutHandler): The input handler object containing the data.
-        out_path (str): The path to the output file.
+        email_list (Iterator[list[dict[str, Any]]]): The list of dictionaries
+            of input data. "content" field in each dictionary contains
+            the main content.
+        workflow_settings (dict[str, Any]): The workflow settings.
+        exporter (MetricsExporter, optional): The metrics exporter of the run,
+            started and stopped by the caller, see start_metrics_exporter.
+            Defaults to None, in which case the exporter is started and stopped
+            here and only the metrics of the processing are exported.
+
+    Returns:
+        StageTimer|None: The timer with the recorded timings, use its summary
+            method for the aggregated statistics per stage.
+            None if "stage_timing" is disabled.
+    """
+    processor = EmailProcessor(workflow_settings)
+    own_exporter = exporter is None
+    if own_exporter:
+        exporter = start_metrics_exporter(workflow_settings)
+    profiler = _get_profiler(workflow_settings)
+    try:
+        with profiler.run() if profiler else nullcontext():
+            if processor.boilerplate_index is not None and workflow_settings.get(
+                "boilerplate_first_pass", False
+            ):
+                email_list = list(email_list)
+                processor.index_boilerplate(email_list)
+            if processor.detect_lang and workflow_settings.get(
+                "group_by_language", False
+            ):
+                schedule = _schedule_by_language(processor, email_list)
+            else:
+                schedule = _schedule_in_order(processor, email_list)
+            current_lang = None
+            for email, langs, group_lang in schedule:
+                if group_lang != current_lang:
+                    processor.use_language(group_lang)
+                    current_lang = group_lang
+                with profiler.email(processor.email_idx) if profiler else nullcontext():
+                    processor.process_email(email, langs)
+    finally:
+        processor.close()
+        if own_exporter and exporter is not None:
+            exporter.stop()
+    return processor.timer if processor.store_timings else None
+
+
+def process_data_pipelined(
+    inout_hl: InoutHandler,
+    workflow_settings: dict[str, Any],
+    out_path: str = None,
+    overwrite: bool = False,
+    queue_size: int = 8,
+    exporter: Optional[metrics.MetricsExporter] = None,
+) -> dict[str, Any]:
+    """Process the input data as in process_data, with reading and
+    writing overlapping with the processing.
+
+    Emails are extracted from the input files in a reader thread and
+    appended to the output file one by one in a writer thread, see
+    EmailStreamWriter, so that they are not kept in memory. Without an
+    output file, they are collected in inout_hl.email_list instead.
+    The stages are connected by bounded queues of size queue_size, so
+    that a slow stage holds back its upstream stage, and at most about
+    2 * queue_size emails are held at a time.
+    If "profiling_dir" is set, only the calls in the processing thread are
+    profiled, see profiling.RunProfiler.
+
+    Args:
+        inout_hl (InoutHandler): The input handler object. If its email_list
+            is empty, the emails are extracted lazily from its list of files,
+            see get_input_handler(..., lazy=True).
+        workflow_settings (dict[str, Any]): The workflow settings.
+        out_path (str, optional): The path to the output file, a csv or
+            xml file. Defaults to None, in which case no file is written.
         overwrite (bool, optional): Flag to overwrite the output file if it exists.
             Defaults to False.
+        queue_size (int, optional): Capacity of the queues between the stages.
+            Defaults to 8.
+        exporter (MetricsExporter, optional): The metrics exporter of the run,
+            started and stopped by the caller, see start_metrics_exporter.
+            Defaults to None, in which case the exporter is started and stopped
+            here, after the input handler was created.
+
+    Returns:
+        dict[str, Any]: Statistics per stage and per queue, and the name
+            of the bottleneck stage.
     """
+    if inout_hl.email_list:
+        source = inout_hl.email_list
+    elif getattr(inout_hl, "email_path_list", None):
+        source = inout_hl.iter_emails()
+    else:
+        raise ValueError("The input handler does not contain any input data")
+    inout_hl.email_list = []
+    if out_path:
+        _check_output_path(out_path, overwrite)
+
+    processor = EmailProcessor(workflow_settings)
+    own_exporter = exporter is None
+    if own_exporter:
+        exporter = start_metrics_exporter(workflow_settings)
+    profiler = _get_profiler(workflow_settings)
+
+    def process_email(email: dict[str, Any]) -> dict[str, Any]:
+        with profiler.email(processor.email_idx) if profiler else nullcontext():
+            return processor.process_email(email)
+
+    writer = None
+    if out_path:
+        writer = EmailStreamWriter(
+            out_path,
+            [
+                prefix + field
+                for field in processor.pseudo_fields
+                for prefix in ("cleaned_", "pseudo_")
+            ],
+        )
+    executor = PipelinedExecutor(
+        process_email,
+        writer.write if writer else inout_hl.email_list.append,
+        queue_size=queue_size,
+        close_fn=writer.close if writer else None,
+    )
+    try:
+        with profiler.run() if profiler else nullcontext():
+            return executor.run(source)
+    finally:
+        if writer is not None:
+            writer.close()
+        processor.close()
+        if own_exporter and exporter is not None:
+            exporter.stop()
+
+
+def _check_output_path(out_path: str, overwrite: bool = False) -> str:
+    """Check that an output file can be written, and get its file type."""
     if not out_path:
         raise ValueError("No output path specified")
 
@@ -359,11 +961,24 @@ def write_output_data(inout_hl: InoutHandler, out_path: str, overwrite: bool = F
         raise ValueError("Output file is not empty")
 
     file_type = Path(out_path).suffix[1:]
+    if file_type not in ["csv", "xml"]:
+        raise ValueError("Invalid file type: {}".format(file_type))
+    return file_type
+
+
+def write_output_data(inout_hl: InoutHandler, out_path: str, overwrite: bool = False):
+    """Write the output data to a file.
+
+    Args:
+        inout_hl (InoutHandler): The input handler object containing the data.
+        out_path (str): The path to the output file.
+        overwrite (bool, optional): Flag to overwrite the output file if it exists.
+            Defaults to False.
+    """
+    file_type = _check_output_path(out_path, overwrite)
 
     if file_type == "csv":
         inout_hl.write_csv(out_path)
-    elif file_type == "xml":
+    else:
         xml = inout_hl.data_to_xml()
         inout_hl.write_file(xml, out_path)
-    else:
-        raise ValueError("Invalid file type: {}".format(file_type))
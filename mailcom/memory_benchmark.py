@@ -0,0 +1,262 @@
+"""Memory footprint benchmarks of the mailcom components.
+
+Each measurement runs in a fresh process, so that the peak RSS only
+contains the measured component. The steady-state and peak RSS are
+recorded for each loaded component (SpacyLoader, TransformerLoader,
+LangDetector), and the growth of the RSS per 10k processed emails.
+
+Example:
+    python -m mailcom.memory_benchmark --components langid spacy ner \\
+        --n-emails 200 --out memory.json --baseline old_memory.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any
+
+from mailcom import utils
+from mailcom.benchmark import get_peak_rss_mb
+from mailcom.corpus_generator import CorpusGenerator
+from mailcom.lang_detector import LangDetector
+from mailcom.main import EmailProcessor, get_workflow_settings
+
+COMPONENTS = ["langid", "spacy", "ner", "lang_transformers"]
+
+# metrics compared against the baseline
+COMPARED_METRICS = [
+    "component_rss_mb",
+    "steady_rss_mb",
+    "peak_rss_mb",
+    "rss_per_10k_emails_mb",
+]
+
+
+def get_rss_mb() -> float:
+    """Get the current resident set size of the process in MB.
+
+    Returns:
+        float: The current RSS in MB. Where it is not available
+            (i.e. without /proc), the peak RSS is returned instead.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, AttributeError):
+        return get_peak_rss_mb()
+
+
+def _load_component(
+    name: str, workflow_settings: dict[str, Any], languages: list[str]
+) -> Any:
+    """Load a component as the workflow does and return it."""
+    if name == "langid":
+        return LangDetector()
+    if name == "spacy":
+        loader = utils.SpacyLoader()
+        for language in languages:
+            utils.get_spacy_instance(
+                loader, language, workflow_settings.get("spacy_model", "default")
+            )
+        return loader
+    if name == "ner":
+        loader = utils.TransformerLoader()
+        utils.get_trans_instance(loader, "ner", workflow_settings.get("ner_pipeline"))
+        return loader
+    if name == "lang_transformers":
+        detector = LangDetector(utils.TransformerLoader())
+        detector.init_transformers(workflow_settings.get("lang_pipeline"))
+        return detector
+    raise ValueError("Unknown component: {}".format(name))
+
+
+def _measure_component(
+    name: str, workflow_settings: dict[str, Any], languages: list[str]
+) -> dict:
+    """Measure the RSS of a component in a worker process."""
+    # the modules of mailcom are already imported,
+    # so that only the loaded models are measured
+    gc.collect()
+    before = get_rss_mb()
+    component = _load_component(name, workflow_settings, languages)
+    gc.collect()
+    steady = get_rss_mb()
+    del component
+    return {
+        "component": name,
+        "baseline_rss_mb": before,
+        "steady_rss_mb": steady,
+        "component_rss_mb": steady - before,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def _measure_emails(n_emails: int, workflow_settings: dict[str, Any], seed: int):
+    """Measure the RSS while processing emails in a worker process."""
+    generator = CorpusGenerator(seed)
+    # keep all emails in memory, as get_input_handler and process_data do
+    email_list = [generator.generate_email(i) for i in range(n_emails)]
+    for email in email_list:
+        del email["labels"]
+
+    processor = EmailProcessor(workflow_settings)
+    # the first email loads the models
+    processor.process_email(email_list[0])
+    gc.collect()
+    warm = get_rss_mb()
+    for email in email_list[1:]:
+        processor.process_email(email)
+    gc.collect()
+    steady = get_rss_mb()
+    processor.close()
+    n_measured = max(n_emails - 1, 1)
+    return {
+        "component": "emails",
+        "n_emails": n_emails,
+        "warm_rss_mb": warm,
+        "steady_rss_mb": steady,
+        "rss_per_10k_emails_mb": (steady - warm) / n_measured * 10000,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def _run_isolated(func, *args) -> dict[str, Any]:
+    # spawn a fresh process, so that the peak RSS is measured per component
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def run_memory_benchmark(
+    workflow_settings: dict[str, Any],
+    components: list[str] = None,
+    n_emails: int = 100,
+    seed: int = 0,
+    languages: list[str] = None,
+) -> list[dict[str, Any]]:
+    """Measure the RSS of each component and of processing emails.
+
+    Args:
+        workflow_settings (dict[str, Any]): The workflow settings, which
+            define the loaded models.
+        components (list[str], optional): The components to measure,
+            see COMPONENTS. Defaults to all.
+        n_emails (int, optional): The number of processed emails,
+            0 to skip this measurement. Defaults to 100.
+        seed (int, optional): The seed of the corpus. Defaults to 0.
+        languages (list[str], optional): The languages of the spaCy models
+            loaded together. Defaults to the languages of the workflow
+            settings, or ["fr", "es"] if they are not set.
+
+    Returns:
+        list[dict[str, Any]]: The results of each measurement, where RSS
+            values are in MB.
+    """
+    components = components if components is not None else COMPONENTS
+    languages = languages or workflow_settings.get("languages") or ["fr", "es"]
+    unknown = [name for name in components if name not in COMPONENTS]
+    if unknown:
+        raise ValueError("Unknown components: {}".format(", ".join(unknown)))
+
+    results = []
+    for name in components:
+        result = _run_isolated(_measure_component, name, workflow_settings, languages)
+        print(
+            "{}: {:.1f} MB, peak {:.1f} MB".format(
+                name, result["component_rss_mb"], result["peak_rss_mb"]
+            )
+        )
+        results.append(result)
+    if n_emails > 0:
+        result = _run_isolated(_measure_emails, n_emails, workflow_settings, seed)
+        print(
+            "{} emails: {:.1f} MB per 10k emails, peak {:.1f} MB".format(
+                n_emails, result["rss_per_10k_emails_mb"], result["peak_rss_mb"]
+            )
+        )
+        results.append(result)
+    return results
+
+
+def compare_memory(
+    current: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    threshold: float = 0.1,
+    min_change_mb: float = 5.0,
+) -> list[str]:
+    """Compare memory results against a baseline. A measurement regresses
+    if one of COMPARED_METRICS increased by more than the threshold relative
+    to the baseline and by more than min_change_mb.
+
+    Args:
+        current (list[dict[str, Any]]): The current results.
+        baseline (list[dict[str, Any]]): The baseline results.
+        threshold (float, optional): The tolerated relative increase.
+            Defaults to 0.1.
+        min_change_mb (float, optional): The tolerated absolute increase in MB,
+            to ignore noise in small values. Defaults to 5.0.
+
+    Returns:
+        list[str]: Descriptions of the regressions, empty if there are none.
+    """
+    baseline_results = {result["component"]: result for result in baseline}
+    regressions = []
+    for result in current:
+        base = baseline_results.get(result["component"])
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            new, old = result.get(metric), base.get(metric)
+            if new is None or old is None:
+                continue
+            increase = new - old
+            if increase > min_change_mb and increase > threshold * abs(old):
+                regressions.append(
+                    "{}: {} increased from {:.1f} MB to {:.1f} MB".format(
+                        result["component"], metric, old, new
+                    )
+                )
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Memory footprint benchmark of the mailcom components."
+    )
+    parser.add_argument("--components", nargs="*", default=COMPONENTS)
+    parser.add_argument("--n-emails", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--languages", nargs="+", default=None)
+    parser.add_argument("--settings", default="default", help="Settings file.")
+    parser.add_argument("--out", default="memory_results.json")
+    parser.add_argument("--baseline", default=None, help="Results to compare to.")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    workflow_settings = get_workflow_settings(
+        args.settings, save_updated_settings=False
+    )
+    results = run_memory_benchmark(
+        workflow_settings, args.components, args.n_emails, args.seed, args.languages
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print("The memory results have been saved to {}".format(args.out))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_memory(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression: {}".format(regression))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+def _key(name: str, labels: dict[str, str] = None) -> str:
+    """Get the key of a metric with labels in Prometheus notation,
+    e.g. cache_hits{cache="ner"}."""
+    if not labels:
+        return name
+    label_str = ",".join('{}="{}"'.format(k, v) for k, v in sorted(labels.items()))
+    return "{}{{{}}}".format(name, label_str)
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters and summaries of the workflow.
+
+    Counters are monotonically increasing numbers, e.g. the number of
+    processed emails. Summaries record the count, sum and maximum of
+    observed values, e.g. the batch sizes of NER calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all metrics and restart the clock used for the rates."""
+        with self._lock:
+            self.counters = {}
+            self.summaries = {}
+            self.start_time = time.time()
+
+    def inc(self, name: str, value: float = 1, labels: dict[str, str] = None):
+        """Increment a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (float, optional): The increment. Defaults to 1.
+            labels (dict[str, str], optional): Labels of the counter,
+                e.g. {"cache": "ner"}. Defaults to None.
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict[str, str] = None):
+        """Record a value in a summary.
+
+        Args:
+            name (str): The name of the summary.
+            value (float): The observed value.
+            labels (dict[str, str], optional): Labels of the summary.
+                Defaults to None.
+        """
+        key = _key(name, labels)
+        with self._lock:
+            summary = self.summaries.setdefault(
+                key, {"count": 0, "sum": 0.0, "max": value}
+            )
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def get(self, name: str, labels: dict[str, str] = None) -> float:
+        """Get the current value of a counter, 0 if it was never incremented."""
+        with self._lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get a copy of all metrics together with derived rates.
+
+        Returns:
+            dict[str, Any]: The counters, summaries, the elapsed time since
+                the last reset, the throughput in emails and sentences
+                per second and the hit rate of each cache.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            summaries = {k: dict(v) for k, v in self.summaries.items()}
+            elapsed = time.time() - self.start_time
+
+        rates = {
+            "emails_per_second": counters.get("emails", 0) / elapsed if elapsed else 0,
+            "sentences_per_second": (
+                counters.get("sentences", 0) / elapsed if elapsed else 0
+            ),
+        }
+        for key, hits in counters.items():
+            if key.startswith("cache_hits{"):
+                labels = key[len("cache_hits") :]  # noqa
+                misses = counters.get("cache_misses" + labels, 0)
+                total = hits + misses
+                rates["cache_hit_rate" + labels] = hits / total if total else 0.0
+
+        return {
+            "timestamp": time.time(),
+            "elapsed_seconds": elapsed,
+            "counters": counters,
+            "summaries": summaries,
+            "rates": rates,
+        }
+
+    def to_json(self) -> str:
+        """Get all metrics as a JSON string."""
+        return json.dumps(self.snapshot(), indent=4)
+
+    def to_prometheus(self, prefix: str = "mailcom_") -> str:
+        """Get all metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str, optional): Prefix of all metric names.
+                Defaults to "mailcom_".
+
+        Returns:
+            str: The metrics in Prometheus text format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def add(key: str, suffix: str, mtype: str, value: float):
+            name, _, labels = key.partition("{")
+            full_name = prefix + name + suffix
+            # the type line is only written once per metric name
+            type_name = full_name if mtype != "summary" else prefix + name
+            if type_name not in typed:
+                lines.append("# TYPE {} {}".format(type_name, mtype))
+                typed.add(type_name)
+            labels = "{" + labels if labels else ""
+            lines.append("{}{} {}".format(full_name, labels, value))
+
+        for key, value in sorted(snapshot["counters"].items()):
+            add(key, "_total", "counter", value)
+        for key, summary in sorted(snapshot["summaries"].items()):
+            add(key, "_count", "summary", summary["count"])
+            add(key, "_sum", "summary", summary["sum"])
+        for key, summary in sorted(snapshot["summaries"].items()):
+            add(key, "_max", "gauge", summary["max"])
+        for key, value in sorted(snapshot["rates"].items()):
+            add(key, "", "gauge", value)
+        add("elapsed_seconds", "", "gauge", snapshot["elapsed_seconds"])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "json"):
+        """Write all metrics to a file. The file is replaced atomically,
+        so that readers never see a partially written file.
+
+        Args:
+            path (str): The path of the file.
+            fmt (str, optional): The format, "json" or "prometheus".
+                Defaults to "json".
+        """
+        if fmt == "json":
+            text = self.to_json()
+        elif fmt == "prometheus":
+            text = self.to_prometheus()
+        else:
+            raise ValueError("Invalid metrics format: {}".format(fmt))
+
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+# the registry used by all components of mailcom
+REGISTRY = MetricsRegistry()
+
+
+def inc(name: str, value: float = 1, labels: dict[str, str] = None):
+    """Increment a counter in the mailcom registry, see MetricsRegistry.inc."""
+    REGISTRY.inc(name, value, labels)
+
+
+def observe(name: str, value: float, labels: dict[str, str] = None):
+    """Record a value in the mailcom registry, see MetricsRegistry.observe."""
+    REGISTRY.observe(name, value, labels)
+
+
+class MetricsExporter:
+    """Write the metrics of a registry to a file at regular intervals
+    in a background thread, and once more when stopped.
+
+    Args:
+        path (str): The path of the metrics file.
+        fmt (str, optional): The format, "json" or "prometheus".
+            Defaults to "json".
+        interval (float, optional): The interval between two writes in seconds.
+            If 0, the metrics are only written when stopped. Defaults to 0.
+        registry (MetricsRegistry, optional): The registry to export.
+            Defaults to the mailcom registry.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fmt: str = "json",
+        interval: float = 0,
+        registry: MetricsRegistry = None,
+    ):
+        if fmt not in ("json", "prometheus"):
+            raise ValueError("Invalid metrics format: {}".format(fmt))
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.registry = registry if registry is not None else REGISTRY
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.registry.write(self.path, self.fmt)
+
+    def start(self):
+        """Start writing the metrics at regular intervals."""
+        if self.interval and self.interval > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="mailcom-metrics", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and write the final metrics."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.registry.write(self.path, self.fmt)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
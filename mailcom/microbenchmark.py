@@ -0,0 +1,270 @@
+"""Micro-benchmarks of the functions that run per sentence or per token.
+
+The benchmarks use synthetic inputs and hand-built spaCy docs, so that
+no spaCy or transformers model is loaded and algorithmic changes can be
+measured in isolation. The size of a benchmark is the number of words,
+entities, lines or paragraphs of its input.
+
+Example:
+    python -m mailcom.microbenchmark --sizes 10 100 1000 --out micro.json
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime
+from typing import Any, Callable
+
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
+
+from mailcom.inout import InoutHandler
+from mailcom.lang_detector import LangDetector
+from mailcom.parse import Pseudonymize
+from mailcom.time_detector import TimeDetector
+from mailcom.timing import percentile
+from mailcom.utils import TextClassifier, clean_up_content
+
+DEFAULT_SIZES = [10, 100, 1000]
+
+# words of the synthetic sentences, cycled to reach the requested size
+_WORDS = [
+    "Bonjour",
+    "Alice",
+    ",",
+    "le",
+    "rendez-vous",
+    "du",
+    "17.04.2024",
+    "est",
+    "à",
+    "10:30",
+    "au",
+    "bureau",
+    "42",
+    ",",
+    "écrivez",
+    "à",
+    "alice@example.org",
+    ".",
+]
+_PSEUDO_FIRST_NAMES = {"fr": ["Claude", "Dominique", "Camille"]}
+_NAMES = ["Alice", "Pierre", "Marie", "Jean", "Lucie", "Paul"]
+
+
+def _make_words(size: int) -> list[str]:
+    return [_WORDS[i % len(_WORDS)] for i in range(size)]
+
+
+def _make_sentence(size: int) -> str:
+    return " ".join(_make_words(size))
+
+
+def _make_entities(size: int) -> tuple[list[dict[str, Any]], str]:
+    """Get a sentence with size named entities and the entities in it."""
+    words = []
+    entities = []
+    pos = 0
+    for i in range(size):
+        word = _NAMES[i % len(_NAMES)] + str(i // len(_NAMES))
+        group = "PER" if i % 3 else "LOC"
+        entities.append(
+            {"entity_group": group, "word": word, "start": pos, "end": pos + len(word)}
+        )
+        words.extend([word, "et"])
+        pos += len(word) + len(" et ")
+    return entities, " ".join(words)
+
+
+def _bench_pseudonymize_numbers(size: int) -> Callable:
+    pseudonymizer = Pseudonymize(_PSEUDO_FIRST_NAMES)
+    sentence = _make_sentence(size)
+    return lambda: pseudonymizer.pseudonymize_numbers(sentence, ["17.04.2024"])
+
+
+def _bench_get_letter_indices(size: int) -> Callable:
+    pseudonymizer = Pseudonymize(_PSEUDO_FIRST_NAMES)
+    sentence = _make_sentence(size)
+    return lambda: pseudonymizer._get_letter_indices(sentence, ["17.04.2024", "10:30"])
+
+
+def _bench_pseudonymize_email_addresses(size: int) -> Callable:
+    pseudonymizer = Pseudonymize(_PSEUDO_FIRST_NAMES)
+    sentence = _make_sentence(size)
+    return lambda: pseudonymizer.pseudonymize_email_addresses(sentence)
+
+
+def _bench_choose_per_pseudonym(size: int) -> Callable:
+    pseudonymizer = Pseudonymize(_PSEUDO_FIRST_NAMES)
+    entities, _ = _make_entities(size)
+    for entity in entities:
+        entity["pseudonym"] = "Claude"
+    pseudonymizer.ne_list = entities
+    # an unseen name, so that all previous names are checked
+    return lambda: pseudonymizer.choose_per_pseudonym("Inconnu", "fr")
+
+
+def _bench_pseudonymize_ne(size: int) -> Callable:
+    pseudonymizer = Pseudonymize(_PSEUDO_FIRST_NAMES)
+    entities, sentence = _make_entities(size)
+
+    def run():
+        pseudonymizer.reset()
+        return pseudonymizer.pseudonymize_ne(entities, sentence, "fr")
+
+    return run
+
+
+def _make_date_doc(size: int) -> Doc:
+    """Get a doc of size words with dates and times, with POS tags
+    as assigned by spaCy."""
+    words = ["17.04.2024", "um", "17:23", "und"]
+    pos = ["NUM", "ADP", "NUM", "CCONJ"]
+    return Doc(
+        Vocab(),
+        words=[words[i % len(words)] for i in range(size)],
+        pos=[pos[i % len(pos)] for i in range(size)],
+    )
+
+
+def _bench_merge_date_time(size: int) -> Callable:
+    time_detector = TimeDetector("non-strict")
+    doc = _make_date_doc(size)
+    extracted = [
+        (token, datetime(2024, 4, 17, 17, 23)) for token in doc if token.pos_ == "NUM"
+    ]
+    return lambda: time_detector.merge_date_time(extracted, doc)
+
+
+def _bench_extract_date_time_single_word(size: int) -> Callable:
+    time_detector = TimeDetector("non-strict")
+    doc = _make_date_doc(size)
+    return lambda: time_detector.extract_date_time_single_word(doc, [])
+
+
+def _bench_contains_only(size: int) -> Callable:
+    lang_detector = LangDetector()
+    sentence = _make_sentence(size)
+
+    def run():
+        lang_detector.contains_only_punctuations(sentence)
+        lang_detector.contains_only_numbers(sentence)
+        lang_detector.contains_only_emails(sentence)
+        lang_detector.contains_only_links(sentence)
+
+    return run
+
+
+def _bench_has_content(size: int) -> Callable:
+    classifier = TextClassifier()
+    sentence = _make_sentence(size)
+    return lambda: classifier.has_content(sentence)
+
+
+def _bench_clean_up_content(size: int) -> Callable:
+    content = "\n\n".join("  {}  ".format(_make_sentence(10)) for _ in range(size))
+    return lambda: clean_up_content(content)
+
+
+def _bench_get_html_text(size: int) -> Callable:
+    inout_hl = InoutHandler()
+    html = "<html><body>{}</body></html>".format(
+        "".join("<p>{}</p>".format(_make_sentence(10)) for _ in range(size))
+    )
+    return lambda: inout_hl.get_html_text(html)
+
+
+# name -> function creating the benchmarked callable for an input size
+BENCHMARKS = {
+    "Pseudonymize.pseudonymize_numbers": _bench_pseudonymize_numbers,
+    "Pseudonymize._get_letter_indices": _bench_get_letter_indices,
+    "Pseudonymize.pseudonymize_email_addresses": _bench_pseudonymize_email_addresses,
+    "Pseudonymize.choose_per_pseudonym": _bench_choose_per_pseudonym,
+    "Pseudonymize.pseudonymize_ne": _bench_pseudonymize_ne,
+    "TimeDetector.merge_date_time": _bench_merge_date_time,
+    "TimeDetector.extract_date_time_single_word": _bench_extract_date_time_single_word,
+    "LangDetector.contains_only_*": _bench_contains_only,
+    "TextClassifier.has_content": _bench_has_content,
+    "utils.clean_up_content": _bench_clean_up_content,
+    "InoutHandler.get_html_text": _bench_get_html_text,
+}
+
+
+def time_callable(func: Callable, repeat: int = 5) -> dict[str, float]:
+    """Time a callable with timeit. The number of calls per repetition
+    is chosen automatically, so that one repetition takes at least 0.2 s.
+
+    Args:
+        func (Callable): The callable without arguments.
+        repeat (int, optional): The number of repetitions. Defaults to 5.
+
+    Returns:
+        dict[str, float]: The number of calls per repetition and the best,
+            median and worst time per call in seconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    per_call = [total / number for total in timer.repeat(repeat, number)]
+    return {
+        "number": number,
+        "best": min(per_call),
+        "median": percentile(per_call, 50),
+        "worst": max(per_call),
+    }
+
+
+def run_microbenchmarks(
+    names: list[str] = None, sizes: list[int] = None, repeat: int = 5
+) -> list[dict[str, Any]]:
+    """Run the micro-benchmarks for all input sizes.
+
+    Args:
+        names (list[str], optional): The benchmarks to run, see BENCHMARKS.
+            Defaults to None, in which case all benchmarks are run.
+        sizes (list[int], optional): The input sizes. Defaults to 10, 100 and 1000.
+        repeat (int, optional): The number of repetitions. Defaults to 5.
+
+    Returns:
+        list[dict[str, Any]]: The timings of each benchmark and size,
+            including the median time per input item.
+    """
+    names = names if names else list(BENCHMARKS)
+    sizes = sizes if sizes else DEFAULT_SIZES
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError("Unknown benchmarks: {}".format(", ".join(unknown)))
+
+    results = []
+    for name in names:
+        for size in sizes:
+            timings = time_callable(BENCHMARKS[name](size), repeat)
+            result = {"name": name, "size": size, **timings}
+            result["per_item"] = timings["median"] / size if size else 0.0
+            print(
+                "{} (size {}): {:.3g} s per call".format(name, size, timings["median"])
+            )
+            results.append(result)
+    return results
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks of the per-sentence functions of mailcom."
+    )
+    parser.add_argument("--names", nargs="+", default=None, choices=list(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=None, help="JSON file for the results.")
+    args = parser.parse_args(argv)
+
+    results = run_microbenchmarks(args.names, args.sizes, args.repeat)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print("The micro-benchmark results have been saved to {}".format(args.out))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
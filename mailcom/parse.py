@@ -1,7 +1,23 @@
 from mailcom import utils
+from mailcom import metrics
+from mailcom.boilerplate import BoilerplateIndex
+from mailcom.cache import LRUCache, text_key
+from mailcom.timing import StageTimer, timed
+from concurrent.futures import Executor
+import bisect
+import copy
+import json
 import re
+import threading
 from typing import Optional, Any
 
+# off: NER runs on all sentences, on: NER is skipped for gated sentences,
+# eval: NER runs on all sentences, and the entities in gated sentences
+# are counted as missed
+NER_GATING_MODES = ["off", "on", "eval"]
+# placeholders of already redacted parts
+_PLACEHOLDERS = ["[email]"]
+
 
 class Pseudonymize:
     def __init__(
@@ -9,6 +25,8 @@ class Pseudonymize:
         pseudo_first_names: dict[str, list[str]],
         trans_loader: utils.TransformerLoader = None,
         spacy_loader: utils.SpacyLoader = None,
+        timer: StageTimer = None,
+        ner_gating: str = "off",
     ):
 
         self.pseudo_first_names = pseudo_first_names
@@ -17,11 +35,47 @@ class Pseudonymize:
         self.ne_list = []
         self.ne_sent = []  # indices of sentences with NEs
         self.sentences = []  # record sentences obtained by spaCy
+        self.n_tokens = 0  # number of spaCy tokens in the last text
 
         self.trans_loader = trans_loader
         self.feature = "ner"
 
         self.spacy_loader = spacy_loader
+        # optional timer recording the time spent in each stage
+        self.timer = timer
+        # recognise sentences without content, see get_ner_gate_reason
+        self.text_classifier = utils.TextClassifier()
+        # skip NER for sentences that cannot contain entities,
+        # see get_ner_gate_reason
+        if ner_gating not in NER_GATING_MODES:
+            raise ValueError(
+                "NER gating must be one of {}.".format(", ".join(NER_GATING_MODES))
+            )
+        self.ner_gating = ner_gating
+        # optional cache of the NER results of sentences, see set_ner_cache
+        self.ner_cache = None
+        # optional cache of the analysis of quoted replies, see set_quote_cache
+        self.quote_cache = None
+        # optional index to split off boilerplate, see set_boilerplate_index
+        self.boilerplate_index = None
+        # token budget of the windows of packed sentences, see set_ner_packing
+        self.ner_pack_tokens = 0
+        # maximal length of the texts parsed by spaCy at once,
+        # see set_spacy_chunking
+        self.spacy_chunk_chars = 0
+        # run NER for the sentences of long texts in parallel,
+        # see set_parallelism
+        self.executor = None
+        self.parallel_min_chars = 0
+        self.parallel_groups = 1
+        # the NER pipelines of the worker threads and the pipeline they are
+        # copied from, see _get_worker_recognizers
+        self._worker_recognizers = []
+        self._worker_source = None
+        self._local = threading.local()
+        # token budget of a NER call, see set_ner_chunking
+        self.ner_max_tokens = 0
+        self.ner_stride_tokens = 0
 
         # use regex to find email addresses
         # local_part@domain.extension
@@ -52,6 +106,199 @@ class Pseudonymize:
             self.trans_loader, self.feature, pipeline_info
         )
 
+    def set_ner_cache(self, cache: LRUCache = None):
+        """Cache the named entities of each sentence, so that repeated
+        sentences, e.g. signatures and disclaimers, only pass through the
+        transformers model once. The pseudonyms are still chosen per email.
+
+        Args:
+            cache (LRUCache, optional): The cache, which can be shared
+                between instances. Defaults to None, which disables caching.
+        """
+        self.ner_cache = cache
+
+    def set_quote_cache(self, cache: LRUCache = None):
+        """Split the texts into their own text and the quoted replies, see
+        utils.split_quoted, and cache the sentences and named entities of each
+        segment. The analysis of a message quoted again later in the thread is
+        then reused, and only the pseudonyms are chosen for each email.
+
+        Args:
+            cache (LRUCache, optional): The cache, which can be shared
+                between instances. Defaults to None, in which case the texts
+                are analysed as a whole.
+        """
+        self.quote_cache = cache
+
+    def set_boilerplate_index(self, index: BoilerplateIndex = None):
+        """Split off boilerplate blocks like signatures from the segments
+        of the texts, so that each distinct block is analysed once. The
+        blocks are cached in the quote cache, see set_quote_cache, which
+        must be set.
+
+        Args:
+            index (BoilerplateIndex, optional): The index recognising the
+                boilerplate. Defaults to None, which disables the splitting.
+        """
+        self.boilerplate_index = index
+
+    def _split_segments(self, text: str) -> list[str]:
+        segments = utils.split_quoted(text)
+        if self.boilerplate_index is None:
+            return segments
+        return [
+            block
+            for segment in segments
+            for block, _ in self.boilerplate_index.split(segment)
+        ]
+
+    def _get_segment_analysis(
+        self,
+        text: str,
+        language: str,
+        model: str,
+        pipeline_info: dict[str, str],
+        pseudo_emailaddresses: bool,
+    ) -> tuple[list[str], dict[int, list[dict]], list[tuple[str, int, int, int]]]:
+        """Split a text into segments, see set_quote_cache and
+        set_boilerplate_index, and get the sentences of each segment,
+        from the quote cache if the segment was analysed before.
+
+        Returns:
+            tuple: The sentences of the text, the cached named entities per
+                sentence index, and the cache key, the range of sentence indices
+                and the number of tokens of each segment missing in the cache.
+        """
+        sentences = []
+        known_ner = {}
+        missing = []
+        n_tokens = 0
+        for segment in self._split_segments(text):
+            key = text_key(
+                segment,
+                "quote",
+                language,
+                str(model),
+                json.dumps(pipeline_info, sort_keys=True, default=str),
+                str(pseudo_emailaddresses),
+                self.ner_gating,
+                # the entities can come from packed windows, see set_ner_packing
+                "pack:{}".format(self.ner_pack_tokens),
+                *self._get_chunking_key_parts(),
+                normalise=False,
+            )
+            analysis = self.quote_cache.get(key)
+            start = len(sentences)
+            if analysis is None:
+                sentences.extend(self.get_sentences(segment, language, model))
+                n_tokens += self.n_tokens
+                missing.append((key, start, len(sentences), self.n_tokens))
+                continue
+            metrics.inc("quote_segments_reused")
+            sentences.extend(analysis["sentences"])
+            n_tokens += analysis["n_tokens"]
+            for i, ner in enumerate(analysis["ner"]):
+                if ner is not None:
+                    # the entities are modified while pseudonymizing
+                    known_ner[start + i] = copy.deepcopy(ner)
+        self.n_tokens = n_tokens
+        return sentences, known_ner, missing
+
+    def set_ner_packing(self, max_tokens: int = 0):
+        """Pack consecutive sentences of a text into windows of up to
+        max_tokens tokens, and run NER once per window instead of once per
+        sentence. The entities are mapped back to their sentences, so that
+        the results have the same form as without packing. As the model sees
+        the neighbouring sentences, the entities found can differ slightly.
+        For the same reason, only the entities of sentences in a window of
+        their own are cached, see set_ner_cache.
+
+        Args:
+            max_tokens (int, optional): The token budget of the windows,
+                counted with the tokenizer of the NER pipeline. Defaults to 0,
+                which disables packing.
+        """
+        self.ner_pack_tokens = max_tokens
+
+    def set_spacy_chunking(self, max_chars: int = 0):
+        """Parse texts longer than max_chars characters in chunks split at
+        line breaks, see utils.parse_chunks, so that the memory of the parse
+        is bounded. Sentences do not span two chunks.
+
+        Args:
+            max_chars (int, optional): The maximal length of a chunk.
+                Defaults to 0, in which case only texts longer than the
+                max_length of the spaCy instance are split.
+        """
+        self.spacy_chunk_chars = max_chars
+
+    def set_parallelism(
+        self, executor: Executor = None, min_chars: int = 0, n_groups: int = 4
+    ):
+        """Run NER for the sentences of texts with at least min_chars characters
+        in parallel, in consecutive groups of sentences. The entities are then
+        rendered in the order of the sentences, so that the pseudonyms are the
+        same as without parallelism.
+
+        Each group uses its own shallow copy of the NER pipeline, which shares
+        the model weights but has its own copy of the tokenizer, as fast
+        tokenizers can fail when used concurrently. The forward passes of the
+        model release the GIL and run concurrently.
+
+        Args:
+            executor (Executor, optional): The executor running the groups,
+                usually a ThreadPoolExecutor.
+                Defaults to None, which disables parallelism.
+            min_chars (int, optional): The minimal length of the texts
+                processed in parallel. Defaults to 0.
+            n_groups (int, optional): The number of groups the sentences are
+                split into, usually the number of workers. Defaults to 4.
+        """
+        self.executor = executor
+        self.parallel_min_chars = min_chars
+        self.parallel_groups = n_groups
+
+    def set_ner_chunking(self, max_tokens: int = 0, stride: int = 0):
+        """Split texts longer than max_tokens tokens into overlapping windows
+        before passing them to NER, which bounds the time and memory of a call.
+        Entities in the overlap of two windows are taken from the window
+        which owns their start, i.e. the first window up to the middle of
+        the overlap and the second one after it.
+
+        Args:
+            max_tokens (int, optional): The token budget of a NER call,
+                counted with the tokenizer of the NER pipeline. Defaults to 0,
+                which disables chunking.
+            stride (int, optional): The number of tokens shared by consecutive
+                windows. Defaults to 0.
+        """
+        if max_tokens and not 0 <= stride < max_tokens:
+            raise ValueError("The stride must be smaller than the token budget.")
+        self.ner_max_tokens = max_tokens
+        self.ner_stride_tokens = stride
+
+    def _get_ner_cache_key(
+        self, sentence: str, pipeline_info: dict[str, str] = None
+    ) -> str:
+        if pipeline_info is None and self.trans_loader is not None:
+            pipeline_info = self.trans_loader.trans_default_model.get(self.feature)
+        # the entities have offsets into the sentence,
+        # so the whitespace is not normalised
+        return text_key(
+            sentence,
+            self.feature,
+            json.dumps(pipeline_info, sort_keys=True, default=str),
+            *self._get_chunking_key_parts(),
+            normalise=False,
+        )
+
+    def _get_chunking_key_parts(self) -> list[str]:
+        # the parts of the cache keys of entities, which are merged from
+        # the windows of chunked sentences, see set_ner_chunking
+        if not self.ner_max_tokens:
+            return []
+        return ["chunk:{}/{}".format(self.ner_max_tokens, self.ner_stride_tokens)]
+
     def reset(self):
         """Clears the named entity list for processing a new email."""
         # reset NEs
@@ -90,11 +337,18 @@ class Pseudonymize:
             config = {"punct_chars": [".", "!", "?"]}
             self.nlp_spacy.add_pipe("sentencizer", before="parser", config=config)
 
-        doc = self.nlp_spacy(input_text)
-
+        self.n_tokens = 0
         text_as_sents = []
-        for sent in doc.sents:
-            text_as_sents.append(str(sent))
+        chunks = utils.parse_chunks(self.nlp_spacy, input_text, self.spacy_chunk_chars)
+        while True:
+            with timed(self.timer, "spacy_parse"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            doc = chunk[1]
+            self.n_tokens += len(doc)
+            for sent in doc.sents:
+                text_as_sents.append(str(sent))
         return text_as_sents
 
     def get_ner(self, sentence: str, pipeline_info: dict[str, str] = None):
@@ -108,9 +362,299 @@ class Pseudonymize:
         Returns:
             list[dict]: List of named entities retrieved from transformers model.
         """
+        key, cached = self._get_cached_ner(sentence, pipeline_info)
+        if cached is not None:
+            return cached
         if not hasattr(self, "ner_recognizer"):
             self.init_transformers(pipeline_info)
-        ner = self.ner_recognizer(sentence)
+        ner = self._recognize(sentence)
+        metrics.observe("ner_batch_size", 1)
+        if key is not None:
+            self.ner_cache.put(key, copy.deepcopy(ner))
+        return ner
+
+    def _get_cached_ner(
+        self, sentence: str, pipeline_info: dict[str, str] = None
+    ) -> tuple[Optional[str], Optional[list[dict]]]:
+        # the cache key and the cached entities, None if not cached
+        if self.ner_cache is None:
+            return None, None
+        key = self._get_ner_cache_key(sentence, pipeline_info)
+        cached = self.ner_cache.get(key)
+        # the entities are modified while pseudonymizing
+        return key, copy.deepcopy(cached) if cached is not None else None
+
+    def _recognize(self, text: str) -> list[dict]:
+        recognizer = self._get_recognizer()
+        chunks = self._get_chunks(text)
+        if len(chunks) == 1:
+            with timed(self.timer, "ner"):
+                ner = recognizer(text)
+            metrics.inc("ner_calls")
+            return ner
+
+        # the window i owns the characters from bounds[i] to bounds[i + 1]
+        bounds = [0]
+        for (start, _), (_, prev_end) in zip(chunks[1:], chunks):
+            bounds.append((start + prev_end) // 2)
+        bounds.append(len(text))
+        entities = []
+        for i, (start, end) in enumerate(chunks):
+            with timed(self.timer, "ner"):
+                chunk_ner = recognizer(text[start:end])
+            for entity in chunk_ner:
+                entity["start"] += start
+                entity["end"] += start
+                if bounds[i] <= entity["start"] < bounds[i + 1]:
+                    entities.append(entity)
+        metrics.inc("ner_calls", len(chunks))
+        metrics.inc("ner_chunked_texts")
+
+        # drop entities overlapping an earlier one at the window boundaries
+        ner = []
+        for entity in sorted(entities, key=lambda e: (e["start"], -e["end"])):
+            if ner and entity["start"] < ner[-1]["end"]:
+                continue
+            ner.append(entity)
+        return ner
+
+    def _get_token_spans(self, text: str) -> list[tuple[int, int]]:
+        # character offsets of the tokens, of the words if the
+        # tokenizer does not provide them
+        tokenizer = getattr(self._get_recognizer(), "tokenizer", None)
+        if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+            encoding = tokenizer(
+                text, add_special_tokens=False, return_offsets_mapping=True
+            )
+            return [tuple(span) for span in encoding["offset_mapping"]]
+        return [match.span() for match in re.finditer(r"\S+", text)]
+
+    def _get_chunks(self, text: str) -> list[tuple[int, int]]:
+        # character ranges of the overlapping windows of a text, see
+        # set_ner_chunking; a token covers at least one character, so that
+        # shorter texts are not tokenized
+        if not self.ner_max_tokens or len(text) <= self.ner_max_tokens:
+            return [(0, len(text))]
+        spans = self._get_token_spans(text)
+        if len(spans) <= self.ner_max_tokens:
+            return [(0, len(text))]
+        step = self.ner_max_tokens - self.ner_stride_tokens
+        chunks = []
+        for first in range(0, len(spans), step):
+            last = min(first + self.ner_max_tokens, len(spans))
+            chunks.append((spans[first][0], spans[last - 1][1]))
+            if last == len(spans):
+                break
+        return chunks
+
+    def _count_tokens(self, text: str) -> int:
+        tokenizer = getattr(self._get_recognizer(), "tokenizer", None)
+        if tokenizer is None:
+            return len(text.split())
+        return len(tokenizer.tokenize(text))
+
+    def _get_recognizer(self):
+        # the NER pipeline of the current thread
+        recognizer = getattr(self._local, "recognizer", None)
+        return recognizer if recognizer is not None else self.ner_recognizer
+
+    def _get_worker_recognizers(self, n_workers: int) -> list:
+        # shallow copies of the NER pipeline sharing the model weights, with
+        # their own tokenizer, one per group of sentences run in parallel
+        if self._worker_source is not self.ner_recognizer:
+            self._worker_source = self.ner_recognizer
+            self._worker_recognizers = []
+        while len(self._worker_recognizers) < n_workers:
+            recognizer = copy.copy(self.ner_recognizer)
+            tokenizer = getattr(self.ner_recognizer, "tokenizer", None)
+            if tokenizer is not None:
+                recognizer.tokenizer = copy.deepcopy(tokenizer)
+            self._worker_recognizers.append(recognizer)
+        return self._worker_recognizers[:n_workers]
+
+    def _get_ner_batch_with(
+        self, recognizer, sentences: list[str], pipeline_info: dict[str, str]
+    ) -> list[list[dict]]:
+        # the named entities of the sentences, using the given NER pipeline
+        # in the current thread
+        self._local.recognizer = recognizer
+        try:
+            return self._get_ner_batch(sentences, pipeline_info)
+        finally:
+            self._local.recognizer = None
+
+    def get_ner_packed(
+        self, sentences: list[str], pipeline_info: dict[str, str] = None
+    ) -> list[list[dict]]:
+        """Retrieves the named entities of several sentences, packing consecutive
+        sentences into windows of up to ner_pack_tokens tokens, see
+        set_ner_packing. A sentence exceeding the budget is a window of its own.
+
+        Args:
+            sentences (list[str]): The sentences.
+            pipeline_info (dict[str, str], optional): Transformers pipeline info.
+                Defaults to None.
+
+        Returns:
+            list[list[dict]]: The named entities of each sentence, with the
+                offsets into the sentence.
+        """
+        results = [None] * len(sentences)
+        keys = {}
+        todo = []
+        for idx, sentence in enumerate(sentences):
+            keys[idx], results[idx] = self._get_cached_ner(sentence, pipeline_info)
+            if results[idx] is None:
+                todo.append(idx)
+        if not todo:
+            return results
+        if not hasattr(self, "ner_recognizer"):
+            self.init_transformers(pipeline_info)
+
+        windows = []
+        window_tokens = 0
+        for idx in todo:
+            n_tokens = self._count_tokens(sentences[idx])
+            if windows and window_tokens + n_tokens <= self.ner_pack_tokens:
+                windows[-1].append(idx)
+                window_tokens += n_tokens
+            else:
+                windows.append([idx])
+                window_tokens = n_tokens
+
+        for window in windows:
+            starts = []
+            text = ""
+            for idx in window:
+                if text:
+                    text += " "
+                starts.append(len(text))
+                text += sentences[idx]
+            for idx in window:
+                results[idx] = []
+            for entity in self._recognize(text):
+                pos = bisect.bisect_right(starts, entity["start"]) - 1
+                if entity["start"] >= starts[pos] + len(sentences[window[pos]]):
+                    # starts at the separator
+                    pos += 1
+                if pos >= len(window):
+                    continue
+                offset = starts[pos]
+                sentence = sentences[window[pos]]
+                entity["start"] = max(entity["start"] - offset, 0)
+                if entity["end"] - offset > len(sentence):
+                    # spans the next sentence
+                    entity["end"] = len(sentence)
+                    entity["word"] = sentence[entity["start"] :]  # noqa
+                else:
+                    entity["end"] -= offset
+                if entity["end"] <= entity["start"]:
+                    # only the separator
+                    continue
+                results[window[pos]].append(entity)
+            metrics.observe("ner_batch_size", len(window))
+            # the entities of packed sentences depend on their neighbours
+            if len(window) == 1 and keys[window[0]] is not None:
+                self.ner_cache.put(keys[window[0]], copy.deepcopy(results[window[0]]))
+        return results
+
+    def get_ner_gate_reason(self, sentence: str) -> Optional[str]:
+        """Check with inexpensive signals if a sentence cannot contain
+        named entities, so that NER can be skipped for it.
+
+        Args:
+            sentence (str): The sentence.
+
+        Returns:
+            str|None: The reason to skip NER, None if NER is needed.
+                "redacted" if the words with letters are placeholders,
+                "no_alpha" if no word has letters, "no_content" if the
+                sentence only contains email addresses or links, see
+                utils.TextClassifier, "lowercase" if no word after the
+                first word with letters has uppercase letters (and the
+                sentence is not a single capitalized word).
+        """
+        words = [
+            word for word in sentence.split() if any(char.isalpha() for char in word)
+        ]
+        if not words:
+            return "no_alpha"
+        if not self.text_classifier.has_content(sentence):
+            return "no_content"
+        if all(word.strip(".,;:!?()") in _PLACEHOLDERS for word in words):
+            return "redacted"
+        # the first word is capitalized at the start of a sentence, but a
+        # single capitalized word can be a name, e.g. in a signature
+        if not any(char.isupper() for word in words[1:] for char in word) and (
+            len(words) > 1 or not any(char.isupper() for char in words[0])
+        ):
+            return "lowercase"
+        return None
+
+    def evaluate_ner_gate(
+        self, labelled: list[tuple[str, list[str]]]
+    ) -> dict[str, Any]:
+        """Evaluate the NER gate on labelled sentences, i.e. count the
+        entities in the sentences for which NER would be skipped.
+
+        Args:
+            labelled (list[tuple[str, list[str]]]): The sentences with the
+                words of their named entities.
+
+        Returns:
+            dict[str, Any]: The numbers of sentences and entities,
+                of gated sentences and of missed entities, in total and
+                per reason, and the share of gated sentences and of
+                missed entities.
+        """
+        result = {
+            "sentences": len(labelled),
+            "entities": sum(len(entities) for _, entities in labelled),
+            "gated_sentences": 0,
+            "missed_entities": 0,
+            "reasons": {},
+        }
+        for sentence, entities in labelled:
+            reason = self.get_ner_gate_reason(sentence)
+            if reason is None:
+                continue
+            counts = result["reasons"].setdefault(
+                reason, {"gated_sentences": 0, "missed_entities": 0}
+            )
+            for counter in [result, counts]:
+                counter["gated_sentences"] += 1
+                counter["missed_entities"] += len(entities)
+        result["gated_share"] = (
+            result["gated_sentences"] / result["sentences"] if labelled else 0.0
+        )
+        result["missed_share"] = (
+            result["missed_entities"] / result["entities"]
+            if result["entities"]
+            else 0.0
+        )
+        return result
+
+    def _get_gated_ner(
+        self,
+        sentence: str,
+        pipeline_info: dict[str, str] = None,
+        ner: list[dict] = None,
+    ) -> list[dict]:
+        """Get the named entities of a sentence, unless it is skipped
+        by the NER gate, see get_ner_gate_reason and NER_GATING_MODES.
+        The entities are only retrieved if they are not given."""
+        reason = None
+        if self.ner_gating != "off":
+            reason = self.get_ner_gate_reason(sentence)
+        if reason is not None and self.ner_gating == "on":
+            metrics.inc("ner_gated_sentences", labels={"reason": reason})
+            return []
+        if ner is None:
+            ner = self.get_ner(sentence, pipeline_info)
+        if reason is not None:
+            # eval mode
+            metrics.inc("ner_gated_sentences", labels={"reason": reason})
+            metrics.inc("ner_gate_missed_entities", len(ner), labels={"reason": reason})
         return ner
 
     def _check_pseudonyms_in_content(self, lang: str = "fr"):
@@ -381,6 +925,61 @@ class Pseudonymize:
         """
         return " ".join(sentences)
 
+    def _get_ner_batch(
+        self, sentences: list[str], pipeline_info: dict[str, Any]
+    ) -> list[list[dict]]:
+        if self.ner_pack_tokens:
+            return self.get_ner_packed(sentences, pipeline_info)
+        return [self.get_ner(sentence, pipeline_info) for sentence in sentences]
+
+    def _prefetch_ner(
+        self,
+        known_ner: dict[int, list[dict]],
+        pipeline_info: dict[str, Any],
+        pseudo_emailaddresses: bool,
+        parallel: bool = False,
+    ) -> dict[int, list[dict]]:
+        """Get the named entities of the sentences passed to NER in pseudonymize
+        before rendering them, by sentence index, either packed or in parallel.
+        The sentences with known entities or skipped by the NER gate
+        are left out."""
+        indices = []
+        sentences = []
+        for sent_idx, sent in enumerate(self.sentences):
+            if pseudo_emailaddresses:
+                sent = self.pseudonymize_email_addresses(sent)
+            if sent_idx in known_ner:
+                continue
+            if self.ner_gating == "on" and self.get_ner_gate_reason(sent) is not None:
+                continue
+            indices.append(sent_idx)
+            sentences.append(sent)
+        if not sentences:
+            return {}
+        if not parallel:
+            return dict(zip(indices, self._get_ner_batch(sentences, pipeline_info)))
+
+        # load the model once, before the parallel calls
+        if not hasattr(self, "ner_recognizer"):
+            self.init_transformers(pipeline_info)
+        n_groups = min(len(sentences), self.parallel_groups)
+        size = -(-len(sentences) // n_groups)
+        groups = [
+            sentences[i : i + size] for i in range(0, len(sentences), size)  # noqa
+        ]
+        metrics.inc("ner_parallel_groups", len(groups))
+        recognizers = self._get_worker_recognizers(len(groups))
+        # map keeps the order of the groups
+        results = self.executor.map(
+            lambda recognizer, group: self._get_ner_batch_with(
+                recognizer, group, pipeline_info
+            ),
+            recognizers,
+            groups,
+        )
+        ners = [ner for group_ners in results for ner in group_ners]
+        return dict(zip(indices, ners))
+
     def pseudonymize(
         self,
         text: str,
@@ -417,25 +1016,62 @@ class Pseudonymize:
             str: Pseudonymized text
         """
         self.reset()
-        self.sentences = self.get_sentences(text, language, model)
+        known_ner = {}
+        missing = []
+        if self.quote_cache is None:
+            self.sentences = self.get_sentences(text, language, model)
+        else:
+            self.sentences, known_ner, missing = self._get_segment_analysis(
+                text, language, model, pipeline_info, pseudo_emailaddresses
+            )
+        # named entities of the sentences of segments missing in the quote cache
+        found_ner = {}
+        prefetched_ner = {}
+        parallel = self.executor is not None and len(text) >= self.parallel_min_chars
+        if pseudo_ne and (self.ner_pack_tokens or parallel):
+            prefetched_ner = self._prefetch_ner(
+                known_ner, pipeline_info, pseudo_emailaddresses, parallel
+            )
+        metrics.inc("sentences", len(self.sentences))
         pseudonymized_sentences = []
         for sent_idx, sent in enumerate(self.sentences):
             if pseudo_emailaddresses:
-                sent = self.pseudonymize_email_addresses(sent)
+                with timed(self.timer, "rendering"):
+                    sent = self.pseudonymize_email_addresses(sent)
             if pseudo_ne:
-                ner = self.get_ner(sent, pipeline_info)
-                sent = (
-                    " ".join(
-                        self.pseudonymize_ne(
-                            ner, sent, language, sent_idx, prev_ne_list=prev_ne_list
+                if sent_idx in known_ner:
+                    ner = known_ner[sent_idx]
+                else:
+                    ner = self._get_gated_ner(
+                        sent, pipeline_info, prefetched_ner.get(sent_idx)
+                    )
+                    if missing:
+                        found_ner[sent_idx] = copy.deepcopy(ner)
+                with timed(self.timer, "rendering"):
+                    sent = (
+                        " ".join(
+                            self.pseudonymize_ne(
+                                ner, sent, language, sent_idx, prev_ne_list=prev_ne_list
+                            )
                         )
+                        if ner
+                        else sent
                     )
-                    if ner
-                    else sent
-                )
             if pseudo_numbers:
-                sent = self.pseudonymize_numbers(sent, detected_dates)
+                with timed(self.timer, "rendering"):
+                    sent = self.pseudonymize_numbers(sent, detected_dates)
             pseudonymized_sentences.append(sent)
+        if pseudo_ne:
+            # NER was not run for the segments without pseudonymizing entities
+            for key, start, end, segment_tokens in missing:
+                self.quote_cache.put(
+                    key,
+                    {
+                        "sentences": self.sentences[start:end],
+                        "ner": [found_ner.get(i) for i in range(start, end)],
+                        "n_tokens": segment_tokens,
+                    },
+                )
         # check that pseudonyms are not the same as actual
         # names in the current content
         # if they are, the pseudonym is dropped for the present and all future content
@@ -486,26 +1122,27 @@ class Pseudonymize:
         self.reset()
         self.sentences = sentences
         pseudonymized_sentences = []
-        for sent_idx, sent in enumerate(sentences):
-            if pseudo_emailaddresses:
-                sent = self.pseudonymize_email_addresses(sent)
-            if pseudo_ne:
-                sent = (
-                    " ".join(
-                        self.pseudonymize_ne(
-                            ne_sent_dict[str(sent_idx)],
-                            sent,
-                            language,
-                            sent_idx,
-                            prev_ne_list=prev_ne_list,
+        with timed(self.timer, "rendering"):
+            for sent_idx, sent in enumerate(sentences):
+                if pseudo_emailaddresses:
+                    sent = self.pseudonymize_email_addresses(sent)
+                if pseudo_ne:
+                    sent = (
+                        " ".join(
+                            self.pseudonymize_ne(
+                                ne_sent_dict[str(sent_idx)],
+                                sent,
+                                language,
+                                sent_idx,
+                                prev_ne_list=prev_ne_list,
+                            )
                         )
+                        if str(sent_idx) in ne_sent_dict
+                        else sent
                     )
-                    if str(sent_idx) in ne_sent_dict
-                    else sent
-                )
-            if pseudo_numbers:
-                sent = self.pseudonymize_numbers(sent, detected_dates)
-            pseudonymized_sentences.append(sent)
+                if pseudo_numbers:
+                    sent = self.pseudonymize_numbers(sent, detected_dates)
+                pseudonymized_sentences.append(sent)
         # check that pseudonyms are not the same as actual
         # names in the current content
         # if they are, the pseudonym is dropped for the present and all future content
@@ -0,0 +1,246 @@
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+# marks the end of the stream between stages
+_END = object()
+
+
+class StageStats:
+    """Timing counters of a single pipeline stage.
+
+    Args:
+        name (str): The name of the stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        # time spent doing the actual work of the stage
+        self.busy_time = 0.0
+        # time blocked on an empty input queue, i.e. the stage is starved
+        self.wait_input_time = 0.0
+        # time blocked on a full output queue, i.e. backpressure from downstream
+        self.wait_output_time = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "busy_time": self.busy_time,
+            "wait_input_time": self.wait_input_time,
+            "wait_output_time": self.wait_output_time,
+        }
+
+
+class QueueStats:
+    """Depth statistics of a bounded queue between two stages.
+    The depth is sampled every time an item is put into the queue.
+
+    Args:
+        name (str): The name of the queue.
+        maxsize (int): The capacity of the queue.
+    """
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self.samples = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.full_count = 0
+
+    def sample(self, depth: int):
+        self.samples += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+        if depth >= self.maxsize:
+            self.full_count += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "maxsize": self.maxsize,
+            "mean_depth": self.depth_sum / self.samples if self.samples else 0.0,
+            "max_depth": self.max_depth,
+            "full_count": self.full_count,
+        }
+
+
+class PipelinedExecutor:
+    """Run read, process and write stages of a workflow concurrently.
+
+    The read stage pulls items from the source iterable and the write stage
+    consumes the processed items, each in its own background thread.
+    The process stage runs in the calling thread, so that models are used
+    from a single thread only. The stages are connected by bounded queues:
+    a slow stage blocks its upstream stage instead of accumulating items
+    in memory.
+
+    Args:
+        process_fn (Callable[[Any], Any]): Function applied to each item
+            in the calling thread.
+        write_fn (Callable[[Any], None]): Function consuming each processed item
+            in the writer thread.
+        queue_size (int, optional): Capacity of the queues between the stages.
+            Defaults to 8.
+        close_fn (Callable[[], None], optional): Function called in the writer
+            thread after the last item has been written. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[Any], Any],
+        write_fn: Callable[[Any], None],
+        queue_size: int = 8,
+        close_fn: Callable[[], None] = None,
+    ):
+        if queue_size < 1:
+            raise ValueError("The queue size must be a positive integer.")
+        self.process_fn = process_fn
+        self.write_fn = write_fn
+        self.close_fn = close_fn
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def _put(self, q: queue.Queue, item: Any, q_stats: QueueStats) -> bool:
+        """Put an item into a queue, giving up if the pipeline is stopped.
+
+        Returns:
+            bool: True if the item was put into the queue, False otherwise.
+        """
+        q_stats.sample(q.qsize())
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Get an item from a queue, returning _END if the pipeline is stopped."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error: BaseException):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _read(self, items: Iterable, out_q: queue.Queue, q_stats: QueueStats):
+        stats = self._stage_stats["read"]
+        try:
+            iterator = iter(items)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                mid = time.perf_counter()
+                if not self._put(out_q, item, q_stats):
+                    return
+                stats.busy_time += mid - start
+                stats.wait_output_time += time.perf_counter() - mid
+                stats.items += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(out_q, _END, q_stats)
+
+    def _write(self, in_q: queue.Queue):
+        stats = self._stage_stats["write"]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(in_q)
+                mid = time.perf_counter()
+                stats.wait_input_time += mid - start
+                if item is _END:
+                    break
+                self.write_fn(item)
+                stats.busy_time += time.perf_counter() - mid
+                stats.items += 1
+            if self.close_fn is not None and not self._stop.is_set():
+                start = time.perf_counter()
+                self.close_fn()
+                stats.busy_time += time.perf_counter() - start
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, items: Iterable) -> dict[str, Any]:
+        """Run the pipeline over all items of the source.
+
+        Args:
+            items (Iterable): The source items, e.g. a lazy iterator
+                reading and parsing input files.
+
+        Returns:
+            dict[str, Any]: Statistics per stage and per queue, and the name
+                of the bottleneck stage, i.e. the stage with the longest busy time.
+        """
+        self._stop = threading.Event()
+        self._errors = []
+        self._stage_stats = {
+            name: StageStats(name) for name in ("read", "process", "write")
+        }
+        read_q = queue.Queue(maxsize=self.queue_size)
+        write_q = queue.Queue(maxsize=self.queue_size)
+        queue_stats = {
+            "read": QueueStats("read", self.queue_size),
+            "write": QueueStats("write", self.queue_size),
+        }
+
+        reader = threading.Thread(
+            target=self._read,
+            args=(items, read_q, queue_stats["read"]),
+            name="mailcom-reader",
+            daemon=True,
+        )
+        writer = threading.Thread(
+            target=self._write, args=(write_q,), name="mailcom-writer", daemon=True
+        )
+        reader.start()
+        writer.start()
+
+        stats = self._stage_stats["process"]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(read_q)
+                mid = time.perf_counter()
+                stats.wait_input_time += mid - start
+                if item is _END:
+                    break
+                result = self.process_fn(item)
+                end = time.perf_counter()
+                stats.busy_time += end - mid
+                stats.items += 1
+                if not self._put(write_q, result, queue_stats["write"]):
+                    break
+                stats.wait_output_time += time.perf_counter() - end
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(write_q, _END, queue_stats["write"])
+            writer.join()
+            # unblock the reader if processing stopped early
+            self._stop.set()
+            reader.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        stage_stats = {name: s.as_dict() for name, s in self._stage_stats.items()}
+        self.stats = {
+            "stages": stage_stats,
+            "queues": {name: q.as_dict() for name, q in queue_stats.items()},
+            "bottleneck": max(
+                stage_stats, key=lambda name: stage_stats[name]["busy_time"]
+            ),
+        }
+        return self.stats
@@ -0,0 +1,234 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+# modules of mailcom for which the allocating lines are reported
+DEFAULT_ALLOC_FILES = ["parse.py", "time_detector.py", "inout.py"]
+# the directory of the mailcom modules
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StackSampler:
+    """Sample the call stack of a thread at regular intervals and count
+    the collapsed stacks, in the format used by flame graph tools
+    (e.g. flamegraph.pl, speedscope): "root;caller;callee count".
+
+    Args:
+        thread_id (int): The identifier of the thread to sample.
+        interval (float, optional): The sampling interval in seconds.
+            Defaults to 0.005.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+    def sample(self):
+        """Record the current stack of the sampled thread once."""
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            names.append(self._frame_name(frame))
+            frame = frame.f_back
+        if names:
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="mailcom-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """Get the sampled stacks in collapsed format, one stack per line."""
+        return "".join(
+            "{} {}\n".format(stack, count)
+            for stack, count in sorted(self.stacks.items())
+        )
+
+
+class RunProfiler:
+    """Profile a run of the workflow with cProfile and tracemalloc.
+
+    Either the whole run or every Nth email is profiled. For each profile
+    the following files are written to the output directory:
+    + .pstats: cProfile statistics, e.g. for pstats or snakeviz
+    + .collapsed: sampled collapsed stacks for flame graphs
+    + _report.txt: the functions with the highest cumulative time and
+    the top allocating lines in the mailcom modules of alloc_files
+
+    cProfile and the stack sampler only cover the thread entering the
+    profile, i.e. not the reader and writer threads of
+    process_data_pipelined nor the worker threads of "intra_email_workers".
+    The allocations are traced in all threads.
+
+    Args:
+        out_dir (str): The directory to write the profiles to.
+        every_n (int, optional): Profile every Nth email instead of the
+            whole run if larger than 0. Defaults to 0.
+        top_n (int, optional): The number of functions and lines in the report.
+            Defaults to 20.
+        alloc_files (list[str], optional): The file names for which the
+            allocating lines are reported. Defaults to parse.py, time_detector.py
+            and inout.py.
+        sample_interval (float, optional): The sampling interval for the
+            collapsed stacks in seconds. Defaults to 0.005.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        every_n: int = 0,
+        top_n: int = 20,
+        alloc_files: list[str] = None,
+        sample_interval: float = 0.005,
+    ):
+        self.out_dir = Path(out_dir)
+        self.every_n = every_n
+        self.top_n = top_n
+        self.alloc_files = alloc_files if alloc_files else DEFAULT_ALLOC_FILES
+        self.sample_interval = sample_interval
+        now = datetime.now()
+        self.prefix = "profile_{}".format(
+            now.strftime("%Y%m%d_%H%M%S.") + now.strftime("%f")[:3]
+        )
+        self.reports = []
+
+    @contextmanager
+    def profile(self, name: str):
+        """Profile the code in the context and write the results.
+
+        Args:
+            name (str): The name of the profile, used in the file names.
+        """
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        # do not interfere with an already running tracemalloc
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        profiler = cProfile.Profile()
+        sampler.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self.reports.append(self._write(name, profiler, sampler, snapshot, peak))
+
+    def run(self):
+        """Context manager for the whole run, profiled if every_n is 0."""
+        if self.every_n > 0:
+            return nullcontext()
+        return self.profile("run")
+
+    def email(self, email_idx: int):
+        """Context manager for a single email, profiled if it is an Nth email.
+
+        Args:
+            email_idx (int): The index of the email in the run.
+        """
+        if self.every_n <= 0 or email_idx % self.every_n != 0:
+            return nullcontext()
+        return self.profile("email_{}".format(email_idx))
+
+    def top_allocations(
+        self, snapshot: tracemalloc.Snapshot
+    ) -> list[tuple[str, int, int]]:
+        """Get the lines of the alloc_files that allocated most memory.
+        Only the files in the mailcom package are considered, not files
+        with the same name elsewhere, e.g. urllib/parse.py.
+
+        Args:
+            snapshot (tracemalloc.Snapshot): The tracemalloc snapshot.
+
+        Returns:
+            list[tuple[str, int, int]]: The location "file:line",
+                the allocated size in bytes and the number of allocated blocks.
+        """
+        filters = [
+            tracemalloc.Filter(True, os.path.join(PACKAGE_DIR, file_name))
+            for file_name in self.alloc_files
+        ]
+        stats = snapshot.filter_traces(filters).statistics("lineno")
+        return [
+            (
+                "{}:{}".format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                stat.size,
+                stat.count,
+            )
+            for stat in stats[: self.top_n]
+        ]
+
+    def _write(
+        self,
+        name: str,
+        profiler: cProfile.Profile,
+        sampler: StackSampler,
+        snapshot: tracemalloc.Snapshot,
+        peak: int,
+    ) -> dict[str, Any]:
+        base = self.out_dir / "{}_{}".format(self.prefix, name)
+        pstats_path = base.with_name(base.name + ".pstats")
+        collapsed_path = base.with_name(base.name + ".collapsed")
+        report_path = base.with_name(base.name + "_report.txt")
+
+        profiler.dump_stats(pstats_path)
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            f.write(sampler.collapsed())
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.top_n)
+        allocations = self.top_allocations(snapshot)
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("Peak traced memory: {} bytes\n\n".format(peak))
+            f.write("Top allocating lines in {}:\n".format(", ".join(self.alloc_files)))
+            for location, size, count in allocations:
+                f.write("{}: {} bytes in {} blocks\n".format(location, size, count))
+            f.write("\n")
+            f.write(stream.getvalue())
+
+        print("The profile {} has been saved to {}".format(name, report_path))
+        return {
+            "name": name,
+            "pstats": pstats_path,
+            "collapsed": collapsed_path,
+            "report": report_path,
+            "peak_memory": peak,
+            "top_allocations": allocations,
+        }
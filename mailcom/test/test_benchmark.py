@@ -0,0 +1,91 @@
+import csv
+import json
+from mailcom import benchmark
+from mailcom.corpus_generator import CorpusGenerator
+
+
+def test_split_csv(tmp_path):
+    path = CorpusGenerator().write_csv(tmp_path / "corpus.csv", 5)
+    shards = benchmark._split_csv(path, 2, tmp_path)
+    n_rows = []
+    for shard in shards:
+        with open(shard, "r", newline="", encoding="utf-8") as f:
+            n_rows.append(len(list(csv.DictReader(f))))
+    assert n_rows == [3, 2]
+
+
+def test_get_peak_rss_mb():
+    peak = benchmark.get_peak_rss_mb()
+    if benchmark.resource is not None:
+        assert peak > 0
+    else:
+        assert peak is None
+
+
+def test_compare_results():
+    baseline = {
+        "results": [
+            {
+                "n_emails": 10,
+                "n_workers": 1,
+                "emails_per_second": 10.0,
+                "latency_p50": 0.1,
+                "latency_p95": 0.2,
+                "peak_rss_mb": 500.0,
+            }
+        ]
+    }
+    same = json.loads(json.dumps(baseline))
+    assert benchmark.compare_results(same, baseline, 0.1) == []
+    # small changes are tolerated
+    same["results"][0]["emails_per_second"] = 9.5
+    assert benchmark.compare_results(same, baseline, 0.1) == []
+    slower = json.loads(json.dumps(baseline))
+    slower["results"][0]["emails_per_second"] = 5.0
+    slower["results"][0]["peak_rss_mb"] = 800.0
+    regressions = benchmark.compare_results(slower, baseline, 0.1)
+    assert len(regressions) == 2
+    assert "emails_per_second" in regressions[0]
+    assert "peak_rss_mb" in regressions[1]
+    # faster is not a regression, unknown cases are skipped
+    faster = json.loads(json.dumps(baseline))
+    faster["results"][0]["emails_per_second"] = 50.0
+    faster["results"].append({"n_emails": 100, "n_workers": 2})
+    assert benchmark.compare_results(faster, baseline, 0.1) == []
+
+
+def test_run_benchmark(tmp_path):
+    # no fields are pseudonymized, so that no models are loaded
+    settings = {
+        "default_lang": "fr",
+        "datetime_detection": False,
+        "pseudo_fields": [],
+    }
+    results = benchmark.run_benchmark([4], [1, 2], settings, str(tmp_path))
+    assert results["meta"]["settings"] == settings
+    assert len(results["results"]) == 2
+    for result in results["results"]:
+        assert result["n_emails"] == 4
+        assert result["emails_per_second"] > 0
+        assert result["latency_p50"] <= result["latency_p99"]
+    assert (tmp_path / "n4_w2" / "out_1.csv").exists()
+    assert benchmark.compare_results(results, results) == []
+
+
+def test_make_giant_email():
+    content = benchmark.make_giant_email(5000, seed=1)
+    assert len(content) >= 5000
+    assert content == benchmark.make_giant_email(5000, seed=1)
+
+
+def test_run_intra_email_benchmark():
+    # no named entities are pseudonymized, so that only spaCy is loaded
+    settings = {"datetime_detection": False, "pseudo_ne": False}
+    results = benchmark.run_intra_email_benchmark(3000, [1, 2], settings)
+    assert results["meta"]["settings"] == settings
+    assert [r["n_workers"] for r in results["results"]] == [1, 2]
+    assert results["results"][0]["speedup"] == 1.0
+    for result in results["results"]:
+        assert result["n_chars"] >= 3000
+        assert result["seconds"] > 0
+        assert result["identical"]
@@ -0,0 +1,109 @@
+import pytest
+from mailcom import benchmark_matrix
+from mailcom.corpus_generator import CorpusGenerator
+
+
+def test_get_configurations():
+    matrix = {"lang_detection_lib": ["langid", "trans"], "time_parsing": ["strict"]}
+    configs = benchmark_matrix.get_configurations(matrix)
+    assert configs == [
+        {"lang_detection_lib": "langid", "time_parsing": "strict"},
+        {"lang_detection_lib": "trans", "time_parsing": "strict"},
+    ]
+    assert (
+        len(benchmark_matrix.get_configurations(benchmark_matrix.DEFAULT_MATRIX)) == 6
+    )
+
+
+def test_describe():
+    config = {
+        "lang_detection_lib": "langid",
+        "ner_pipeline": {"task": "token-classification", "model": "my-ner"},
+        "lang_pipeline": None,
+    }
+    assert benchmark_matrix.describe(config) == "langid/my-ner/default"
+
+
+def test_f1_score():
+    scores = benchmark_matrix.f1_score(["a", "a", "b"], ["a", "c"])
+    assert scores["tp"] == 1
+    assert scores["precision"] == pytest.approx(1 / 3)
+    assert scores["recall"] == pytest.approx(0.5)
+    assert scores["f1"] == pytest.approx(0.4)
+    assert benchmark_matrix.f1_score([], [])["f1"] == 1.0
+    assert benchmark_matrix.f1_score(["a"], [])["f1"] == 0.0
+
+
+def test_evaluate():
+    labelled = [
+        {
+            "language": "fr",
+            "labels": {"dates": ["14 mars 2025"], "entities": [("PER", "Marie")]},
+        },
+        {"language": "es", "labels": {"dates": [], "entities": [("LOC", "Madrid")]}},
+    ]
+    processed = [
+        {
+            "lang": {"content": "fr"},
+            "detected_datetime": {"content": ["14 mars 2025"]},
+            "ne_list": {"content": [{"entity_group": "PER", "word": "Marie"}]},
+        },
+        {
+            "lang": {"content": "pt"},
+            "detected_datetime": {"content": None},
+            # same entity as in the first email does not count
+            "ne_list": {"content": [{"entity_group": "PER", "word": "Marie"}]},
+        },
+    ]
+    scores = benchmark_matrix.evaluate(processed, labelled)
+    assert scores["lang_accuracy"] == 0.5
+    assert scores["date_f1"] == 1.0
+    assert scores["entity_precision"] == 0.5
+    assert scores["entity_recall"] == 0.5
+
+
+def test_select_cheapest_format_table():
+    rows = [
+        {
+            "configuration": "langid/strict",
+            "emails_per_second": 10.0,
+            "lang_accuracy": 0.9,
+            "date_f1": 0.8,
+            "entity_f1": 0.7,
+        },
+        {
+            "configuration": "trans/strict",
+            "emails_per_second": 2.0,
+            "lang_accuracy": 0.99,
+            "date_f1": 0.8,
+            "entity_f1": 0.7,
+        },
+        {"configuration": "trans/non-strict", "error": "model not found"},
+    ]
+    best = benchmark_matrix.select_cheapest(rows)
+    assert best["configuration"] == "langid/strict"
+    best = benchmark_matrix.select_cheapest(rows, min_lang_accuracy=0.95)
+    assert best["configuration"] == "trans/strict"
+    assert benchmark_matrix.select_cheapest(rows, min_entity_f1=0.9) is None
+    table = benchmark_matrix.format_table(rows).split("\n")
+    assert len(table) == 5
+    assert table[0].startswith("configuration")
+    assert "error: model not found" in table[4]
+
+
+def test_run_matrix():
+    generator = CorpusGenerator(seed=0, languages=["fr", "es"])
+    labelled = [generator.generate_email(i) for i in range(3)]
+    rows = benchmark_matrix.run_matrix(
+        labelled,
+        {"lang_detection_lib": ["langid"], "time_parsing": ["strict", "non-strict"]},
+    )
+    assert [row["configuration"] for row in rows] == [
+        "langid/strict",
+        "langid/non-strict",
+    ]
+    for row in rows:
+        assert "error" not in row
+        assert row["n_emails"] == 3
+        assert 0 <= row["lang_accuracy"] <= 1
+        assert 0 <= row["date_f1"] <= 1
@@ -0,0 +1,73 @@
+import pytest
+from mailcom import boilerplate, metrics
+
+SIGNATURE = "Marie Dupont\nService RH\nTél. 01 23 45 67 89"
+
+
+@pytest.fixture()
+def get_index():
+    index = boilerplate.BoilerplateIndex(n_lines=2, min_count=3)
+    for i in range(3):
+        index.add("Bonjour,\nMessage numéro {}.\n{}".format(i, SIGNATURE))
+    return index
+
+
+def test_boilerplate_index_init():
+    with pytest.raises(ValueError):
+        boilerplate.BoilerplateIndex(n_lines=0)
+    with pytest.raises(ValueError):
+        boilerplate.BoilerplateIndex(min_count=0)
+
+
+def test_is_boilerplate(get_index):
+    lines = ["Salut,", "Autre message.", *SIGNATURE.split("\n")]
+    assert get_index.is_boilerplate(lines) == [False, False, True, True, True]
+    # a single line of the signature is shorter than the n-grams
+    assert get_index.is_boilerplate(["Service RH"]) == [False]
+    assert get_index.is_boilerplate([]) == []
+
+
+def test_split(get_index):
+    metrics.REGISTRY.reset()
+    content = (
+        "Salut,\nAutre message.\n> Marie  Dupont\n> Service RH\nTél. 01 23 45 67 89"
+    )
+    assert get_index.split(content) == [
+        ("Salut,\nAutre message.", False),
+        ("Marie  Dupont\nService RH\nTél. 01 23 45 67 89", True),
+    ]
+    assert metrics.REGISTRY.get("boilerplate_segments") == 1
+    assert get_index.split("Salut,\nAutre message.") == [
+        ("Salut,\nAutre message.", False)
+    ]
+
+
+def test_stats(get_index):
+    # "Bonjour,\nMessage ..." differ in each text
+    assert get_index.stats() == {"texts": 3, "ngrams": 8, "boilerplate_ngrams": 2}
+    get_index.add("Bonjour,\nMessage numéro 0.")
+    assert get_index.stats()["boilerplate_ngrams"] == 2
+
+
+def test_max_size():
+    index = boilerplate.BoilerplateIndex(n_lines=1, min_count=2, max_size=3)
+    index.add("a\nb")
+    index.add("a\nc")
+    assert index.stats()["ngrams"] == 3
+    # the n-grams with the lowest counts are dropped
+    index.add("d")
+    assert index.stats() == {"texts": 3, "ngrams": 1, "boilerplate_ngrams": 1}
+    assert index.is_boilerplate(["a", "b"]) == [True, False]
+
+
+def test_max_size_frequent():
+    index = boilerplate.BoilerplateIndex(n_lines=1, min_count=2, max_size=4)
+    index.add("a\nb\nc")
+    index.add("a\nb\nc")
+    index.add("a\nd\ne")
+    # n-grams seen twice are dropped too, down to half of the budget
+    assert index.stats() == {"texts": 3, "ngrams": 2, "boilerplate_ngrams": 2}
+    assert index.is_boilerplate(["a", "b", "c"]) == [True, True, False]
+    for i in range(20):
+        index.add("line {}\nother line {}".format(i, i))
+        assert index.stats()["ngrams"] <= 4
@@ -0,0 +1,128 @@
+import pytest
+import threading
+from mailcom import cache, metrics
+
+
+@pytest.fixture()
+def get_cache():
+    return cache.LRUCache(max_size=3, name="test")
+
+
+def test_text_key():
+    key = cache.text_key("Envoyé de mon iPhone", "langid")
+    assert key.startswith("langid|")
+    # whitespace is normalised
+    assert cache.text_key("  Envoyé de\nmon   iPhone\n", "langid") == key
+    assert cache.text_key("Envoyé de mon iPhone", "langdetect") != key
+    assert cache.text_key("Von meinem iPhone gesendet", "langid") != key
+    assert cache.text_key("envoyé de mon iphone", "langid") != key
+
+    # exact text, e.g. for results with offsets
+    assert cache.text_key(" Envoyé de mon iPhone", "ner", normalise=False) != (
+        cache.text_key("Envoyé de mon iPhone", "ner", normalise=False)
+    )
+
+
+def test_lru_cache_init():
+    with pytest.raises(ValueError):
+        cache.LRUCache(max_size=0)
+
+
+def test_lru_cache_get_put(get_cache):
+    assert get_cache.get("a") is None
+    assert get_cache.get("a", "default") == "default"
+    get_cache.put("a", 1)
+    assert get_cache.get("a") == 1
+    assert "a" in get_cache
+    assert len(get_cache) == 1
+    get_cache.put("a", 2)
+    assert get_cache.get("a") == 2
+    assert len(get_cache) == 1
+
+
+def test_lru_cache_eviction(get_cache):
+    for key in ["a", "b", "c"]:
+        get_cache.put(key, key)
+    # a is used recently, so that b is dropped
+    get_cache.get("a")
+    get_cache.put("d", "d")
+    assert "b" not in get_cache
+    assert all(key in get_cache for key in ["a", "c", "d"])
+    assert len(get_cache) == 3
+
+
+def test_lru_cache_stats(get_cache):
+    metrics.REGISTRY.reset()
+    get_cache.put("a", 1)
+    get_cache.get("a")
+    get_cache.get("a")
+    get_cache.get("b")
+    assert get_cache.stats() == {"size": 1, "hits": 2, "misses": 1, "hit_rate": 2 / 3}
+    assert metrics.REGISTRY.get("cache_hits", {"cache": "test"}) == 2
+    assert metrics.REGISTRY.get("cache_misses", {"cache": "test"}) == 1
+    rates = metrics.REGISTRY.snapshot()["rates"]
+    assert rates['cache_hit_rate{cache="test"}'] == 2 / 3
+    get_cache.clear()
+    assert get_cache.stats() == {"size": 0, "hits": 0, "misses": 0, "hit_rate": 0.0}
+
+
+def test_lru_cache_save_load(get_cache, tmp_path):
+    with pytest.raises(ValueError):
+        get_cache.save()
+    for key in ["a", "b", "c"]:
+        get_cache.put(key, [["fr", 0.9]])
+    get_cache.get("a")
+    get_cache.save(tmp_path / "cache.json")
+
+    loaded = cache.LRUCache(max_size=3, path=tmp_path / "cache.json")
+    assert len(loaded) == 3
+    assert loaded.get("b") == [["fr", 0.9]]
+    # the order of use is kept, b and a were used last
+    loaded.put("d", 1)
+    assert "c" not in loaded
+    loaded.save()
+    assert len(cache.LRUCache(path=tmp_path / "cache.json")) == 3
+    # no file yet
+    assert len(cache.LRUCache(path=tmp_path / "new" / "cache.json")) == 0
+
+
+def test_lru_cache_threads():
+    lru_cache = cache.LRUCache(max_size=50)
+
+    def work(offset):
+        for i in range(200):
+            lru_cache.put(str(offset + i), i)
+            lru_cache.get(str(offset + i // 2))
+
+    threads = [threading.Thread(target=work, args=(k * 1000,)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(lru_cache) == 50
+    assert lru_cache.hits + lru_cache.misses == 800
+
+
+def test_lru_cache_spill(tmp_path):
+    spill_path = tmp_path / "spill" / "ner.sqlite"
+    lru_cache = cache.LRUCache(max_size=2, spill_path=spill_path)
+    for key in ["a", "b", "c"]:
+        lru_cache.put(key, [{"word": key, "score": 0.5}])
+    assert len(lru_cache) == 2
+    # a is moved to the spill file and loaded back
+    assert "a" in lru_cache
+    assert lru_cache.get("a") == [{"word": "a", "score": 0.5}]
+    assert lru_cache.stats()["hits"] == 1
+    assert len(lru_cache) == 2
+    assert lru_cache.get("d") is None
+
+    # the entries in memory are kept in the spill file when closing
+    lru_cache.close()
+    lru_cache.close()
+    reopened = cache.LRUCache(max_size=2, spill_path=spill_path)
+    assert len(reopened) == 0
+    for key in ["a", "b", "c"]:
+        assert reopened.get(key) == [{"word": key, "score": 0.5}]
+    reopened.clear()
+    assert "a" not in reopened
+    reopened.close()
@@ -0,0 +1,103 @@
+import pytest
+from mailcom import corpus_generator
+from mailcom.corpus_generator import CorpusGenerator
+from mailcom.main import get_input_handler
+from datetime import datetime
+
+
+def test_format_date():
+    dt = datetime(2024, 4, 17, 17, 23)
+    assert corpus_generator.format_date(dt, "fr", 0) == "17 avril 2024"
+    assert corpus_generator.format_date(dt, "es", 1) == "mié., 17 abr. 2024"
+    assert corpus_generator.format_date(dt, "de", 1) == "17. April 2024 um 17:23"
+    assert corpus_generator.format_date(dt, "en", 0) == "April 17th 2024"
+    # the numeric formats follow the language specific ones
+    assert corpus_generator.format_date(dt, "pt", 1) == "17.04.2024"
+
+
+def test_generator_invalid():
+    with pytest.raises(ValueError):
+        CorpusGenerator(languages=["xx"])
+    with pytest.raises(ValueError):
+        CorpusGenerator(unknown_option=1)
+    with pytest.raises(ValueError):
+        corpus_generator.generate_corpus("out", 1, fmt="xml")
+
+
+def test_generate_email_deterministic():
+    emails = [CorpusGenerator(seed=3).generate_email(i) for i in range(20)]
+    again = [CorpusGenerator(seed=3).generate_email(i) for i in range(20)]
+    other = [CorpusGenerator(seed=4).generate_email(i) for i in range(20)]
+    assert emails == again
+    assert emails != other
+    for email in emails:
+        assert email["language"] in corpus_generator.LANGUAGES
+        assert email["attachment"] == len(email["attachment type"])
+
+
+def test_generate_email_options():
+    generator = CorpusGenerator(
+        languages=["de"],
+        html_share=1.0,
+        reply_share=1.0,
+        attachment_share=0.0,
+        date_density=1.0,
+        name_density=0.0,
+        email_density=0.0,
+        number_density=0.0,
+    )
+    email = generator.generate_email(0)
+    assert email["language"] == "de"
+    assert email["html"]
+    assert email["attachment"] == 0
+    assert "\n> " in email["content"]
+    assert email["subject"].startswith("AW: ")
+
+
+def test_write_files(tmp_path):
+    generator = CorpusGenerator(seed=1, html_share=0.5, attachment_share=1.0)
+    paths = generator.write_files(tmp_path / "corpus", 6)
+    assert len(paths) == 6
+    assert {p.suffix for p in paths} == {".eml", ".html"}
+    # same files for the same seed
+    again = generator.write_files(tmp_path / "again", 6)
+    assert [p.read_bytes() for p in paths] == [p.read_bytes() for p in again]
+    inout_hl = get_input_handler(tmp_path / "corpus", in_type="dir")
+    emails = sorted(inout_hl.get_email_list(), key=lambda e: e["file_name"])
+    generated = [generator.generate_email(i) for i in range(6)]
+    for email, expected in zip(emails, generated):
+        assert email["subject"] == expected["subject"]
+        assert email["attachment"] == expected["attachment"]
+        assert "<p>" not in email["content"]
+        first_line = expected["content"].split("\n")[0]
+        assert first_line in email["content"]
+
+
+def test_write_csv(tmp_path):
+    path = corpus_generator.generate_corpus(
+        tmp_path / "corpus.csv", 5, fmt="csv", seed=2
+    )
+    inout_hl = get_input_handler(
+        path, in_type="csv", col_names=corpus_generator.CSV_COL_NAMES
+    )
+    emails = list(inout_hl.get_email_list())
+    generated = [CorpusGenerator(seed=2).generate_email(i) for i in range(5)]
+    assert [e["content"] for e in emails] == [g["content"] for g in generated]
+    assert [e["subject"] for e in emails] == [g["subject"] for g in generated]
+    # same file for the same seed
+    again = corpus_generator.generate_corpus(tmp_path / "again.csv", 5, "csv", 2)
+    assert path.read_bytes() == again.read_bytes()
+
+
+def test_generate_email_labels():
+    generator = CorpusGenerator(seed=5, reply_share=0.5)
+    for idx in range(20):
+        email = generator.generate_email(idx)
+        labels = email["labels"]
+        # the labels appear in the content in order
+        pos = 0
+        for date in labels["dates"]:
+            pos = email["content"].index(date, pos)
+        for group, word in labels["entities"]:
+            assert group in ["PER", "LOC"]
+            assert word in email["content"]
@@ -1,4 +1,5 @@
 from mailcom import inout
+from mailcom import metrics
 import pytest
 from pathlib import Path
 from importlib import resources
@@ -74,6 +75,57 @@ def test_write_file(get_instant, tmp_path, get_xml_content):
         get_instant.write_file("", tmp_path / "test.txt")
 
 
+def test_email_stream_writer_xml(get_instant, tmp_path, get_xml_content):
+    writer = inout.EmailStreamWriter(tmp_path / "test.xml")
+    for email in get_xml_content:
+        writer.write(email)
+    writer.close()
+    writer.close()
+    # the same file as written at once
+    assert filecmp.cmp(XML_PATH, tmp_path / "test.xml")
+    with pytest.raises(ValueError):
+        inout.EmailStreamWriter(tmp_path / "test.txt")
+
+
+def test_email_stream_writer_csv(get_instant, tmp_path):
+    emails = [
+        {"content": "Content of test email 1", "attachment": 1, "date": None},
+        {
+            "content": "Content of test email 2",
+            "attachment": 0,
+            "date": float("nan"),
+            "pseudo_content": "Pseudonymized email 2",
+            "other": "dropped",
+        },
+    ]
+    csv_file = tmp_path / "test.csv"
+    writer = inout.EmailStreamWriter(csv_file, ["pseudo_content"])
+    writer.write(emails[0])
+    with pytest.warns(UserWarning):
+        writer.write(emails[1])
+    writer.close()
+    assert writer.n_emails == 2
+    with open(csv_file, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == ["content", "attachment", "date", "pseudo_content"]
+    assert rows[0]["pseudo_content"] == ""
+    assert rows[1]["pseudo_content"] == "Pseudonymized email 2"
+    # missing values are empty, as with pandas
+    assert rows[0]["date"] == rows[1]["date"] == ""
+    assert rows[1]["attachment"] == "0"
+    # the same file as written at once if all emails have the same keys
+    get_instant.email_list = [
+        {"content": "Content of test email {}".format(i), "attachment": i}
+        for i in range(3)
+    ]
+    get_instant.write_csv(tmp_path / "pandas.csv")
+    writer = inout.EmailStreamWriter(tmp_path / "stream.csv")
+    for email in get_instant.email_list:
+        writer.write(email)
+    writer.close()
+    assert filecmp.cmp(tmp_path / "pandas.csv", tmp_path / "stream.csv", shallow=False)
+
+
 def test_extract_email_info(get_instant, tmp_path):
     # Test with a valid email file
     email_info = get_instant.extract_email_info(FILE_PATH)
@@ -129,6 +181,34 @@ def test_process_emails(get_instant, tmp_path):
     assert "Content of test email" in get_instant.email_list[1]["content"]
 
 
+def test_iter_emails(get_instant, tmp_path):
+    email_file_1 = tmp_path / "test1.eml"
+    email_file_1.write_text("Content of test email 1")
+    email_file_2 = tmp_path / "test2.eml"
+    email_file_2.write_text("Content of test email 2")
+    get_instant.list_of_files(tmp_path)
+
+    emails = get_instant.iter_emails()
+    # emails are extracted lazily and not stored
+    assert get_instant.email_list == []
+    emails = list(emails)
+    assert len(emails) == 2
+    assert "Content of test email" in emails[0]["content"]
+    assert get_instant.email_list == []
+
+
+def test_bytes_metrics(get_instant, tmp_path):
+    email_file = tmp_path / "test1.eml"
+    email_file.write_text("Content of test email 1")
+    read_before = metrics.REGISTRY.get("bytes_read")
+    get_instant.extract_email_info(email_file)
+    assert metrics.REGISTRY.get("bytes_read") == read_before + email_file.stat().st_size
+
+    written_before = metrics.REGISTRY.get("bytes_written")
+    get_instant.write_file("test", tmp_path / "test.txt")
+    assert metrics.REGISTRY.get("bytes_written") == written_before + 4
+
+
 def test_write_csv(get_instant, tmp_path):
     # Create some test email data
     email_data = [
@@ -3,7 +3,10 @@ import pytest
 import math
 import sys
 import io
-from mailcom.lang_detector import LangDetector
+from mailcom.lang_detector import LangDetector, load_langid_model
+from mailcom import lang_detector
+import numpy as np
+from mailcom.cache import LRUCache
 from string import punctuation
 from mailcom.utils import TransformerLoader
 
@@ -303,6 +306,242 @@ def test_constrain_langid_fail(get_lang_detector):
         get_lang_detector.constrain_langid(lang_set)
 
 
+@pytest.mark.langdet
+def test_constrain_langid_shared_model(get_lang_detector):
+    other = LangDetector()
+    # the decoded model is shared between the detectors
+    assert other.lang_id.nb_ptc is get_lang_detector.lang_id.nb_ptc
+    get_lang_detector.constrain_langid(["es", "fr"])
+    assert get_lang_detector.lang_id.nb_classes == ["es", "fr"]
+    assert other.lang_id.nb_classes == LANGID_LANGS
+    assert len(load_langid_model()[2]) == len(LANGID_LANGS)
+    # constraining again starts from the full model
+    other.constrain_langid(["de", "fr"])
+    assert other.lang_id.nb_classes == ["de", "fr"]
+    assert get_lang_detector.lang_id.nb_classes == ["es", "fr"]
+
+
+@pytest.mark.langdet
+def test_load_langid_model_cache_dir(get_lang_detector, tmp_path):
+    cache_dir = tmp_path / "langid"
+    cached = LangDetector(langid_cache_dir=cache_dir)
+    assert (cache_dir / "meta.json").is_file()
+    load_langid_model.cache_clear()
+    # read from the files on disk
+    cached = LangDetector(langid_cache_dir=cache_dir)
+    assert cached.lang_id.nb_classes == LANGID_LANGS
+    for sent in lang_samples:
+        assert cached.lang_id.classify(sent) == get_lang_detector.lang_id.classify(sent)
+    cached.constrain_langid(["es", "fr"])
+    get_lang_detector.constrain_langid(["es", "fr"])
+    for sent in lang_samples:
+        assert cached.lang_id.classify(sent) == get_lang_detector.lang_id.classify(sent)
+
+
+@pytest.mark.langdet
+def test_write_langid_cache_twice(tmp_path):
+    cache_dir = tmp_path / "langid"
+    langid_model = load_langid_model()
+    lang_detector._write_langid_cache(cache_dir, langid_model)
+    nb_ptc = lang_detector._read_langid_cache(cache_dir)[0]
+    inode = (cache_dir / "nb_ptc.npy").stat().st_ino
+    # a second worker keeps the files of the first one, which are mapped
+    lang_detector._write_langid_cache(cache_dir, langid_model)
+    assert (cache_dir / "nb_ptc.npy").stat().st_ino == inode
+    np.testing.assert_array_equal(nb_ptc, langid_model[0])
+    assert [path.name for path in tmp_path.iterdir()] == ["langid"]
+    # an empty directory is filled
+    empty_dir = tmp_path / "empty"
+    empty_dir.mkdir()
+    lang_detector._write_langid_cache(empty_dir, langid_model)
+    assert (empty_dir / "meta.json").is_file()
+
+
+@pytest.mark.langdet
+def test_set_sampling(get_lang_detector):
+    get_lang_detector.set_sampling(500, 3, 0.8)
+    assert get_lang_detector.sample_chars == 500
+    assert get_lang_detector.sample_windows == 3
+    assert get_lang_detector.sample_confidence == 0.8
+    with pytest.raises(ValueError):
+        get_lang_detector.set_sampling(-1)
+
+
+@pytest.mark.langdet
+def test_get_samples(get_lang_detector):
+    text = " ".join("mot{}".format(i) for i in range(200))
+    # no sampling by default
+    assert get_lang_detector.get_samples(text) == [text]
+    get_lang_detector.set_sampling(100, 2)
+    samples = get_lang_detector.get_samples(text)
+    assert len(samples) == 3
+    assert text.startswith(samples[0])
+    assert text.endswith(samples[-1])
+    for sample in samples:
+        assert 0 < len(sample) <= 100
+        # no cut words
+        assert all(word.startswith("mot") for word in sample.split(" "))
+        assert sample in text
+    assert get_lang_detector.get_samples("mot court") == ["mot court"]
+
+
+@pytest.mark.langdet
+def test_get_detections_sampled(get_lang_detector):
+    text = " ".join(["Bonjour, je vous écris au sujet de la réunion de demain."] * 50)
+    get_lang_detector.set_sampling(200, 2, 0.9)
+    calls = []
+    classify = get_lang_detector.lang_id.classify
+    get_lang_detector.lang_id.classify = lambda t: calls.append(t) or classify(t)
+    detection = get_lang_detector.get_detections(text)
+    assert detection[0][0] == "fr"
+    # stopped after the confident leading sample
+    assert len(calls) == 1
+    assert len(calls[0]) <= 200
+
+
+@pytest.mark.langdet
+def test_get_detections_sampled_disagree(get_lang_detector):
+    french = "Bonjour, je vous écris au sujet de la réunion de demain. " * 20
+    spanish = "Hola, te escribo sobre la reunión de mañana por la tarde. " * 20
+    text = french + spanish
+    get_lang_detector.set_sampling(300, 1, 1.1)
+    calls = []
+    classify = get_lang_detector.lang_id.classify
+    get_lang_detector.lang_id.classify = lambda t: calls.append(t) or classify(t)
+    get_lang_detector.get_detections(text)
+    # the samples disagree, so that the full text is classified last
+    assert len(calls) == 3
+    assert calls[-1] == text
+
+
+@pytest.mark.langdet
+def test_get_detections_batch_sampled(get_lang_detector):
+    french = "Bonjour, je vous écris au sujet de la réunion de demain. " * 20
+    spanish = "Hola, te escribo sobre la reunión de mañana por la tarde. " * 20
+    texts = [french, spanish, "Guten Tag", french + spanish]
+    expected = get_lang_detector.get_detections_batch(texts)
+    get_lang_detector.set_sampling(300, 1, 0.9)
+    detections = get_lang_detector.get_detections_batch(texts)
+    assert [det[0][0] for det in detections[:3]] == [det[0][0] for det in expected[:3]]
+    # the confident leading sample decides for the mixed text
+    assert detections[3][0][0] == "fr"
+    for text, detection in zip(texts, detections):
+        assert detection == get_lang_detector.get_detections(text)
+
+
+@pytest.mark.langdet
+def test_get_detections_batch_sampled_boilerplate(get_lang_detector):
+    # the leading sample only contains numbers and punctuations
+    boilerplate = "----- 2025 ----- " * 20
+    spanish = "Hola, te escribo sobre la reunión de mañana por la tarde. " * 20
+    text = boilerplate + spanish
+    get_lang_detector.set_sampling(300, 1, 0.5)
+    samples = get_lang_detector.get_samples(text)
+    assert not get_lang_detector.is_detectable(samples[0])
+    calls = []
+    classify = get_lang_detector.lang_id.classify
+    get_lang_detector.lang_id.classify = lambda t: calls.append(t) or classify(t)
+    detection = get_lang_detector.get_detections_batch([text])[0]
+    # detected from the other sample instead of the full text, as a single text
+    assert calls == [samples[1]]
+    assert detection[0][0] == "es"
+    assert detection == get_lang_detector.get_detections(text)
+
+
+@pytest.mark.langdet
+def test_set_languages(get_lang_detector):
+    get_lang_detector.set_languages(["fr", "es", "pt", "de"])
+    assert get_lang_detector.languages == {"fr", "es", "pt", "de"}
+    assert get_lang_detector.lang_id.nb_classes == ["de", "es", "fr", "pt"]
+    # a new set is not restricted by the previous one
+    get_lang_detector.set_languages(["en", "fr"])
+    assert get_lang_detector.lang_id.nb_classes == ["en", "fr"]
+    get_lang_detector.set_languages(None)
+    assert get_lang_detector.languages is None
+    assert get_lang_detector.lang_id.nb_classes == LANGID_LANGS
+    with pytest.raises(ValueError):
+        get_lang_detector.set_languages(["not_a_language"])
+
+
+@pytest.mark.langdet
+def test_filter_languages(get_lang_detector):
+    detections = [("it", 0.6), ("fr", 0.3), ("es", 0.1)]
+    assert get_lang_detector.filter_languages(detections) == detections
+    get_lang_detector.set_languages(["fr", "es"])
+    assert get_lang_detector.filter_languages(detections) == [
+        ("fr", 0.3),
+        ("es", 0.1),
+    ]
+    assert get_lang_detector.filter_languages([("it", 1.0)]) == [(None, 0.0)]
+
+
+@pytest.mark.langdet
+def test_detect_with_langdetect_languages(get_lang_detector):
+    get_lang_detector.determine_langdetect()
+    get_lang_detector.set_languages(["fr", "es"])
+    for sent, lang in lang_samples.items():
+        detections = get_lang_detector.detect_with_langdetect(sent)
+        if lang in ["fr", "es"]:
+            assert detections[0][0] == lang
+        else:
+            assert all(det[0] in ["fr", "es", None] for det in detections)
+
+
+@pytest.mark.langdet
+def test_get_detections_cache(get_lang_detector):
+    cache = LRUCache(name="lang_detection")
+    get_lang_detector.set_cache(cache)
+    calls = []
+    classify = get_lang_detector.lang_id.classify
+    get_lang_detector.lang_id.classify = lambda t: calls.append(t) or classify(t)
+    first = get_lang_detector.get_detections("Envoyé de mon iPhone")
+    assert get_lang_detector.get_detections("Envoyé de mon iPhone") == first
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    # texts with another layout are detected separately
+    get_lang_detector.get_detections("Envoyé de mon\niPhone ")
+    assert len(calls) == 2
+    assert len(cache) == 2
+    # the detections of other backends are cached separately
+    get_lang_detector.get_detections("Envoyé de mon iPhone", lang_lib="langdetect")
+    assert len(cache) == 3
+    # texts without language are not cached
+    get_lang_detector.get_detections("123")
+    assert len(cache) == 3
+
+
+@pytest.mark.langdet
+def test_get_detections_cache_languages(get_lang_detector):
+    get_lang_detector.set_cache(LRUCache())
+    text = "Von meinem iPhone gesendet"
+    assert get_lang_detector.get_detections(text)[0][0] == "de"
+    # a restricted set of languages does not use the previous detections
+    get_lang_detector.set_languages(["fr", "es"])
+    assert get_lang_detector.get_detections(text)[0][0] in ["fr", "es"]
+    get_lang_detector.set_languages(None)
+    assert get_lang_detector.get_detections(text)[0][0] == "de"
+
+
+@pytest.mark.langdet
+def test_get_detections_batch_cache(get_lang_detector):
+    texts = list(lang_samples) + ["", "Envoyé de mon iPhone"]
+    expected = get_lang_detector.get_detections_batch(texts)
+    cache = LRUCache()
+    get_lang_detector.set_cache(cache)
+    assert get_lang_detector.get_detections_batch(texts) == expected
+    assert cache.stats()["misses"] == len(texts) - 1
+    calls = []
+    batch = get_lang_detector.detect_with_langid_batch
+    get_lang_detector.detect_with_langid_batch = lambda t: calls.append(t) or batch(t)
+    assert get_lang_detector.get_detections_batch(texts) == expected
+    assert calls == []
+    assert cache.stats()["hits"] == len(texts) - 1
+    # detect_lang_sentences uses the cache as well
+    get_lang_detector.detect_lang_sentences(texts)
+    assert calls == []
+    assert get_lang_detector.get_detections(texts[0]) == expected[0]
+
+
 @pytest.mark.langdet
 def test_determine_langdetect(get_lang_detector):
     get_lang_detector.determine_langdetect()
@@ -552,6 +791,63 @@ def test_get_detections_fail(get_lang_detector):
         get_lang_detector.get_detections(sentence, "not_a_lib")
 
 
+@pytest.mark.langdet
+def test_is_detectable(get_lang_detector):
+    assert get_lang_detector.is_detectable("Ceci est une phrase.")
+    for text in [" \n\n", ".,;:!?", "12 34", "<abc@gmail.com>", "https://a.org"]:
+        assert not get_lang_detector.is_detectable(text)
+
+
+@pytest.mark.langdet
+def test_detect_with_langid_batch(get_lang_detector):
+    sentences = list(lang_samples.keys())
+    detections = get_lang_detector.detect_with_langid_batch(sentences)
+    assert len(detections) == len(sentences)
+    for sentence, detection in zip(sentences, detections):
+        expected = get_lang_detector.detect_with_langid(sentence)
+        assert detection[0][0] == expected[0][0]
+        assert math.isclose(detection[0][1], expected[0][1], rel_tol=1e-6)
+    assert get_lang_detector.detect_with_langid_batch([]) == []
+
+
+@pytest.mark.langdet
+def test_get_detections_batch(get_lang_detector):
+    sentences = list(lang_samples.keys())[:5]
+    texts = [sentences[0], " \n", sentences[1], "1234"] + sentences[2:]
+    for lang_lib in ["langid", "langdetect"]:
+        detections = get_lang_detector.get_detections_batch(
+            texts, lang_lib, batch_size=2
+        )
+        expected = [get_lang_detector.get_detections(t, lang_lib) for t in texts]
+        assert [d[0][0] for d in detections] == [e[0][0] for e in expected]
+        assert detections[1] == [(None, 0.0)]
+        assert detections[3] == [(None, 0.0)]
+    assert get_lang_detector.get_detections_batch([]) == []
+    assert get_lang_detector.get_detections_batch(["", "..."]) == [
+        [(None, 0.0)],
+        [(None, 0.0)],
+    ]
+
+
+@pytest.mark.langdet
+def test_get_detections_batch_trans(get_lang_det_w_trans):
+    sentences = list(lang_samples.keys())[:4]
+    detections = get_lang_det_w_trans.get_detections_batch(
+        sentences + [""], "trans", batch_size=2
+    )
+    assert len(detections) == 5
+    for sentence, detection in zip(sentences, detections):
+        assert len(detection) == 2
+        assert detection[0][0] == lang_samples[sentence]
+    assert detections[4] == [(None, 0.0)]
+
+
+@pytest.mark.langdet
+def test_get_detections_batch_fail(get_lang_detector):
+    with pytest.raises(ValueError):
+        get_lang_detector.get_detections_batch(["Ceci est une phrase."], "not_a_lib")
+
+
 @pytest.mark.langdet
 def test_detect_lang_sentences_langid(get_lang_det_w_trans, get_mixed_lang_docs):
     for doc in get_mixed_lang_docs:
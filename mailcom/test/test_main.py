@@ -7,6 +7,7 @@ from pathlib import Path
 from importlib import resources
 import csv
 import copy
+import time
 
 
 def get_files(dir_path: Path, name_phrase: str) -> list[Path]:
@@ -148,6 +149,119 @@ def test_is_valid_settings():
     settings = {"ner_pipeline": "unknown"}
     assert main.is_valid_settings(settings) is False
 
+    settings = {"stage_timing": True}
+    assert main.is_valid_settings(settings) is True
+    settings = {"stage_timing": "test"}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"metrics_path": None}
+    assert main.is_valid_settings(settings) is True
+    settings = {"metrics_path": "metrics.json"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"metrics_format": "prometheus"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"metrics_format": "csv"}
+    assert main.is_valid_settings(settings) is False
+    settings = {"metrics_interval": 10}
+    assert main.is_valid_settings(settings) is True
+    settings = {"metrics_interval": -1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"profiling_dir": "profiles"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"profiling_every_n": 10}
+    assert main.is_valid_settings(settings) is True
+    settings = {"profiling_every_n": 1.5}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"trace_path": "trace.jsonl"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"trace_path": 1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"lang_batch_size": 16}
+    assert main.is_valid_settings(settings) is True
+    settings = {"lang_batch_size": 0}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"langid_cache_dir": "langid_cache"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"langid_cache_dir": 1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {
+        "lang_sample_chars": 500,
+        "lang_sample_windows": 0,
+        "lang_sample_confidence": 0.8,
+    }
+    assert main.is_valid_settings(settings) is True
+    settings = {"lang_sample_chars": -1}
+    assert main.is_valid_settings(settings) is False
+    settings = {"lang_sample_confidence": 1.5}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"languages": ["fr", "es"]}
+    assert main.is_valid_settings(settings) is True
+    settings = {"languages": "fr"}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"group_by_language": True}
+    assert main.is_valid_settings(settings) is True
+    settings = {"group_by_language": "yes"}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"lang_cache_size": 0, "lang_cache_path": "lang_cache.json"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"lang_cache_size": -1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"ner_gating": "eval"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"ner_gating": True}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"ner_cache_size": 0, "ner_cache_spill_path": "ner.sqlite"}
+    assert main.is_valid_settings(settings) is True
+    settings = {"ner_cache_size": -1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"quote_cache_size": 1000}
+    assert main.is_valid_settings(settings) is True
+    settings = {"quote_cache_size": "1000"}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {
+        "boilerplate_ngram_lines": 3,
+        "boilerplate_min_count": 10,
+        "boilerplate_first_pass": True,
+        "boilerplate_cache_size": 500,
+    }
+    assert main.is_valid_settings(settings) is True
+    settings = {"boilerplate_min_count": 0}
+    assert main.is_valid_settings(settings) is False
+    settings = {"boilerplate_cache_size": 0}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"ner_pack_tokens": 500}
+    assert main.is_valid_settings(settings) is True
+    settings = {"ner_pack_tokens": -1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"ner_max_tokens": 256, "ner_stride_tokens": 32}
+    assert main.is_valid_settings(settings) is True
+    settings = {"ner_stride_tokens": -1}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"spacy_chunk_chars": 0}
+    assert main.is_valid_settings(settings) is True
+    settings = {"spacy_chunk_chars": None}
+    assert main.is_valid_settings(settings) is False
+
+    settings = {"intra_email_workers": 4, "intra_email_min_chars": 10000}
+    assert main.is_valid_settings(settings) is True
+    settings = {"intra_email_workers": 0}
+    assert main.is_valid_settings(settings) is False
+
     settings = {"unknown_key": "value"}
     assert main.is_valid_settings(settings) is False
 
@@ -765,6 +879,200 @@ def test_process_data_with_subject_with_prev_ne_list(
     )
 
 
+def test_process_data_stage_timing(get_data_w_subject, get_settings, get_inout_hl):
+    get_inout_hl.email_list = get_data_w_subject
+    timer = main.process_data(get_inout_hl.get_email_list(), get_settings)
+    assert timer is None
+    assert "stage_timings" not in get_inout_hl.email_list[0]
+
+    get_settings["stage_timing"] = True
+    timer = main.process_data(get_inout_hl.get_email_list(), get_settings)
+    email = get_inout_hl.email_list[0]
+    assert set(email["stage_timings"]) == {"subject", "content"}
+    for stage in ["clean_up", "lang_detection", "spacy_parse", "ner", "rendering"]:
+        assert email["stage_timings"]["content"][stage] > 0
+
+    # the timings are only kept until they are stored in the emails
+    assert timer.timings == {}
+    summary = timer.summary()
+    assert summary["ner"]["count"] == 4  # 2 emails with 2 fields
+    assert summary["ner"]["p50"] <= summary["ner"]["p99"]
+    assert summary["dateparser"]["calls"] > 0
+
+
+def test_process_data_metrics(get_data, get_settings, get_inout_hl, tmp_path):
+    get_inout_hl.email_list = get_data
+    metrics_path = tmp_path / "metrics.json"
+    get_settings["metrics_path"] = str(metrics_path)
+    main.process_data(get_inout_hl.get_email_list(), get_settings)
+
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["counters"]["emails"] == 2
+    assert data["counters"]["sentences"] == 4
+    assert data["counters"]["ner_calls"] == 4
+    assert data["counters"]["dateparser_calls"] > 0
+    assert data["rates"]["emails_per_second"] > 0
+
+
+def test_process_data_metrics_io(tmp_path):
+    in_path = tmp_path / "in.csv"
+    with open(in_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["message"])
+        writer.writerow(["Content of test email 1"])
+    metrics_path = tmp_path / "metrics.json"
+    # no pseudonymized fields, so that no models are needed
+    settings = {
+        "default_lang": "fr",
+        "pseudo_fields": [],
+        "metrics_path": str(metrics_path),
+    }
+
+    exporter = main.start_metrics_exporter(settings)
+    inout_hl = main.get_input_handler(in_path, in_type="csv")
+    main.process_data(inout_hl.get_email_list(), settings, exporter=exporter)
+    main.write_output_data(inout_hl, tmp_path / "out.csv")
+    exporter.stop()
+
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["counters"]["emails"] == 1
+    assert data["counters"]["bytes_read"] == in_path.stat().st_size
+    assert data["counters"]["bytes_written"] == (tmp_path / "out.csv").stat().st_size
+
+
+def test_process_data_profiling(get_data, get_settings, get_inout_hl, tmp_path):
+    get_inout_hl.email_list = get_data
+    get_settings["profiling_dir"] = str(tmp_path)
+    main.process_data(get_inout_hl.get_email_list(), get_settings)
+    assert len(list(tmp_path.glob("*_run.pstats"))) == 1
+    assert len(list(tmp_path.glob("*_run.collapsed"))) == 1
+    report = list(tmp_path.glob("*_run_report.txt"))[0].read_text()
+    assert "Top allocating lines" in report
+
+
+def test_process_data_trace(get_data_w_subject, get_settings, get_inout_hl, tmp_path):
+    get_inout_hl.email_list = get_data_w_subject
+    get_inout_hl.email_list[0]["file_name"] = "test.eml"
+    trace_path = tmp_path / "trace.jsonl"
+    get_settings["trace_path"] = str(trace_path)
+    timer = main.process_data(get_inout_hl.get_email_list(), get_settings)
+    # timings are only kept in the emails if stage_timing is enabled
+    assert timer is None
+    assert "stage_timings" not in get_inout_hl.email_list[0]
+
+    with open(trace_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 2
+    assert records[0]["file_name"] == "test.eml"
+    assert records[0]["total_seconds"] > 0
+    content = records[1]["fields"]["content"]
+    assert content["lang"] == "es"
+    assert content["sentences"] == 2
+    assert content["tokens"] > content["sentences"]
+    assert content["entities"] == 1
+    assert content["dates"] == 1
+    assert content["chars"] == len(get_inout_hl.email_list[1]["content"])
+    assert content["durations"]["ner"] > 0
+
+
+def test_process_data_pipelined(get_data, get_settings, get_inout_hl, tmp_path):
+    get_inout_hl.email_list = get_data
+    outpath = tmp_path / "test_output.csv"
+    stats = main.process_data_pipelined(get_inout_hl, get_settings, out_path=outpath)
+
+    assert stats["stages"]["process"]["items"] == 2
+    assert stats["bottleneck"] in ("read", "process", "write")
+    # the emails are written to the file instead of being kept
+    assert get_inout_hl.email_list == []
+    with open(outpath, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 2
+    assert rows[0]["pseudo_content"] == (
+        "Claude ([email]) viendra au bâtiment à [number]h[number]. "
+        "Nous nous rendrons ensuite au [location]"
+    )
+
+    # the output file is checked before processing
+    get_inout_hl.email_list = get_data
+    with pytest.raises(ValueError):
+        main.process_data_pipelined(get_inout_hl, get_settings, out_path=outpath)
+    get_inout_hl.email_list = get_data
+    with pytest.raises(ValueError):
+        main.process_data_pipelined(
+            get_inout_hl, get_settings, out_path=tmp_path / "test_output.txt"
+        )
+
+
+def test_process_data_pipelined_xml(get_settings, get_inout_hl, tmp_path):
+    get_settings["pseudo_fields"] = []
+    emails = [{"content": "Content of test email {}".format(i)} for i in range(3)]
+    get_inout_hl.email_list = copy.deepcopy(emails)
+    main.process_data_pipelined(get_inout_hl, get_settings)
+    main.write_output_data(get_inout_hl, tmp_path / "at_once.xml")
+    get_inout_hl.email_list = copy.deepcopy(emails)
+    main.process_data_pipelined(
+        get_inout_hl, get_settings, out_path=tmp_path / "streamed.xml"
+    )
+    streamed = (tmp_path / "streamed.xml").read_text(encoding="utf-8")
+    assert streamed == (tmp_path / "at_once.xml").read_text(encoding="utf-8")
+
+
+def test_process_data_pipelined_bounded(
+    get_settings, get_inout_hl, tmp_path, monkeypatch
+):
+    get_settings["pseudo_fields"] = []
+    queue_size = 2
+    counts = {"read": 0, "written": 0, "max_held": 0}
+
+    def source():
+        for i in range(30):
+            counts["read"] += 1
+            counts["max_held"] = max(
+                counts["max_held"], counts["read"] - counts["written"]
+            )
+            yield {"content": "Content of test email {}".format(i)}
+
+    write = main.EmailStreamWriter.write
+
+    def slow_write(self, email):
+        time.sleep(0.01)
+        write(self, email)
+        counts["written"] += 1
+
+    monkeypatch.setattr(main.EmailStreamWriter, "write", slow_write)
+    get_inout_hl.email_list = source()
+    outpath = tmp_path / "test_output.csv"
+    stats = main.process_data_pipelined(
+        get_inout_hl, get_settings, out_path=outpath, queue_size=queue_size
+    )
+    assert stats["bottleneck"] == "write"
+    assert counts["written"] == 30
+    # the emails in both queues and one in each stage
+    assert counts["max_held"] <= 2 * queue_size + 3
+    with open(outpath, "r", newline="", encoding="utf-8") as f:
+        assert len(list(csv.DictReader(f))) == 30
+
+
+def test_process_data_pipelined_lazy(get_settings, tmp_path):
+    indir = tmp_path / "in"
+    indir.mkdir()
+    (indir / "test1.eml").write_text("Content of test email 1")
+    (indir / "test2.eml").write_text("Content of test email 2")
+    inout_hl = main.get_input_handler(indir, in_type="dir", lazy=True)
+    assert inout_hl.email_list == []
+    assert len(inout_hl.email_path_list) == 2
+
+    get_settings["pseudo_fields"] = []
+    stats = main.process_data_pipelined(inout_hl, get_settings)
+    assert stats["stages"]["read"]["items"] == 2
+    assert len(inout_hl.email_list) == 2
+
+    with pytest.raises(ValueError):
+        main.process_data_pipelined(InoutHandler(), get_settings)
+
+
 def test_write_output_data_csv(get_data, tmp_path, get_inout_hl):
     outpath = tmp_path / "test_output.csv"
     get_inout_hl.email_list = get_data
@@ -835,3 +1143,225 @@ def test_write_output_data_overwrite(get_data, tmp_path, get_inout_hl):
     with open(outpath, "r", encoding="utf-8") as f:
         lines = f.readlines()
         assert len(lines) == 3  # header + 2 emails
+
+
+def test_email_processor_detect_languages(get_data_w_subject, get_settings):
+    get_settings["stage_timing"] = True
+    processor = main.EmailProcessor(get_settings)
+    get_data_w_subject[1]["subject"] = "unmatched"
+    langs = processor.detect_languages(get_data_w_subject)
+    assert langs == [{"subject": "fr", "content": "fr"}, {"content": "es"}]
+    # the time of the batch is recorded for each field
+    assert processor.timer.get_timings(0, "subject")["lang_detection"] > 0
+    assert processor.timer.get_timings(1, "content")["lang_detection"] > 0
+    assert processor.timer.get_timings(1, "content")["clean_up"] > 0
+    assert set(processor.batch_lang_seconds) == {0, 1}
+    # the cleaned up fields are kept for process_email
+    assert set(processor.batch_cleaned[0]) == {"subject", "content"}
+    content, cleaned_content = processor.batch_cleaned[1]["content"]
+    assert content == get_data_w_subject[1]["content"]
+    assert cleaned_content == utils.clean_up_content(content)[0]
+
+
+def test_process_data_clean_up_once(get_data, get_settings, monkeypatch):
+    calls = []
+    clean_up_content = utils.clean_up_content
+
+    def count_clean_up(content):
+        calls.append(content)
+        return clean_up_content(content)
+
+    monkeypatch.setattr(main.utils, "clean_up_content", count_clean_up)
+    main.process_data(iter(get_data), get_settings)
+    # the fields cleaned up for the language detection are reused
+    assert len(calls) == 2
+    assert get_data[0]["cleaned_content"] == clean_up_content(calls[0])[0]
+
+
+def test_email_processor_lang_sampling(get_settings):
+    get_settings["lang_sample_chars"] = 200
+    get_settings["lang_sample_windows"] = 1
+    processor = main.EmailProcessor(get_settings)
+    assert processor.lang_detector.sample_chars == 200
+    assert processor.lang_detector.sample_windows == 1
+    assert processor.lang_detector.sample_confidence == 0.9
+    get_settings["lang_sample_chars"] = 0
+    processor = main.EmailProcessor(get_settings)
+    assert processor.lang_detector.sample_chars == 0
+
+
+def test_email_processor_languages(get_settings):
+    get_settings["languages"] = ["fr", "es"]
+    processor = main.EmailProcessor(get_settings)
+    assert processor.lang_detector.lang_id.nb_classes == ["es", "fr"]
+    assert processor.time_detector.languages == ["fr", "es"]
+    assert set(processor.spacy_loader.spacy_instances) == {"fr", "es"}
+
+
+def test_schedule_by_language(get_data, get_settings):
+    emails = get_data + [{"content": "Bonjour Pierre, à demain au bureau."}]
+    processor = main.EmailProcessor(get_settings)
+    schedule = []
+    for email, langs, group_lang in main._schedule_by_language(processor, emails):
+        schedule.append((emails.index(email), processor.email_idx, group_lang))
+        assert langs == {"content": group_lang}
+    # grouped by language, in input order within a group
+    assert schedule == [(0, 0, "fr"), (2, 2, "fr"), (1, 1, "es")]
+    assert processor.email_idx == 3
+    assert set(processor.batch_lang_seconds) == {0, 1, 2}
+
+    # a batch size of 0 is treated as 1
+    processor = main.EmailProcessor(get_settings)
+    processor.lang_batch_size = 0
+    schedule = list(main._schedule_by_language(processor, emails))
+    assert [group_lang for _, _, group_lang in schedule] == ["fr", "fr", "es"]
+
+
+def test_schedule_in_order(get_data, get_settings):
+    processor = main.EmailProcessor(get_settings)
+    schedule = list(main._schedule_in_order(processor, get_data))
+    assert [email for email, _, _ in schedule] == get_data
+    assert [langs for _, langs, _ in schedule] == [{"content": "fr"}, {"content": "es"}]
+    assert all(group_lang is None for _, _, group_lang in schedule)
+    get_settings["default_lang"] = "fr"
+    processor = main.EmailProcessor(get_settings)
+    schedule = list(main._schedule_in_order(processor, get_data))
+    assert [langs for _, langs, _ in schedule] == [None, None]
+
+
+def test_process_data_group_by_language(get_data, get_settings):
+    # alone, each email is processed with the model of its language
+    expected = copy.deepcopy(get_data)
+    main.process_data(iter(expected[:1]), get_settings)
+    main.process_data(iter(expected[1:]), get_settings)
+    get_data.insert(1, {"content": "Hola Pedro, nos vemos mañana en la oficina."})
+    get_settings["group_by_language"] = True
+    get_settings["stage_timing"] = True
+    main.process_data(iter(get_data), get_settings)
+    # the emails keep their order
+    assert get_data[0]["lang"] == {"content": "fr"}
+    assert get_data[1]["lang"] == {"content": "es"}
+    for key in ["pseudo_content", "sentences", "detected_datetime"]:
+        assert get_data[0][key] == expected[0][key]
+        assert get_data[2][key] == expected[1][key]
+
+
+def test_email_processor_lang_cache(get_data, get_settings, tmp_path):
+    processor = main.EmailProcessor(get_settings)
+    assert processor.lang_detector.cache is None
+
+    get_settings["lang_cache_size"] = 100
+    get_settings["lang_cache_path"] = str(tmp_path / "lang_cache.json")
+    processor = main.EmailProcessor(get_settings)
+    processor.detect_languages(get_data)
+    processor.close()
+    processor = main.EmailProcessor(get_settings)
+    assert len(processor.lang_detector.cache) == 2
+    assert processor.detect_languages(get_data) == [
+        {"content": "fr"},
+        {"content": "es"},
+    ]
+    assert processor.lang_detector.cache.stats()["hits"] == 2
+
+
+def test_email_processor_ner_cache(get_settings, tmp_path):
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.ner_cache is None
+    get_settings["ner_cache_size"] = 100
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.ner_cache.max_size == 100
+
+    get_settings["ner_cache_size"] = 1
+    get_settings["ner_cache_spill_path"] = str(tmp_path / "ner.sqlite")
+    processor = main.EmailProcessor(get_settings)
+    processor.pseudonymizer.ner_cache.put("a", [])
+    processor.pseudonymizer.ner_cache.put("b", [])
+    processor.close()
+    processor = main.EmailProcessor(get_settings)
+    assert "a" in processor.pseudonymizer.ner_cache
+    assert "b" in processor.pseudonymizer.ner_cache
+    processor.close()
+
+
+def test_email_processor_pseudonymizer_settings(get_settings):
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.quote_cache is None
+    get_settings["quote_cache_size"] = 100
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.quote_cache.max_size == 100
+    assert processor.pseudonymizer.ner_pack_tokens == 0
+    get_settings["ner_pack_tokens"] = 500
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.ner_pack_tokens == 500
+    # NER chunking is opt-in
+    assert processor.pseudonymizer.ner_max_tokens == 0
+    get_settings["ner_max_tokens"] = 500
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.ner_max_tokens == 500
+    assert processor.pseudonymizer.ner_stride_tokens == 50
+    assert processor.pseudonymizer.spacy_chunk_chars == 100000
+    assert processor.time_detector.chunk_chars == 100000
+    assert processor.executor is None
+    assert processor.pseudonymizer.executor is None
+    get_settings["intra_email_workers"] = 2
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.executor is processor.executor
+    assert processor.pseudonymizer.parallel_min_chars == 50000
+    assert processor.pseudonymizer.parallel_groups == 2
+    processor.close()
+    with pytest.raises(RuntimeError):
+        processor.executor.submit(print)
+
+
+def test_process_email_intra_email_workers(get_settings):
+    # the date straddles the middle of the field, where it was cut when
+    # the field was split into one chunk per worker
+    content = (
+        "Nous avons parlé du projet. " * 3
+        + "La réunion aura lieu le 14 mars 2025 à Paris. "
+        + "Merci pour votre aide. " * 4
+    )
+    start = content.index("14 mars 2025")
+    assert start < len(content) // 2 < start + len("14 mars 2025")
+    emails = []
+    for workers in [1, 2]:
+        settings = dict(
+            get_settings,
+            default_lang="fr",
+            intra_email_workers=workers,
+            intra_email_min_chars=0,
+        )
+        processor = main.EmailProcessor(settings)
+        emails.append(processor.process_email({"content": content}))
+        processor.close()
+    assert "14 mars 2025" in emails[0]["detected_datetime"]["content"]
+    assert emails[1]["detected_datetime"] == emails[0]["detected_datetime"]
+    assert emails[1]["pseudo_content"] == emails[0]["pseudo_content"]
+
+
+def test_email_processor_boilerplate(get_data, get_settings):
+    processor = main.EmailProcessor(get_settings)
+    assert processor.boilerplate_index is None
+    get_settings["boilerplate_ngram_lines"] = 1
+    get_settings["boilerplate_min_count"] = 2
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.boilerplate_index is processor.boilerplate_index
+    assert processor.pseudonymizer.quote_cache.max_size == 10000
+    assert processor.boilerplate_index.min_count == 2
+    processor.index_boilerplate(get_data + get_data)
+    assert processor.boilerplate_index.stats()["texts"] == 4
+    assert processor.boilerplate_index.stats()["boilerplate_ngrams"] > 0
+    assert processor.index_incrementally is False
+    get_settings["boilerplate_cache_size"] = 500
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.quote_cache.max_size == 500
+    # the quote cache is used if enabled
+    get_settings["quote_cache_size"] = 100
+    processor = main.EmailProcessor(get_settings)
+    assert processor.pseudonymizer.quote_cache.max_size == 100
+
+
+def test_batched():
+    batches = list(main._batched(iter(range(5)), 2))
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert list(main._batched([], 2)) == []
@@ -0,0 +1,49 @@
+import pytest
+from mailcom import memory_benchmark
+
+# settings processing emails without loading spaCy or transformers models
+NO_MODEL_SETTINGS = {
+    "default_lang": "fr",
+    "datetime_detection": False,
+    "pseudo_fields": [],
+}
+
+
+def test_get_rss_mb():
+    assert memory_benchmark.get_rss_mb() > 0
+
+
+def test_run_memory_benchmark_invalid():
+    with pytest.raises(ValueError):
+        memory_benchmark.run_memory_benchmark(NO_MODEL_SETTINGS, ["unknown"])
+
+
+def test_run_memory_benchmark():
+    results = memory_benchmark.run_memory_benchmark(
+        NO_MODEL_SETTINGS, ["langid"], n_emails=20
+    )
+    assert [r["component"] for r in results] == ["langid", "emails"]
+    langid, emails = results
+    assert langid["steady_rss_mb"] >= langid["baseline_rss_mb"]
+    assert langid["peak_rss_mb"] >= langid["steady_rss_mb"]
+    # peak RSS regression test: loading the langid model stays below 300 MB
+    assert langid["peak_rss_mb"] - langid["baseline_rss_mb"] < 300
+    assert emails["n_emails"] == 20
+    assert "rss_per_10k_emails_mb" in emails
+
+
+def test_compare_memory():
+    baseline = [
+        {"component": "spacy", "steady_rss_mb": 1000.0, "peak_rss_mb": 1200.0},
+        {"component": "emails", "rss_per_10k_emails_mb": 2.0},
+    ]
+    current = [
+        {"component": "spacy", "steady_rss_mb": 1050.0, "peak_rss_mb": 1500.0},
+        # small absolute changes are ignored
+        {"component": "emails", "rss_per_10k_emails_mb": 4.0},
+        {"component": "ner", "steady_rss_mb": 3000.0},
+    ]
+    regressions = memory_benchmark.compare_memory(current, baseline, 0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("spacy: peak_rss_mb")
+    assert memory_benchmark.compare_memory(baseline, baseline) == []
@@ -0,0 +1,116 @@
+import pytest
+import json
+import time
+from mailcom import metrics
+
+
+@pytest.fixture()
+def get_registry():
+    return metrics.MetricsRegistry()
+
+
+def test_counters(get_registry):
+    assert get_registry.get("emails") == 0
+    get_registry.inc("emails")
+    get_registry.inc("emails", 2)
+    get_registry.inc("cache_hits", labels={"cache": "ner"})
+    assert get_registry.get("emails") == 3
+    assert get_registry.get("cache_hits", {"cache": "ner"}) == 1
+    assert get_registry.get("cache_hits") == 0
+
+    get_registry.reset()
+    assert get_registry.get("emails") == 0
+
+
+def test_summaries(get_registry):
+    get_registry.observe("ner_batch_size", 4)
+    get_registry.observe("ner_batch_size", 8)
+    summary = get_registry.snapshot()["summaries"]["ner_batch_size"]
+    assert summary == {"count": 2, "sum": 12.0, "max": 8}
+
+
+def test_snapshot_rates(get_registry):
+    get_registry.inc("emails", 10)
+    get_registry.inc("sentences", 100)
+    get_registry.inc("cache_hits", 3, labels={"cache": "ner"})
+    get_registry.inc("cache_misses", 1, labels={"cache": "ner"})
+    get_registry.inc("cache_misses", 2, labels={"cache": "lang"})
+    time.sleep(0.01)
+    snapshot = get_registry.snapshot()
+    assert snapshot["elapsed_seconds"] > 0
+    rates = snapshot["rates"]
+    assert rates["emails_per_second"] > 0
+    assert rates["sentences_per_second"] == pytest.approx(
+        10 * rates["emails_per_second"]
+    )
+    assert rates['cache_hit_rate{cache="ner"}'] == 0.75
+    # no hits recorded for this cache
+    assert 'cache_hit_rate{cache="lang"}' not in rates
+
+
+def test_to_prometheus(get_registry):
+    get_registry.inc("emails", 2)
+    get_registry.inc("cache_hits", labels={"cache": "ner"})
+    get_registry.inc("cache_hits", labels={"cache": "lang"})
+    get_registry.observe("ner_batch_size", 4)
+    text = get_registry.to_prometheus()
+    lines = text.splitlines()
+    assert "# TYPE mailcom_emails_total counter" in lines
+    assert "mailcom_emails_total 2" in lines
+    assert lines.count("# TYPE mailcom_cache_hits_total counter") == 1
+    assert 'mailcom_cache_hits_total{cache="ner"} 1' in lines
+    assert "# TYPE mailcom_ner_batch_size summary" in lines
+    assert "mailcom_ner_batch_size_count 1" in lines
+    assert "mailcom_ner_batch_size_sum 4.0" in lines
+    assert "mailcom_ner_batch_size_max 4" in lines
+    assert any(line.startswith("mailcom_emails_per_second ") for line in lines)
+    assert text.endswith("\n")
+
+
+def test_write(get_registry, tmp_path):
+    get_registry.inc("emails")
+    path = tmp_path / "metrics.json"
+    get_registry.write(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["counters"]["emails"] == 1
+    assert not (tmp_path / "metrics.json.tmp").exists()
+
+    path = tmp_path / "metrics.prom"
+    get_registry.write(path, fmt="prometheus")
+    assert "mailcom_emails_total 1" in path.read_text()
+
+    with pytest.raises(ValueError):
+        get_registry.write(path, fmt="csv")
+
+
+def test_module_registry():
+    before = metrics.REGISTRY.get("test_counter")
+    metrics.inc("test_counter")
+    metrics.observe("test_summary", 1)
+    assert metrics.REGISTRY.get("test_counter") == before + 1
+
+
+def test_exporter(get_registry, tmp_path):
+    path = tmp_path / "metrics.json"
+    with pytest.raises(ValueError):
+        metrics.MetricsExporter(path, fmt="csv")
+
+    # only written when stopped
+    with metrics.MetricsExporter(path, registry=get_registry):
+        get_registry.inc("emails")
+        assert not path.exists()
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f)["counters"]["emails"] == 1
+
+    # written at intervals
+    path = tmp_path / "metrics.prom"
+    exporter = metrics.MetricsExporter(
+        path, fmt="prometheus", interval=0.01, registry=get_registry
+    )
+    exporter.start()
+    time.sleep(0.1)
+    assert path.exists()
+    get_registry.inc("emails")
+    exporter.stop()
+    assert "mailcom_emails_total 2" in path.read_text()
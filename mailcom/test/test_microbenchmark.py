@@ -0,0 +1,45 @@
+import json
+import pytest
+from mailcom import microbenchmark
+
+
+@pytest.mark.parametrize("name", list(microbenchmark.BENCHMARKS))
+def test_benchmark_callables(name):
+    # the benchmarked functions run on the synthetic inputs
+    for size in [1, 20]:
+        microbenchmark.BENCHMARKS[name](size)()
+
+
+def test_make_entities():
+    entities, sentence = microbenchmark._make_entities(4)
+    assert len(entities) == 4
+    for entity in entities:
+        assert sentence[entity["start"] : entity["end"]] == entity["word"]  # noqa
+
+
+def test_time_callable():
+    timings = microbenchmark.time_callable(lambda: sum(range(10)), repeat=2)
+    assert timings["number"] >= 1
+    assert 0 < timings["best"] <= timings["median"] <= timings["worst"]
+
+
+def test_run_microbenchmarks(tmp_path):
+    names = ["utils.clean_up_content", "Pseudonymize.pseudonymize_numbers"]
+    results = microbenchmark.run_microbenchmarks(names, [5, 50], repeat=1)
+    assert [(r["name"], r["size"]) for r in results] == [
+        (names[0], 5),
+        (names[0], 50),
+        (names[1], 5),
+        (names[1], 50),
+    ]
+    assert all(r["per_item"] > 0 for r in results)
+    with pytest.raises(ValueError):
+        microbenchmark.run_microbenchmarks(["unknown"])
+    out = tmp_path / "micro.json"
+    assert (
+        microbenchmark.main(
+            ["--names", names[0], "--sizes", "5", "--repeat", "1", "--out", str(out)]
+        )
+        == 0
+    )
+    assert len(json.loads(out.read_text())) == 1
@@ -1,5 +1,14 @@
 from mailcom import parse
+from mailcom import metrics
+from mailcom.boilerplate import BoilerplateIndex
+from mailcom.cache import LRUCache
+import copy
 import pytest
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from mailcom.utils import TransformerLoader, SpacyLoader
 
 
@@ -201,6 +210,19 @@ def test_get_sentences_with_punctuation(get_default_fr):
     assert "sentencizer" in get_default_fr.nlp_spacy.pipe_names
 
 
+def test_get_sentences_chunks(get_default_fr):
+    text = "Bonjour! Comment ça va?\nTrès bien, merci.\nÀ bientôt."
+    get_default_fr.set_spacy_chunking(30)
+    sentences = get_default_fr.get_sentences(text, "fr")
+    assert [sent.strip() for sent in sentences] == [
+        "Bonjour!",
+        "Comment ça va?",
+        "Très bien, merci.",
+        "À bientôt.",
+    ]
+    assert get_default_fr.n_tokens == len(get_default_fr.nlp_spacy(text))
+
+
 def test_get_letter_indices_non_empty(get_default_fr):
     sentence = (
         "The test date is 27.03.2025 13:37 and the other date is 01.01.2022. "
@@ -328,6 +350,470 @@ def test_pseudonymize_no_entities(get_default_fr):
     assert pseudonymized_text == text["content"]
 
 
+def test_pseudonymize_skip_ner(get_pseudo_first_names):
+    sentences = ["Francois viendra à Paris.", "123 456.", "https://www.example.org"]
+    # all sentences are passed to NER by default, only the first one
+    # has content for NER with gating
+    for mode, expected in [("off", sentences), ("on", sentences[:1])]:
+        pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, ner_gating=mode)
+        pseudonymizer.get_sentences = lambda text, language, model: text.split("\n")
+        ner_sentences = []
+        pseudonymizer.get_ner = lambda sent, info=None: ner_sentences.append(sent) or []
+        pseudonymized_text, _ = pseudonymizer.pseudonymize(
+            "\n".join(sentences), language="fr", pseudo_numbers=False
+        )
+        assert ner_sentences == expected
+        assert "https://www.example.org" in pseudonymized_text
+
+
+def test_ner_gating_init(get_pseudo_first_names):
+    assert parse.Pseudonymize(get_pseudo_first_names).ner_gating == "off"
+    with pytest.raises(ValueError):
+        parse.Pseudonymize(get_pseudo_first_names, ner_gating="always")
+
+
+def test_get_ner_gate_reason(get_instant):
+    gated = {
+        "12:30 - 14:00": "no_alpha",
+        "https://www.example.org": "no_content",
+        "alice@example.org": "no_content",
+        "[email] [email],": "redacted",
+        "merci pour votre message": "lowercase",
+        "Merci pour votre message.": "lowercase",
+        "> envoyé de mon téléphone": "lowercase",
+    }
+    for sentence, reason in gated.items():
+        assert get_instant.get_ner_gate_reason(sentence) == reason
+    for sentence in [
+        "Bonjour Marie,",
+        "Marie",
+        "écrivez à [email] ou à Paul",
+        "rendez-vous au MeetingPoint",
+    ]:
+        assert get_instant.get_ner_gate_reason(sentence) is None
+
+
+def test_evaluate_ner_gate(get_instant):
+    labelled = [
+        ("Bonjour Marie,", ["Marie"]),
+        ("Alice viendra demain.", ["Alice"]),
+        ("merci pour votre message", []),
+        ("[email]", []),
+    ]
+    result = get_instant.evaluate_ner_gate(labelled)
+    assert result["sentences"] == 4
+    assert result["entities"] == 2
+    assert result["gated_sentences"] == 3
+    assert result["missed_entities"] == 1
+    assert result["reasons"]["lowercase"] == {
+        "gated_sentences": 2,
+        "missed_entities": 1,
+    }
+    assert result["gated_share"] == 0.75
+    assert result["missed_share"] == 0.5
+    assert get_instant.evaluate_ner_gate([])["missed_share"] == 0.0
+
+
+def test_get_gated_ner(get_pseudo_first_names):
+    metrics.REGISTRY.reset()
+    calls = []
+    entity = {"entity_group": "LOC", "word": "Paris", "start": 0, "end": 5}
+    for mode in ["off", "on", "eval"]:
+        pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, ner_gating=mode)
+        pseudonymizer.get_ner = lambda sent, info=None: calls.append(sent) or [entity]
+        assert pseudonymizer._get_gated_ner("Bonjour Marie") == [entity]
+        expected = [] if mode == "on" else [entity]
+        assert pseudonymizer._get_gated_ner("à paris demain") == expected
+    # NER is skipped once, in the "on" mode
+    assert len(calls) == 5
+    labels = {"reason": "lowercase"}
+    assert metrics.REGISTRY.get("ner_gated_sentences", labels) == 2
+    assert metrics.REGISTRY.get("ner_gate_missed_entities", labels) == 1
+
+
+def test_get_ner_cache(get_pseudo_first_names, tmp_path):
+    metrics.REGISTRY.reset()
+    calls = []
+    entity = {"entity_group": "PER", "word": "Marie", "start": 8, "end": 13}
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+    pseudonymizer.ner_recognizer = lambda sent: calls.append(sent) or [dict(entity)]
+    pseudonymizer.set_ner_cache(LRUCache(10, name="ner"))
+    ner = pseudonymizer.get_ner("Bonjour Marie")
+    assert ner == [entity]
+    # changing the result does not change the cache
+    ner[0]["pseudonym"] = "Agathe"
+    assert pseudonymizer.get_ner("Bonjour Marie") == [entity]
+    assert calls == ["Bonjour Marie"]
+    assert metrics.REGISTRY.get("ner_calls") == 1
+    # the offsets depend on the whitespace
+    pseudonymizer.get_ner("Bonjour  Marie")
+    # other pipelines have their own entries
+    pseudonymizer.get_ner("Bonjour Marie", {"task": "ner", "model": "other"})
+    assert len(calls) == 3
+    # a cache shared between instances
+    other = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+    other.set_ner_cache(pseudonymizer.ner_cache)
+    assert other.get_ner("Bonjour Marie") == [entity]
+    assert len(calls) == 3
+
+
+def test_get_ner_cache_chunking(get_pseudo_first_names):
+    calls = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+    pseudonymizer.ner_recognizer = lambda sent: calls.append(sent) or []
+    pseudonymizer.set_ner_cache(LRUCache(10, name="ner"))
+    sentence = "Bonjour Marie, je viendrai demain à Paris avec Juan."
+    pseudonymizer.get_ner(sentence)
+    # the entities are detected again with other chunking settings
+    for max_tokens, stride in [(4, 1), (4, 2), (0, 0)]:
+        pseudonymizer.set_ner_chunking(max_tokens, stride)
+        pseudonymizer.get_ner(sentence)
+    assert calls.count(sentence) == 1
+    n_calls = len(calls)
+    assert n_calls > 4
+    pseudonymizer.set_ner_chunking(4, 1)
+    pseudonymizer.get_ner(sentence)
+    assert len(calls) == n_calls
+
+
+def test_pseudonymize_quote_cache(get_pseudo_first_names):
+    metrics.REGISTRY.reset()
+    parsed = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+
+    def get_sentences(text, language, model="default"):
+        parsed.append(text)
+        pseudonymizer.n_tokens = len(text.split())
+        return text.split("\n")
+
+    def recognize(sent):
+        start = sent.find("Marie")
+        if start < 0:
+            return []
+        return [
+            {"entity_group": "PER", "word": "Marie", "start": start, "end": start + 5}
+        ]
+
+    pseudonymizer.get_sentences = get_sentences
+    pseudonymizer.ner_recognizer = recognize
+    pseudonymizer.set_quote_cache(LRUCache(10, name="quotes"))
+    first = "Bonjour Marie\nÀ demain"
+    pseudo_first, _ = pseudonymizer.pseudonymize(first, "fr")
+    assert "Marie" not in pseudo_first
+    assert pseudonymizer.n_tokens == 4
+    reply = "Merci\nLe 3 mars, Paul a écrit :\n> Bonjour Marie\n> À demain"
+    pseudo_reply, _ = pseudonymizer.pseudonymize(reply, "fr")
+    # the quoted message is neither parsed nor recognized again
+    assert parsed == [first, "Merci", "Le 3 mars, Paul a écrit :"]
+    assert metrics.REGISTRY.get("quote_segments_reused") == 1
+    assert metrics.REGISTRY.get("ner_calls") == 4
+    assert pseudonymizer.sentences == [
+        "Merci",
+        "Le 3 mars, Paul a écrit :",
+        "Bonjour Marie",
+        "À demain",
+    ]
+    assert pseudonymizer.n_tokens == 12
+    # the pseudonyms are chosen for each email
+    assert [ne["word"] for ne in pseudonymizer.ne_list] == ["Marie"]
+    assert pseudonymizer.ne_sent == [2]
+    assert pseudo_reply.endswith(pseudo_first)
+
+
+def test_pseudonymize_quote_cache_ner_settings(get_pseudo_first_names):
+    parsed = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+
+    def get_sentences(text, language, model="default"):
+        parsed.append(text)
+        return text.split("\n")
+
+    pseudonymizer.get_sentences = get_sentences
+    pseudonymizer.ner_recognizer = lambda sent: []
+    pseudonymizer.set_quote_cache(LRUCache(10, name="quotes"))
+    text = "Bonjour Marie\nÀ demain"
+    pseudonymizer.pseudonymize(text, "fr")
+    # the segment is analysed again with other packing or chunking settings
+    pseudonymizer.set_ner_packing(100)
+    pseudonymizer.pseudonymize(text, "fr")
+    pseudonymizer.set_ner_chunking(4, 1)
+    pseudonymizer.pseudonymize(text, "fr")
+    assert parsed == [text] * 3
+    pseudonymizer.pseudonymize(text, "fr")
+    assert len(parsed) == 3
+
+
+def test_pseudonymize_boilerplate(get_pseudo_first_names):
+    parsed = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+
+    def get_sentences(text, language, model="default"):
+        parsed.append(text)
+        return text.split("\n")
+
+    pseudonymizer.get_sentences = get_sentences
+    pseudonymizer.ner_recognizer = lambda sent: []
+    pseudonymizer.set_quote_cache(LRUCache(10, name="quotes"))
+    index = BoilerplateIndex(n_lines=2, min_count=1)
+    signature = "Marie Dupont\nService RH"
+    index.add(signature)
+    pseudonymizer.set_boilerplate_index(index)
+    pseudonymizer.pseudonymize("Premier message\n" + signature, "fr")
+    pseudonymizer.pseudonymize("Second message\n" + signature, "fr")
+    # the signature is only parsed once
+    assert parsed == ["Premier message", signature, "Second message"]
+    assert pseudonymizer.sentences == ["Second message", "Marie Dupont", "Service RH"]
+
+
+def _find_names(text):
+    # recognizes the capitalised words, as a NER pipeline would
+    return [
+        {
+            "entity_group": "LOC" if match.group() == "Paris" else "PER",
+            "word": match.group(),
+            "start": match.start(),
+            "end": match.end(),
+            "score": 0.9,
+        }
+        for match in re.finditer(r"\b(Marie|Paris|Juan)\b", text)
+    ]
+
+
+def test_get_ner_packed(get_pseudo_first_names):
+    metrics.REGISTRY.reset()
+    calls = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+    pseudonymizer.ner_recognizer = lambda text: calls.append(text) or _find_names(text)
+    pseudonymizer.set_ner_packing(6)
+    sentences = [
+        "Bonjour Marie.",
+        "Je suis à Paris.",
+        "Sans nom ici.",
+        "Juan et Marie viennent demain à Paris avec nous.",
+    ]
+    packed = pseudonymizer.get_ner_packed(sentences)
+    # the windows are filled up to 6 words
+    assert calls == [
+        "Bonjour Marie. Je suis à Paris.",
+        "Sans nom ici.",
+        "Juan et Marie viennent demain à Paris avec nous.",
+    ]
+    assert metrics.REGISTRY.get("ner_calls") == 3
+    assert packed == [_find_names(sent) for sent in sentences]
+    # entities spanning the separator are cut at the end of the sentence
+    pseudonymizer.ner_recognizer = lambda text: [
+        {"entity_group": "PER", "word": "Marie. Je", "start": 8, "end": 17},
+        {"entity_group": "PER", "word": " ", "start": 14, "end": 15},
+    ]
+    assert pseudonymizer.get_ner_packed(sentences[:2]) == [
+        [{"entity_group": "PER", "word": "Marie.", "start": 8, "end": 14}],
+        [],
+    ]
+
+
+def test_get_ner_packed_cache(get_pseudo_first_names):
+    calls = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+    pseudonymizer.ner_recognizer = lambda text: calls.append(text) or _find_names(text)
+    pseudonymizer.set_ner_cache(LRUCache(10))
+    pseudonymizer.set_ner_packing(6)
+    sentences = ["Bonjour Marie.", "Je suis à Paris.", "Juan et Marie à Paris."]
+    pseudonymizer.get_ner_packed(sentences)
+    # only the sentence in a window of its own is cached
+    assert len(pseudonymizer.ner_cache) == 1
+    calls.clear()
+    pseudonymizer.set_ner_packing(0)
+    assert pseudonymizer.get_ner(sentences[2]) == _find_names(sentences[2])
+    assert pseudonymizer.get_ner(sentences[0]) == _find_names(sentences[0])
+    assert calls == ["Bonjour Marie."]
+
+
+def test_get_ner_chunking(get_pseudo_first_names):
+    metrics.REGISTRY.reset()
+    calls = []
+    pseudonymizer = parse.Pseudonymize(get_pseudo_first_names, TransformerLoader())
+    pseudonymizer.ner_recognizer = lambda text: calls.append(text) or _find_names(text)
+    with pytest.raises(ValueError):
+        pseudonymizer.set_ner_chunking(8, 8)
+    pseudonymizer.set_ner_chunking(8, 3)
+    sentence = " ".join(
+        ["Marie", "a", "vu", "Juan", "à", "Paris", "et", "puis", "Marie"] * 3
+    )
+    assert pseudonymizer.get_ner(sentence) == _find_names(sentence)
+    # 27 words in windows of 8 words, starting every 5 words
+    assert len(calls) == 5
+    assert all(len(call.split()) <= 8 for call in calls)
+    assert calls[1].startswith("Paris et puis")
+    assert metrics.REGISTRY.get("ner_calls") == 5
+    assert metrics.REGISTRY.get("ner_chunked_texts") == 1
+    # short sentences are passed as a whole
+    calls.clear()
+    assert pseudonymizer.get_ner("Bonjour Marie") == _find_names("Bonjour Marie")
+    assert calls == ["Bonjour Marie"]
+
+
+def test_pseudonymize_ner_packing(get_pseudo_first_names):
+    text = "Bonjour Marie.\nJe suis à Paris.\nÉcrire à marie@example.com.\n123"
+    results = []
+    for max_tokens in [0, 100]:
+        pseudonymizer = parse.Pseudonymize(
+            get_pseudo_first_names, TransformerLoader(), ner_gating="on"
+        )
+        pseudonymizer.get_sentences = lambda text, language, model: text.split("\n")
+        pseudonymizer.ner_recognizer = _find_names
+        pseudonymizer.set_ner_packing(max_tokens)
+        pseudo_text, _ = pseudonymizer.pseudonymize(text, "fr")
+        results.append((pseudo_text, pseudonymizer.ne_list, pseudonymizer.ne_sent))
+    assert results[0] == results[1]
+    assert results[0][2] == [0, 1]
+
+
+def test_pseudonymize_parallel(get_pseudo_first_names):
+    text = "\n".join(
+        "Message {} de {} à Paris.".format(i, ["Marie", "Juan"][i % 2])
+        for i in range(40)
+    )
+    results = []
+    with ThreadPoolExecutor(3) as executor:
+        for parallel in [False, True]:
+            metrics.REGISTRY.reset()
+            pseudonymizer = parse.Pseudonymize(
+                get_pseudo_first_names, TransformerLoader()
+            )
+            pseudonymizer.get_sentences = lambda text, language, model: text.split("\n")
+            pseudonymizer.ner_recognizer = _find_names
+            if parallel:
+                pseudonymizer.set_parallelism(executor, min_chars=100, n_groups=3)
+            pseudo_text, _ = pseudonymizer.pseudonymize(text, "fr")
+            results.append((pseudo_text, pseudonymizer.ne_list, pseudonymizer.ne_sent))
+    assert metrics.REGISTRY.get("ner_parallel_groups") == 3
+    assert metrics.REGISTRY.get("ner_calls") == 40
+    # the same pseudonyms in the same order
+    assert results[0] == results[1]
+    assert len(results[0][1]) == 80
+
+
+class CallTracker:
+    """Records the maximal number of concurrent calls."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            # release the GIL, as the model does
+            time.sleep(0.002)
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TrackedTokenizer:
+    """Real fast tokenizer, which records the concurrent calls of each copy."""
+
+    is_fast = True
+
+    def __init__(self, fast_tokenizer=None, copies=None):
+        if fast_tokenizer is None:
+            from tokenizers import Tokenizer
+            from tokenizers.models import WordLevel
+            from tokenizers.pre_tokenizers import Whitespace
+            from transformers import PreTrainedTokenizerFast
+
+            words = ["Bonjour", "Marie", "Juan", "Paris", "de", "à", "."]
+            vocab = {"[UNK]": 0, **{word: i + 1 for i, word in enumerate(words)}}
+            tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+            tokenizer.pre_tokenizer = Whitespace()
+            fast_tokenizer = PreTrainedTokenizerFast(
+                tokenizer_object=tokenizer, unk_token="[UNK]"
+            )
+        self.fast_tokenizer = fast_tokenizer
+        self.tracker = CallTracker()
+        # the tokenizer and its copies
+        self.copies = copies if copies is not None else []
+        self.copies.append(self)
+
+    def __deepcopy__(self, memo):
+        return TrackedTokenizer(copy.deepcopy(self.fast_tokenizer, memo), self.copies)
+
+    def tokenize(self, text):
+        with self.tracker.track():
+            return self.fast_tokenizer.tokenize(text)
+
+    def __call__(self, text, **kwargs):
+        with self.tracker.track():
+            return self.fast_tokenizer(text, **kwargs)
+
+
+class TrackedRecognizer:
+    """NER pipeline with a real fast tokenizer, which records the maximal
+    number of concurrent calls of the model."""
+
+    def __init__(self):
+        self.tokenizer = TrackedTokenizer()
+        # shared by the shallow copies of the pipeline, as the model weights
+        self.model = CallTracker()
+
+    def __call__(self, text):
+        # the pipeline truncates the texts
+        encoding = self.tokenizer(
+            text, truncation=True, max_length=64, return_offsets_mapping=True
+        )
+        with self.model.track():
+            return [
+                {
+                    "entity_group": "LOC" if text[start:end] == "Paris" else "PER",
+                    "word": text[start:end],
+                    "start": start,
+                    "end": end,
+                    "score": 0.9,
+                }
+                for start, end in encoding["offset_mapping"]
+                if text[start:end] in ("Marie", "Juan", "Paris")
+            ]
+
+
+def test_pseudonymize_parallel_tokenizer(get_pseudo_first_names):
+    text = "\n".join(
+        "Message {} de {} à Paris.".format(i, ["Marie", "Juan"][i % 2])
+        for i in range(40)
+    )
+    results = []
+    with ThreadPoolExecutor(4) as executor:
+        for parallel in [False, True]:
+            pseudonymizer = parse.Pseudonymize(
+                get_pseudo_first_names, TransformerLoader()
+            )
+            pseudonymizer.get_sentences = lambda text, language, model: text.split("\n")
+            recognizer = TrackedRecognizer()
+            pseudonymizer.ner_recognizer = recognizer
+            # the tokenizer is also used to pack and split the sentences
+            pseudonymizer.set_ner_packing(12)
+            pseudonymizer.set_ner_chunking(4, 1)
+            if parallel:
+                pseudonymizer.set_parallelism(executor, min_chars=100, n_groups=4)
+            pseudo_text, _ = pseudonymizer.pseudonymize(text, "fr")
+            results.append((pseudo_text, pseudonymizer.ne_list, pseudonymizer.ne_sent))
+            # each worker has its own tokenizer, which is never used
+            # concurrently, and the model runs concurrently
+            copies = recognizer.tokenizer.copies
+            assert len(copies) == (5 if parallel else 1)
+            assert all(tokenizer.tracker.max_active == 1 for tokenizer in copies)
+            assert (recognizer.model.max_active > 1) == parallel
+            # the copies are reused for the next texts
+            pseudonymizer.pseudonymize(text, "fr")
+            assert len(copies) == (5 if parallel else 1)
+    assert results[0] == results[1]
+    assert len(results[0][1]) == 80
+
+
 def test_pseudonymize_w_prev_ne_list(get_default_fr):
     text = {
         "content": "Claude et Camille sont amis. "
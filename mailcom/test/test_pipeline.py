@@ -0,0 +1,90 @@
+import pytest
+import threading
+import time
+from mailcom import pipeline
+
+
+def test_pipelined_executor_order():
+    written = []
+    executor = pipeline.PipelinedExecutor(lambda x: x * 2, written.append)
+    stats = executor.run(range(20))
+    assert written == [2 * i for i in range(20)]
+    assert stats["stages"]["read"]["items"] == 20
+    assert stats["stages"]["process"]["items"] == 20
+    assert stats["stages"]["write"]["items"] == 20
+    assert set(stats["queues"]) == {"read", "write"}
+    assert stats["bottleneck"] in ("read", "process", "write")
+
+
+def test_pipelined_executor_threads():
+    threads = {}
+
+    def read():
+        for i in range(3):
+            threads.setdefault("read", threading.current_thread())
+            yield i
+
+    def process(x):
+        threads.setdefault("process", threading.current_thread())
+        return x
+
+    def write(x):
+        threads.setdefault("write", threading.current_thread())
+
+    pipeline.PipelinedExecutor(process, write).run(read())
+    assert threads["process"] is threading.current_thread()
+    assert threads["read"] is not threading.current_thread()
+    assert threads["write"] is not threading.current_thread()
+
+
+def test_pipelined_executor_backpressure():
+    # slow writer, the queues must never hold more than queue_size items
+    def write(x):
+        time.sleep(0.005)
+
+    executor = pipeline.PipelinedExecutor(lambda x: x, write, queue_size=2)
+    stats = executor.run(range(30))
+    assert stats["queues"]["write"]["max_depth"] <= 2
+    assert stats["queues"]["read"]["max_depth"] <= 2
+    assert stats["queues"]["write"]["full_count"] > 0
+    assert stats["bottleneck"] == "write"
+    assert stats["stages"]["process"]["wait_output_time"] > 0
+
+
+def test_pipelined_executor_close():
+    written = []
+    executor = pipeline.PipelinedExecutor(
+        lambda x: x, written.append, close_fn=lambda: written.append("closed")
+    )
+    executor.run(range(3))
+    assert written == [0, 1, 2, "closed"]
+
+
+def test_pipelined_executor_errors():
+    def read():
+        yield 1
+        raise OSError("read error")
+
+    with pytest.raises(OSError):
+        pipeline.PipelinedExecutor(lambda x: x, lambda x: None).run(read())
+
+    def process(x):
+        if x == 5:
+            raise ValueError("process error")
+        return x
+
+    closed = []
+    with pytest.raises(ValueError):
+        pipeline.PipelinedExecutor(
+            process, lambda x: None, queue_size=1, close_fn=lambda: closed.append(1)
+        ).run(range(100))
+    assert closed == []
+
+    def write(x):
+        raise KeyError("write error")
+
+    with pytest.raises(KeyError):
+        pipeline.PipelinedExecutor(lambda x: x, write, queue_size=1).run(range(100))
+
+    with pytest.raises(ValueError):
+        pipeline.PipelinedExecutor(lambda x: x, lambda x: None, queue_size=0)
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import urllib.parse
+from mailcom import profiling
+from mailcom.inout import InoutHandler
+
+
+def busy_function():
+    total = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < 0.05:
+        total += sum(range(100))
+    return total
+
+
+def test_stack_sampler():
+    sampler = profiling.StackSampler(threading.get_ident(), interval=0.001)
+    sampler.sample()
+    assert sum(sampler.stacks.values()) == 1
+    sampler.start()
+    busy_function()
+    sampler.stop()
+    collapsed = sampler.collapsed()
+    lines = collapsed.splitlines()
+    assert len(lines) > 0
+    assert any("test_profiling.py:busy_function" in line for line in lines)
+    # format: frames separated by ; and the count at the end
+    stack, count = lines[-1].rsplit(" ", 1)
+    assert int(count) > 0
+    assert ";" in stack
+
+
+def test_run_profiler_run(tmp_path):
+    profiler = profiling.RunProfiler(tmp_path / "profiles", sample_interval=0.001)
+    with profiler.email(0):
+        pass
+    assert profiler.reports == []
+    with profiler.run():
+        busy_function()
+    assert len(profiler.reports) == 1
+    report = profiler.reports[0]
+    assert report["name"] == "run"
+    assert report["pstats"].is_file()
+    assert report["collapsed"].is_file()
+    assert "busy_function" in report["report"].read_text()
+    assert report["peak_memory"] > 0
+
+
+def test_run_profiler_every_n(tmp_path):
+    profiler = profiling.RunProfiler(tmp_path, every_n=2)
+    with profiler.run():
+        for idx in range(5):
+            with profiler.email(idx):
+                pass
+    assert [report["name"] for report in profiler.reports] == [
+        "email_0",
+        "email_2",
+        "email_4",
+    ]
+    assert len(list(tmp_path.glob("*.pstats"))) == 3
+
+
+def test_run_profiler_allocations(tmp_path):
+    profiler = profiling.RunProfiler(tmp_path)
+    inout_hl = InoutHandler()
+    with profiler.run():
+        inout_hl.email_list = [{"content": "test " * 1000} for _ in range(10)]
+        inout_hl.write_csv(tmp_path / "test.csv")
+    allocations = profiler.reports[0]["top_allocations"]
+    assert all(
+        any(
+            location.split(":")[0].endswith(name)
+            for name in profiling.DEFAULT_ALLOC_FILES
+        )
+        for location, _, _ in allocations
+    )
+    assert any("inout.py" in location for location, _, _ in allocations)
+
+
+def test_run_profiler_allocations_package_only(tmp_path):
+    profiler = profiling.RunProfiler(tmp_path, alloc_files=["parse.py"])
+    with profiler.run():
+        # allocated in urllib/parse.py, which is not a mailcom module
+        quoted = [urllib.parse.quote("é" * 1000 + str(i)) for i in range(100)]
+    assert len(quoted) == 100
+    allocations = profiler.reports[0]["top_allocations"]
+    assert all(
+        location.startswith(profiling.PACKAGE_DIR + os.sep)
+        for location, _, _ in allocations
+    )
@@ -2,6 +2,7 @@ import pytest
 from mailcom.time_detector import TimeDetector
 import datetime
 from mailcom.utils import SpacyLoader, get_spacy_instance
+from mailcom.timing import StageTimer
 
 
 @pytest.fixture()
@@ -81,6 +82,29 @@ def test_parse_time_strict(get_time_detector_strict):
         assert get_time_detector_strict.parse_time(date_str) is None
 
 
+@pytest.mark.datelib
+def test_parse_time_timer():
+    timer = StageTimer()
+    timer.set_context(0, "content")
+    time_detector = TimeDetector(spacy_loader=SpacyLoader(), timer=timer)
+    time_detector.parse_time("2025-03-10")
+    time_detector.parse_time("10 mars 2025")
+    assert timer.summary()["dateparser"]["calls"] == 2
+
+
+@pytest.mark.datelib
+def test_parse_time_languages():
+    time_detector = TimeDetector(spacy_loader=SpacyLoader(), languages=["fr", "es"])
+    assert time_detector.languages == ["fr", "es"]
+    assert time_detector.parse_time("17 avril 2024") == datetime.datetime(2024, 4, 17)
+    assert time_detector.parse_time("3 de mayo de 2023") == datetime.datetime(
+        2023, 5, 3
+    )
+    # German month names are not considered
+    assert time_detector.parse_time("17 Dezember 2024") is None
+    assert TimeDetector().languages is None
+
+
 @pytest.mark.datelib
 def test_search_dates_en(get_time_detector):
     extra_info_en = "The date in the email is: "
@@ -675,6 +699,18 @@ def test_get_date_time_fr(get_time_detector, get_date_samples):
         assert result[0] == sample_time
 
 
+def test_get_date_time_chunks():
+    text = "Réunion le 12 mars 2025 à Paris.\nRappel: la réunion du 14 avril 2025."
+    expected = TimeDetector(spacy_loader=SpacyLoader()).get_date_time(text, "fr")
+    chunked = TimeDetector(spacy_loader=SpacyLoader(), chunk_chars=40)
+    results = chunked.get_date_time(text, "fr")
+    assert [(r[0], r[2], r[3]) for r in results] == [
+        (r[0], r[2], r[3]) for r in expected
+    ]
+    for date_text, _, start, end in results:
+        assert text[start:end] == date_text
+
+
 @pytest.mark.pattern
 def test_get_date_time_fr_non_numbers(get_time_detector):
     # somehow "An" and "a" are detected as dates
@@ -0,0 +1,117 @@
+import pytest
+import threading
+import time
+from mailcom import timing
+
+
+def test_percentile():
+    assert timing.percentile([], 50) == 0.0
+    assert timing.percentile([3.0], 99) == 3.0
+    values = [float(i) for i in range(1, 101)]
+    assert timing.percentile(values, 0) == 1.0
+    assert timing.percentile(values, 100) == 100.0
+    assert timing.percentile(values, 50) == pytest.approx(50.5)
+    assert timing.percentile(values, 95) == pytest.approx(95.05)
+    # order does not matter
+    assert timing.percentile(list(reversed(values)), 50) == pytest.approx(50.5)
+
+
+def test_stage_timer_context():
+    timer = timing.StageTimer()
+    timer.set_context(0, "content")
+    with timer.time("ner"):
+        time.sleep(0.01)
+    with timer.time("ner"):
+        pass
+    timer.add("rendering", 0.5)
+    timer.set_context(0, "subject")
+    timer.add("rendering", 0.25)
+
+    content = timer.get_timings(0, "content")
+    assert content["ner"] >= 0.01
+    assert content["rendering"] == 0.5
+    assert timer.get_timings(0, "subject") == {"rendering": 0.25}
+    assert timer.get_timings(1, "content") == {}
+
+
+def test_stage_timer_threads():
+    timer = timing.StageTimer()
+    timer.set_context(0, "content")
+
+    def work():
+        for _ in range(1000):
+            timer.add("ner", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert timer.timings[(0, "content")]["ner"][1] == 4000
+
+
+def test_stage_timer_exception():
+    timer = timing.StageTimer()
+    timer.set_context(0, "content")
+    with pytest.raises(ValueError):
+        with timer.time("ner"):
+            raise ValueError("test")
+    assert "ner" in timer.get_timings(0, "content")
+
+
+def test_stage_timer_summary():
+    timer = timing.StageTimer()
+    for idx in range(10):
+        timer.set_context(idx, "content")
+        timer.add("custom", 1.0)
+        timer.add("ner", float(idx))
+        timer.add("ner", 0.0)
+        timer.add("clean_up", 0.1)
+    summary = timer.summary()
+    # known stages in processing order, others at the end
+    assert list(summary) == ["clean_up", "ner", "custom"]
+    assert summary["ner"]["count"] == 10
+    assert summary["ner"]["calls"] == 20
+    assert summary["ner"]["total"] == pytest.approx(45.0)
+    assert summary["ner"]["mean"] == pytest.approx(4.5)
+    assert summary["ner"]["p50"] == pytest.approx(4.5)
+    assert summary["ner"]["p99"] == pytest.approx(8.91)
+    assert summary["custom"]["p95"] == pytest.approx(1.0)
+
+    timer.reset()
+    assert timer.summary() == {}
+
+
+def test_stage_timer_pop_timings():
+    timer = timing.StageTimer(max_samples=5)
+    for idx in range(10):
+        timer.set_context(idx, "content")
+        timer.add("ner", float(idx))
+        timer.add("ner", 0.0)
+    expected = timer.summary()
+    assert timer.pop_timings(0, "content") == {"ner": 0.0}
+    assert timer.pop_timings(0, "content") == {}
+    assert timer.get_timings(0, "content") == {}
+    # the summary includes the popped and the remaining timings
+    assert timer.summary() == expected
+    for idx in range(1, 10):
+        assert timer.pop_timings(idx, "content") == {"ner": float(idx)}
+    assert timer.timings == {}
+    summary = timer.summary()
+    assert summary["ner"]["count"] == 10
+    assert summary["ner"]["calls"] == 20
+    assert summary["ner"]["total"] == pytest.approx(45.0)
+    # the percentiles are estimated from at most 5 sampled durations
+    assert len(timer._samples["ner"]) == 5
+    assert 0.0 <= summary["ner"]["p50"] <= 9.0
+    timer.reset()
+    assert timer.summary() == {}
+
+
+def test_timed():
+    with timing.timed(None, "ner"):
+        pass
+    timer = timing.StageTimer()
+    with timing.timed(timer, "ner"):
+        pass
+    assert "ner" in timer.get_timings(None, None)
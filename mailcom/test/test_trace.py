@@ -0,0 +1,27 @@
+import json
+from mailcom import trace
+
+
+def test_trace_writer(tmp_path):
+    path = tmp_path / "sub" / "trace.jsonl"
+    with trace.TraceWriter(path) as writer:
+        writer.write({"email_idx": 0, "total_seconds": 0.5, "fields": {}})
+        # flushed after each record
+        assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+        writer.write({"email_idx": 1, "file_name": "é.eml", "total_seconds": 2.0})
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])["file_name"] == "é.eml"
+    # closing twice is fine
+    writer.close()
+
+
+def test_read_trace_slowest(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    with trace.TraceWriter(path) as writer:
+        for idx, seconds in enumerate([0.1, 3.0, 0.5, 2.0]):
+            writer.write({"email_idx": idx, "total_seconds": seconds})
+    records = trace.read_trace(path)
+    assert [r["email_idx"] for r in records] == [0, 1, 2, 3]
+    slowest = trace.get_slowest(records, n=2)
+    assert [r["email_idx"] for r in slowest] == [1, 3]
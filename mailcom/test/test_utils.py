@@ -1,5 +1,6 @@
 from mailcom import utils
 import pytest
+import spacy as sp
 
 
 def test_check_dir(tmpdir):
@@ -37,6 +38,70 @@ def test_clean_up_content():
     )
 
 
+def test_split_quoted():
+    content = (
+        "Merci Marie, à demain.\nClaude\n"
+        "Le lun. 3 mars 2024 à 10:00, Marie <marie@example.fr> a écrit :\n"
+        "> Bonjour Claude,\n> On se voit demain ?\n>\n"
+        ">> El lunes, Juan escribió:\n>> Hola\n"
+        "De : Paul\nEnvoyé : lundi 2 mars\nÀ : Marie\nObjet : test\n"
+        "Texte de Paul.\nDe : rien"
+    )
+    assert utils.split_quoted(content) == [
+        "Merci Marie, à demain.\nClaude",
+        "Le lun. 3 mars 2024 à 10:00, Marie <marie@example.fr> a écrit :",
+        "Bonjour Claude,\nOn se voit demain ?",
+        "El lunes, Juan escribió:",
+        "Hola",
+        "De : Paul\nEnvoyé : lundi 2 mars\nÀ : Marie\nObjet : test",
+        "Texte de Paul.\nDe : rien",
+    ]
+    assert utils.split_quoted("Am Montag schrieb Anna <anna@example.de>:\nHallo") == [
+        "Am Montag schrieb Anna <anna@example.de>:",
+        "Hallo",
+    ]
+    assert utils.split_quoted("-----Original Message-----\nHi") == [
+        "-----Original Message-----",
+        "Hi",
+    ]
+    assert utils.split_quoted("Hello, how are you?") == ["Hello, how are you?"]
+    assert utils.split_quoted("") == []
+
+
+def test_get_text_chunks():
+    text = "Bonjour,\nune ligne.\nune ligne beaucoup plus longue que les autres"
+    chunks = utils.get_text_chunks(text, 20)
+    assert chunks == [
+        (0, "Bonjour,\nune ligne.\n"),
+        (20, "une ligne beaucoup "),
+        (39, "plus longue que les "),
+        (59, "autres"),
+    ]
+    assert all(text[offset:].startswith(chunk) for offset, chunk in chunks)
+    assert "".join(chunk for _, chunk in chunks) == text
+    assert utils.get_text_chunks("a" * 25, 10) == [
+        (0, "a" * 10),
+        (10, "a" * 10),
+        (20, "a" * 5),
+    ]
+    assert utils.get_text_chunks(text, 100) == [(0, text)]
+    assert utils.get_text_chunks("", 10) == [(0, "")]
+
+
+def test_parse_chunks():
+    nlp = sp.blank("fr")
+    nlp.add_pipe("sentencizer")
+    text = "Bonjour.\nÇa va?\nTrès bien."
+    docs = list(utils.parse_chunks(nlp, text))
+    assert [offset for offset, _ in docs] == [0]
+    docs = list(utils.parse_chunks(nlp, text, 10))
+    assert [offset for offset, _ in docs] == [0, 9, 16]
+    assert [doc.text for _, doc in docs] == ["Bonjour.\n", "Ça va?\n", "Très bien."]
+    # the max_length of the spaCy instance is a limit
+    nlp.max_length = 10
+    assert len(list(utils.parse_chunks(nlp, text, 100))) == 3
+
+
 @pytest.fixture()
 def get_spacy_loader():
     return utils.SpacyLoader()
@@ -96,6 +161,42 @@ def test_get_spacy_instance(get_spacy_loader):
         utils.get_spacy_instance(get_spacy_loader, "fr", "not_an_existing_spacy_model")
 
 
+def test_preload_spacy(get_spacy_loader):
+    get_spacy_loader.preload(["fr", "es"])
+    assert set(get_spacy_loader.spacy_instances) == {"fr", "es"}
+    assert get_spacy_loader.spacy_instances["es"]["es_core_news_md"] is not None
+
+
+def test_text_classifier():
+    classifier = utils.TextClassifier()
+    only = {
+        "...!?": "punctuations",
+        "12 34,5": "numbers",
+        "²": "numbers",
+        "alice@example.org bob@example.org": "emails",
+        "https://example.org/path http://www.example.org:8080": "links",
+    }
+    for text, kind in only.items():
+        result = classifier.classify(text)
+        assert result[kind] is True
+        assert not any(result[other] for other in result if other != kind)
+        assert classifier.has_content(text) is False
+
+    assert classifier.classify("") == {
+        "punctuations": True,
+        "numbers": False,
+        "emails": True,
+        "links": True,
+    }
+    assert classifier.has_content("") is False
+    assert classifier.has_content(" \n ") is False
+    assert classifier.has_content("Bonjour 12") is True
+    assert classifier.has_content("alice@example.org écrit") is True
+    # not a decimal digit, as in str.isdigit()
+    assert classifier.classify("½")["numbers"] is False
+    assert classifier.has_content("½") is True
+
+
 @pytest.fixture()
 def get_transformer_loader():
     return utils.TransformerLoader()
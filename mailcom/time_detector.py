@@ -3,16 +3,29 @@ from datetime import datetime
 import dateparser.search
 from spacy.matcher import Matcher
 from spacy.tokens import Token, Doc, Span
-from mailcom.utils import SpacyLoader, get_spacy_instance
+from mailcom.utils import SpacyLoader, get_spacy_instance, parse_chunks
+from mailcom.timing import StageTimer, timed
+from mailcom import metrics
 from typing import Any, Union
 
 
 class TimeDetector:
 
     def __init__(
-        self, strict_parsing: str = "non-strict", spacy_loader: SpacyLoader = None
+        self,
+        strict_parsing: str = "non-strict",
+        spacy_loader: SpacyLoader = None,
+        timer: StageTimer = None,
+        languages: list[str] = None,
+        chunk_chars: int = 0,
     ):
         self.spacy_loader = spacy_loader
+        # maximal length of the texts parsed by spaCy at once, see parse_chunks
+        self.chunk_chars = chunk_chars
+        # languages considered by dateparser, all if None
+        self.languages = list(languages) if languages else None
+        # optional timer recording the time spent in each stage
+        self.timer = timer
         # parse incomplete dates or not
         self.strict_parsing = strict_parsing
 
@@ -129,7 +142,11 @@ class TimeDetector:
             datetime: The datetime object of the time parsed.
         """
         strict = False if self.strict_parsing == "non-strict" else True
-        return dateparser.parse(text, settings={"STRICT_PARSING": strict})
+        metrics.inc("dateparser_calls")
+        with timed(self.timer, "dateparser"):
+            return dateparser.parse(
+                text, languages=self.languages, settings={"STRICT_PARSING": strict}
+            )
 
     def search_dates(
         self, text: str, langs: list[str] = ["es", "fr"]
@@ -226,9 +243,10 @@ class TimeDetector:
 
         multi_word_date_time = []
         marked_locations = []
-        matcher = Matcher(self.nlp_spacy.vocab)
-        matcher.add("DATE", self.patterns[self.strict_parsing])
-        matches = matcher(doc)
+        with timed(self.timer, "matcher"):
+            matcher = Matcher(self.nlp_spacy.vocab)
+            matcher.add("DATE", self.patterns[self.strict_parsing])
+            matches = matcher(doc)
         for _, start, end in matches:
             span = doc[start:end]
             parsed_time = self.parse_time(span.text)
@@ -546,10 +564,22 @@ class TimeDetector:
         if not hasattr(self, "nlp_spacy"):
             self.nlp_spacy = get_spacy_instance(self.spacy_loader, language, model)
 
-        doc = self.nlp_spacy(text)
-        extracted_date_time = self.extract_date_time(doc, language, model)
-        merged_date_time = self.merge_date_time(extracted_date_time, doc)
-
-        # only keep the date time phrases that contain numbers
-        results = self.filter_non_numbers(merged_date_time)
+        results = []
+        # long texts are parsed in chunks, with the offsets of the dates
+        # shifted to the whole text
+        chunks = parse_chunks(self.nlp_spacy, text, self.chunk_chars)
+        while True:
+            with timed(self.timer, "spacy_parse"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            offset, doc = chunk
+            extracted_date_time = self.extract_date_time(doc, language, model)
+            merged_date_time = self.merge_date_time(extracted_date_time, doc)
+
+            # only keep the date time phrases that contain numbers
+            for date_text, parsed, start, end in self.filter_non_numbers(
+                merged_date_time
+            ):
+                results.append((date_text, parsed, start + offset, end + offset))
         return results
@@ -0,0 +1,206 @@
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any
+
+# stages recorded by the workflow, in processing order
+STAGES = [
+    "clean_up",
+    "lang_detection",
+    "spacy_parse",
+    "matcher",
+    "dateparser",
+    "ner",
+    "rendering",
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Get the q-th percentile of a list of values using linear interpolation.
+
+    Args:
+        values (list[float]): The values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, 0.0 if the list is empty.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+class StageTimer:
+    """Record the wall time of the processing stages per email and field.
+
+    The current email and field are set by the workflow with set_context,
+    the components then record their stages with the time context manager.
+    The timings of a field are kept until they are taken with pop_timings,
+    after which only their aggregates are kept for the summary.
+
+    Args:
+        max_samples (int, optional): The maximal number of durations per stage
+            kept for the percentiles of the summary. Beyond it, the durations
+            are sampled uniformly. Defaults to 10000.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        # (email index, field) -> {stage: [seconds, calls]}
+        self.timings = {}
+        self.email_idx = None
+        self.field = None
+        self.max_samples = max_samples
+        # aggregates of the popped timings, stage -> [fields, calls, seconds]
+        self._totals = {}
+        # sampled durations per field of the popped timings, per stage
+        self._samples = {}
+        self._random = random.Random(0)
+        # stages can be timed in several threads
+        self._lock = threading.Lock()
+
+    def set_context(self, email_idx: int, field: str = None):
+        """Set the email and field that the following timings belong to.
+
+        Args:
+            email_idx (int): The index of the email in the processed data.
+            field (str, optional): The processed field of the email.
+                Defaults to None.
+        """
+        self.email_idx = email_idx
+        self.field = field
+
+    def add(self, stage: str, seconds: float):
+        """Add the duration of a stage to the current email and field.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): The duration in seconds.
+        """
+        with self._lock:
+            stages = self.timings.setdefault((self.email_idx, self.field), {})
+            record = stages.setdefault(stage, [0.0, 0])
+            record[0] += seconds
+            record[1] += 1
+
+    @contextmanager
+    def time(self, stage: str):
+        """Context manager recording the wall time of a stage.
+
+        Args:
+            stage (str): The name of the stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def get_timings(self, email_idx: int, field: str = None) -> dict[str, float]:
+        """Get the time spent in each stage for an email field.
+
+        Args:
+            email_idx (int): The index of the email.
+            field (str, optional): The field of the email. Defaults to None.
+
+        Returns:
+            dict[str, float]: The duration in seconds for each stage.
+        """
+        stages = self.timings.get((email_idx, field), {})
+        return {stage: record[0] for stage, record in stages.items()}
+
+    def pop_timings(self, email_idx: int, field: str = None) -> dict[str, float]:
+        """Get the time spent in each stage for an email field and drop
+        the timings of the field, keeping only their aggregates for summary.
+
+        Args:
+            email_idx (int): The index of the email.
+            field (str, optional): The field of the email. Defaults to None.
+
+        Returns:
+            dict[str, float]: The duration in seconds for each stage.
+        """
+        with self._lock:
+            stages = self.timings.pop((email_idx, field), {})
+            for stage, (seconds, n_calls) in stages.items():
+                totals = self._totals.setdefault(stage, [0, 0, 0.0])
+                totals[0] += 1
+                totals[1] += n_calls
+                totals[2] += seconds
+                # reservoir sampling of the durations
+                samples = self._samples.setdefault(stage, [])
+                if len(samples) < self.max_samples:
+                    samples.append(seconds)
+                else:
+                    idx = self._random.randrange(totals[0])
+                    if idx < self.max_samples:
+                        samples[idx] = seconds
+        return {stage: record[0] for stage, record in stages.items()}
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Aggregate the timings of each stage over all emails and fields.
+
+        Returns:
+            dict[str, dict[str, Any]]: For each stage the number of fields
+                ("count") and calls ("calls"), the total and mean time per field,
+                and the p50, p95 and p99 percentiles of the time per field,
+                estimated from a sample beyond max_samples fields.
+        """
+        with self._lock:
+            totals = {stage: list(record) for stage, record in self._totals.items()}
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+            # the timings which were not popped yet
+            for stages in self.timings.values():
+                for stage, (seconds, n_calls) in stages.items():
+                    record = totals.setdefault(stage, [0, 0, 0.0])
+                    record[0] += 1
+                    record[1] += n_calls
+                    record[2] += seconds
+                    samples.setdefault(stage, []).append(seconds)
+
+        # known stages first, in processing order
+        ordered = [s for s in STAGES if s in totals] + sorted(
+            s for s in totals if s not in STAGES
+        )
+        summary = {}
+        for stage in ordered:
+            count, calls, total = totals[stage]
+            values = samples[stage]
+            summary[stage] = {
+                "count": count,
+                "calls": calls,
+                "total": total,
+                "mean": total / count,
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+        return summary
+
+    def reset(self):
+        """Clear all recorded timings and their aggregates."""
+        with self._lock:
+            self.timings.clear()
+            self._totals.clear()
+            self._samples.clear()
+        self.email_idx = None
+        self.field = None
+
+
+def timed(timer: StageTimer, stage: str):
+    """Time a stage with the timer, or do nothing if no timer is given.
+
+    Args:
+        timer (StageTimer): The stage timer or None.
+        stage (str): The name of the stage.
+
+    Returns:
+        A context manager.
+    """
+    if timer is None:
+        return nullcontext()
+    return timer.time(stage)
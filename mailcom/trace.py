@@ -0,0 +1,63 @@
+import json
+from pathlib import Path
+from typing import Any
+
+
+class TraceWriter:
+    """Write one JSON record per processed email to a JSON Lines file.
+    Each record is flushed immediately, so that the trace is complete
+    up to the last processed email even if a run is interrupted.
+
+    Args:
+        path (str): The path of the trace file, overwritten if it exists.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def write(self, record: dict[str, Any]):
+        """Write a record as a single line.
+
+        Args:
+            record (dict[str, Any]): The record of an email.
+        """
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_trace(path: str) -> list[dict[str, Any]]:
+    """Read the records of a trace file.
+
+    Args:
+        path (str): The path of the trace file.
+
+    Returns:
+        list[dict[str, Any]]: The records, one per email.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_slowest(records: list[dict[str, Any]], n: int = 10) -> list[dict[str, Any]]:
+    """Get the records of the emails that took longest to process.
+
+    Args:
+        records (list[dict[str, Any]]): The records of a trace.
+        n (int, optional): The number of records. Defaults to 10.
+
+    Returns:
+        list[dict[str, Any]]: The n slowest records, slowest first.
+    """
+    return sorted(records, key=lambda r: r.get("total_seconds", 0), reverse=True)[:n]
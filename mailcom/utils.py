@@ -1,8 +1,10 @@
 import os
+import re
 from pathlib import Path
 import spacy as sp
 from transformers import pipeline
-from typing import Any
+from mailcom import metrics
+from typing import Any, Iterator
 
 
 def check_dir(path: Path) -> bool:
@@ -45,6 +47,200 @@ def clean_up_content(content: str) -> tuple[str, list[str]]:
     return updated_content, updated_sentences
 
 
+# lines introducing a quoted reply, e.g. "Le 3 mars 2024, Marie a écrit :"
+QUOTE_HEADER_REGEXES = [
+    re.compile(r"^Le .+ a écrit\s?:$"),
+    re.compile(r"^El .+ escribió\s?:$"),
+    re.compile(r"^Am .+ schrieb .+:$"),
+    re.compile(r"^On .+ wrote\s?:$"),
+    re.compile(
+        r"^-{2,}\s*(Original Message|Message d'origine|Mensaje original|"
+        r"Ursprüngliche Nachricht)\s*-{2,}$",
+        re.IGNORECASE,
+    ),
+]
+# fields of the headers Outlook adds above a quoted message
+OUTLOOK_FROM_REGEX = re.compile(r"^(From|De|Von)\s?:", re.IGNORECASE)
+OUTLOOK_FIELD_REGEX = re.compile(
+    r"^(From|De|Von|Sent|Envoyé|Enviado|Gesendet|Date|Fecha|Datum|To|À|Para|An|"
+    r"Cc|Subject|Objet|Asunto|Betreff)\s?:",
+    re.IGNORECASE,
+)
+
+
+def split_quoted(content: str) -> list[str]:
+    """Split the cleaned up content of an email into its own text and the
+    quoted replies. The content is split before and after each quote header
+    (e.g. "El lunes, Juan escribió:" or the "De : ... Objet : ..." lines of
+    Outlook) and where the depth of the ">" quote markers changes. The quote
+    markers are removed, so that a quoted message gives the same segments as
+    the email it quotes.
+
+    Args:
+        content (str): The cleaned up content, see clean_up_content.
+
+    Returns:
+        list[str]: The segments, with the lines of each segment
+            separated by newlines.
+    """
+    segments = []
+    segment = []
+    depth = 0
+    in_header = False
+
+    def close_segment():
+        if segment:
+            segments.append("\n".join(segment))
+            segment.clear()
+
+    lines = content.split("\n")
+    for i, line in enumerate(lines):
+        text = line.lstrip("> ")
+        if not text:
+            continue
+        line_depth = line[: len(line) - len(text)].count(">")
+        next_text = lines[i + 1].lstrip("> ") if i + 1 < len(lines) else ""
+        is_header = any(regex.match(text) for regex in QUOTE_HEADER_REGEXES)
+        is_field = in_header and OUTLOOK_FIELD_REGEX.match(text) is not None
+        if not is_field and OUTLOOK_FROM_REGEX.match(text):
+            # only a header if other fields follow
+            is_field = OUTLOOK_FIELD_REGEX.match(next_text) is not None
+        if is_header or (is_field and not in_header) or line_depth != depth:
+            close_segment()
+        elif in_header and not is_field:
+            close_segment()
+        segment.append(text)
+        if is_header:
+            close_segment()
+        depth = line_depth
+        in_header = is_field
+    close_segment()
+    return segments
+
+
+def get_text_chunks(text: str, max_chars: int) -> list[tuple[int, str]]:
+    """Split a text into chunks of at most max_chars characters at line
+    breaks. Lines longer than max_chars are split at the last whitespace
+    before the limit, or at the limit if there is none.
+
+    Args:
+        text (str): The text, e.g. the cleaned up content of an email.
+        max_chars (int): The maximal length of a chunk.
+
+    Returns:
+        list[tuple[int, str]]: The offset of each chunk in the text and the chunk.
+    """
+    chunks = []
+    start = 0
+    while len(text) - start > max_chars:
+        limit = start + max_chars
+        # keep the separator in the previous chunk
+        end = text.rfind("\n", start, limit) + 1
+        if end <= start:
+            end = max(text.rfind(" ", start, limit), text.rfind("\t", start, limit)) + 1
+        if end <= start:
+            end = limit
+        chunks.append((start, text[start:end]))
+        start = end
+    chunks.append((start, text[start:]))
+    return chunks
+
+
+def parse_chunks(nlp: sp.Language, text: str, max_chars: int = 0) -> Iterator:
+    """Parse a text with spaCy. Texts longer than max_chars characters, or
+    than the max_length of the spaCy instance, are split with get_text_chunks
+    and parsed as a stream, so that only one chunk is kept in memory at a time.
+
+    Args:
+        nlp (sp.Language): The spaCy instance.
+        text (str): The text.
+        max_chars (int, optional): The maximal length of a chunk. Defaults to 0,
+            in which case only texts longer than nlp.max_length are split.
+
+    Yields:
+        tuple[int, Doc]: The offset of each chunk in the text and its doc.
+    """
+    limit = min(max_chars, nlp.max_length) if max_chars else nlp.max_length
+    if len(text) <= limit:
+        yield 0, nlp(text)
+        return
+    chunks = get_text_chunks(text, limit)
+    metrics.inc("spacy_chunks", len(chunks))
+    offsets = [offset for offset, _ in chunks]
+    yield from zip(offsets, nlp.pipe(chunk for _, chunk in chunks))
+
+
+class TextClassifier:
+    """Classify texts that only contain punctuations, numbers, email addresses
+    or links. The regular expressions are compiled once, and the text is split
+    into words once for all checks.
+    """
+
+    # characters as in str.isalnum()
+    alnum_regex = re.compile(r"[^\W_]")
+    # alphanumeric characters which are not decimal digits
+    non_decimal_regex = re.compile(r"[^\W\d_]")
+    url_regex = re.compile(
+        r"^(https?|s?ftps?|scp)://"  # Match http, https, sftp, ftps, ftp, or scp
+        r"(([A-Za-z0-9-]+\.)+[A-Za-z]{2,})"  # Match domain name
+        r"(:\d+)?"  # Optional port number
+        r"(/.*)?$"  # Optional path
+    )
+
+    def _get_alnum_kind(self, text: str) -> tuple[bool, bool]:
+        # whether the text has alphanumeric characters, and only digits
+        if not self.alnum_regex.search(text):
+            return False, False
+        for match in self.non_decimal_regex.finditer(text):
+            # e.g. superscript digits are digits, but not decimals
+            if not match.group().isdigit():
+                return True, False
+        return True, True
+
+    def _get_words(self, text: str) -> list[str]:
+        return [word for word in text.strip().split(" ") if word.strip()]
+
+    def classify(self, text: str) -> dict[str, bool]:
+        """Check if a text only contains punctuations, numbers,
+        email addresses or links.
+
+        Args:
+            text (str): The text to check.
+
+        Returns:
+            dict[str, bool]: Whether the text only contains "punctuations",
+                "numbers", "emails" or "links". Empty texts only contain
+                punctuations, emails and links.
+        """
+        has_alnum, only_digits = self._get_alnum_kind(text)
+        words = self._get_words(text)
+        return {
+            "punctuations": not has_alnum,
+            "numbers": only_digits,
+            "emails": all("@" in word for word in words),
+            "links": all(self.url_regex.match(word) for word in words),
+        }
+
+    def has_content(self, text: str) -> bool:
+        """Check if a text contains more than punctuations, numbers,
+        email addresses or links. The checks stop at the first decision.
+
+        Args:
+            text (str): The text to check.
+
+        Returns:
+            bool: True if the text is not empty, and does not only contain
+                punctuations, numbers, email addresses or links.
+        """
+        has_alnum, only_digits = self._get_alnum_kind(text)
+        if not has_alnum or only_digits:
+            return False
+        words = self._get_words(text)
+        if all("@" in word for word in words):
+            return False
+        return not all(self.url_regex.match(word) for word in words)
+
+
 class SpacyLoader:
     def __init__(self):
         self.spacy_default_model = {
@@ -91,6 +287,17 @@ class SpacyLoader:
             except SystemExit:
                 raise SystemExit("Could not download {} from repo".format(model))
 
+    def preload(self, languages: list[str], model: str = "default"):
+        """Load the spacy instances of several languages upfront,
+        e.g. for the languages set in the workflow settings.
+
+        Args:
+            languages (list[str]): The languages of the spacy instances.
+            model (str): The model of the spacy instances, defaults to "default".
+        """
+        for language in languages:
+            get_spacy_instance(self, language, model)
+
 
 def get_spacy_instance(
     spacy_loader: SpacyLoader, language: str, model: str = "default"